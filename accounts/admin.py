@@ -10,6 +10,7 @@ from django.utils import timezone
 from django.utils.html import format_html, mark_safe
 
 from .models import Profile, FeatureBan, FEATURE_CHOICES, FEATURE_LABELS
+from .utils import profile_flags_key
 
 
 def _invalidate_ban_cache_for_profiles(profiles_qs):
@@ -18,6 +19,11 @@ def _invalidate_ban_cache_for_profiles(profiles_qs):
         cache.delete(f"bans:{uid}")
 
 
+def _invalidate_profile_flags(user_ids):
+    """Drop cached profile flags after a bulk update (QuerySet.update skips the post_save receiver)."""
+    cache.delete_many([profile_flags_key(uid) for uid in user_ids])
+
+
 # ─── Site branding ────────────────────────────────────────────────────────────
 
 admin.site.site_header = "Conversa Administration"
@@ -602,9 +608,10 @@ class ProfileAdmin(admin.ModelAdmin):
     @admin.action(description="✅ Grant premium access")
     def grant_premium(self, request, queryset):
         try:
-            updated = queryset.filter(is_premium=False).update(
-                is_premium=True, premium_granted_at=timezone.now()
-            )
+            targets = queryset.filter(is_premium=False)
+            user_ids = list(targets.values_list("user_id", flat=True))
+            updated = targets.update(is_premium=True, premium_granted_at=timezone.now())
+            _invalidate_profile_flags(user_ids)
             self.message_user(
                 request,
                 f"Granted premium to {updated} user(s).",
@@ -616,9 +623,10 @@ class ProfileAdmin(admin.ModelAdmin):
     @admin.action(description="🚫 Revoke premium access")
     def revoke_premium(self, request, queryset):
         try:
-            updated = queryset.filter(is_premium=True).update(
-                is_premium=False, premium_granted_at=None
-            )
+            targets = queryset.filter(is_premium=True)
+            user_ids = list(targets.values_list("user_id", flat=True))
+            updated = targets.update(is_premium=False, premium_granted_at=None)
+            _invalidate_profile_flags(user_ids)
             self.message_user(
                 request,
                 f"Revoked premium from {updated} user(s).",
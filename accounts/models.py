@@ -2,7 +2,8 @@
 
 from django.db import models
 from django.contrib.auth.models import User
-from django.db.models.signals import post_save
+from django.core.cache import cache
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
 
 
@@ -111,3 +112,10 @@ class FeatureBan(models.Model):
 def create_user_profile(sender, instance, created, **kwargs):
     if created:
         Profile.objects.get_or_create(user=instance)
+
+
+@receiver(post_save, sender=Profile)
+@receiver(post_delete, sender=Profile)
+def invalidate_profile_flags(sender, instance, **kwargs):
+    from .utils import profile_flags_key
+    cache.delete(profile_flags_key(instance.user_id))
@@ -6,6 +6,8 @@ from django.core.cache import cache
 from django.core.exceptions import ValidationError
 from django.http import JsonResponse
 
+from backend import ratelimit
+
 
 def _get_client_ip(request):
     """
@@ -27,11 +29,11 @@ def _get_client_ip(request):
 
 def rate_limit(key_prefix, limit, window):
     """
-    IP-based rate limiter using atomic cache operations.
-    limit = max requests allowed in `window` seconds.
+    IP-based rate limiter.
+    limit = max requests allowed in any sliding `window` seconds.
 
-    Uses cache.add() + cache.incr() which are atomic in all Django cache
-    backends (Redis, Memcached, DatabaseCache) — no race condition.
+    Backed by the shared sliding-window engine in backend/ratelimit.py
+    (two atomic counters per IP, whatever the limit).
 
     Skipped entirely when DEBUG=True so local testing with multiple users
     is not blocked by shared 127.0.0.1 IP.
@@ -42,23 +44,15 @@ def rate_limit(key_prefix, limit, window):
             if settings.DEBUG:
                 return view_func(request, *args, **kwargs)
 
-            ip        = _get_client_ip(request)
-            cache_key = f"rl:{key_prefix}:{ip}"
-
-            # cache.add is atomic — only sets if key is absent
-            cache.add(cache_key, 0, timeout=window)
-            try:
-                count = cache.incr(cache_key)
-            except ValueError:
-                # Key disappeared between add and incr (very rare) — reset it
-                cache.set(cache_key, 1, timeout=window)
-                count = 1
-
-            if count > limit:
-                return JsonResponse(
+            ip = _get_client_ip(request)
+            allowed, retry_after = ratelimit.hit(f"rl:{key_prefix}:{ip}", limit, window)
+            if not allowed:
+                response = JsonResponse(
                     {"error": "Too many requests. Please try again later."},
                     status=429,
                 )
+                response["Retry-After"] = str(int(retry_after))
+                return response
             return view_func(request, *args, **kwargs)
         return wrapper
     return decorator
@@ -92,6 +86,35 @@ def clear_failed_logins(identifier: str) -> None:
     cache.delete(f"login_fail:{identifier.lower()}")
 
 
+# ─── Cached profile flags ─────────────────────────────────────────────────────
+
+_PROFILE_FLAGS_TTL = 300   # seconds; Profile saves invalidate immediately
+
+
+def profile_flags_key(user_id) -> str:
+    return f"profile-flags:{user_id}"
+
+
+def get_profile_flags(user):
+    """
+    {"email_verified": bool, "is_premium": bool} for `user`, or None if the
+    user has no Profile. Served from the in-process cache tier
+    (backend/cache.py) so the per-request access checks cost no SQL;
+    the Profile post_save/post_delete receivers drop the entry.
+    """
+    key   = profile_flags_key(user.pk)
+    flags = cache.get(key)
+    if flags is None:
+        from .models import Profile
+        flags = (
+            Profile.objects.filter(user_id=user.pk)
+            .values("email_verified", "is_premium")
+            .first()
+        ) or {}   # {} caches "no profile" too
+        cache.add(key, flags, timeout=_PROFILE_FLAGS_TTL)
+    return flags or None
+
+
 # ─── Password validation ──────────────────────────────────────────────────────
 
 def validate_strong_password(password):
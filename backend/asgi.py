@@ -5,6 +5,11 @@ It exposes the ASGI callable as a module-level variable named ``application``.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
+
+Serving with ASGI lets the LLM endpoints run as native async views
+(chat/async_views.py) so one worker holds many in-flight provider calls:
+
+    ASYNC_LLM_VIEWS=true gunicorn backend.asgi:application -k uvicorn.workers.UvicornWorker
 """
 
 import os
@@ -0,0 +1,218 @@
+# backend/cache.py
+"""
+Two-tier Django cache backend.
+
+Keys starting with one of LOCAL_PREFIXES (read-mostly data such as ban lists
+and profile flags) are served from a bounded per-process LRU in front of the
+shared backend; everything else — throttle histories, rate-limit counters,
+login lockouts, locks — goes straight to the shared backend, exactly as before.
+
+Invalidation is versioned per prefix: set(), delete() and incr() of a
+local-tier key bump a generation counter in the shared backend and drop that
+prefix from the writing process's LRU. add() is treated as a cache fill (the
+value was just read from the database) and does not invalidate anything —
+populate local-tier keys with add(), change them with set() or delete(). Every other process compares generations at most
+once per SYNC_INTERVAL seconds (one get_many for all prefixes) and drops the
+prefixes that changed, so a ban applied in the admin is enforced everywhere
+within SYNC_INTERVAL seconds while normal requests never touch the shared
+backend for those keys. Local values are handed out as-is (not copied), so
+callers must treat them as read-only.
+
+    CACHES = {
+        "default": {
+            "BACKEND": "backend.cache.TieredCache",
+            "OPTIONS": {
+                "SHARED": "shared",                  # alias of the backing cache
+                "LOCAL_PREFIXES": ["bans:"],
+                "LOCAL_MAX_ENTRIES": 5000,
+                "LOCAL_TIMEOUT": 60,                 # seconds, upper bound per entry
+                "SYNC_INTERVAL": 1.0,                # seconds between generation checks
+            },
+        },
+        "shared": {"BACKEND": "django.core.cache.backends.db.DatabaseCache", ...},
+    }
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+_MISSING = object()
+
+
+class _LocalTier:
+    """Process-wide LRU shared by every thread's TieredCache instance
+    (django.core.cache.caches hands each thread its own backend object)."""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()   # (key, version) -> (value, expires_at, prefix)
+        self.generations = {}          # prefix -> last generation seen
+        self.next_sync = 0.0
+        self.lock = threading.Lock()
+
+    def get(self, full_key):
+        with self.lock:
+            entry = self.entries.get(full_key)
+            if entry is None:
+                return _MISSING
+            value, expires_at, _ = entry
+            if expires_at <= time.monotonic():
+                del self.entries[full_key]
+                return _MISSING
+            self.entries.move_to_end(full_key)
+            return value
+
+    def put(self, full_key, value, ttl: float, prefix: str, generation) -> None:
+        with self.lock:
+            # A write elsewhere bumped the prefix while we were reading the
+            # shared value — it may be stale, so don't keep it.
+            if self.generations.get(prefix) != generation:
+                return
+            self.entries[full_key] = (value, time.monotonic() + ttl, prefix)
+            self.entries.move_to_end(full_key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def drop_prefix(self, prefix: str, generation) -> None:
+        with self.lock:
+            self.generations[prefix] = generation
+            for full_key in [k for k, e in self.entries.items() if e[2] == prefix]:
+                del self.entries[full_key]
+
+    def clear(self) -> None:
+        with self.lock:
+            self.entries.clear()
+            self.generations.clear()
+            self.next_sync = 0.0
+
+
+_tiers: dict = {}
+_tiers_lock = threading.Lock()
+
+
+class TieredCache(BaseCache):
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get("OPTIONS", {})
+        self._shared_alias = options.get("SHARED", "shared")
+        self._prefixes = tuple(options.get("LOCAL_PREFIXES", ()))
+        self._local_timeout = float(options.get("LOCAL_TIMEOUT", 60))
+        self._sync_interval = float(options.get("SYNC_INTERVAL", 1.0))
+        with _tiers_lock:
+            self._tier = _tiers.setdefault(
+                location or "default",
+                _LocalTier(int(options.get("LOCAL_MAX_ENTRIES", 5000))),
+            )
+
+    @property
+    def shared(self) -> BaseCache:
+        return caches[self._shared_alias]
+
+    # ── Local-tier bookkeeping ──────────────────────────────────────────────
+
+    def _prefix_of(self, key):
+        if isinstance(key, str):
+            for prefix in self._prefixes:
+                if key.startswith(prefix):
+                    return prefix
+        return None
+
+    @staticmethod
+    def _generation_key(prefix: str) -> str:
+        return f"tiered-gen:{prefix}"
+
+    def _sync(self) -> None:
+        """Drop local prefixes whose shared generation moved (rate-limited)."""
+        tier = self._tier
+        now = time.monotonic()
+        if now < tier.next_sync:
+            return
+        tier.next_sync = now + self._sync_interval
+        current = self.shared.get_many([self._generation_key(p) for p in self._prefixes])
+        for prefix in self._prefixes:
+            generation = current.get(self._generation_key(prefix), 0)
+            if tier.generations.get(prefix, _MISSING) != generation:
+                tier.drop_prefix(prefix, generation)
+
+    def _bump(self, prefix: str) -> None:
+        key = self._generation_key(prefix)
+        try:
+            generation = self.shared.incr(key)
+        except ValueError:
+            self.shared.add(key, 0, timeout=None)
+            generation = self.shared.incr(key)
+        self._tier.drop_prefix(prefix, generation)
+
+    def _local_ttl(self, timeout) -> float:
+        timeout = self.get_backend_timeout(timeout)
+        if timeout is None:
+            return self._local_timeout
+        return max(0.0, min(self._local_timeout, timeout - time.time()))
+
+    # ── Cache API ───────────────────────────────────────────────────────────
+
+    def get(self, key, default=None, version=None):
+        prefix = self._prefix_of(key)
+        if prefix is None:
+            return self.shared.get(key, default, version=version)
+
+        self._sync()
+        full_key = (key, version)
+        value = self._tier.get(full_key)
+        if value is not _MISSING:
+            return value
+        generation = self._tier.generations.get(prefix, 0)
+        value = self.shared.get(key, _MISSING, version=version)
+        if value is _MISSING:
+            return default
+        self._tier.put(full_key, value, self._local_timeout, prefix, generation)
+        return value
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self.shared.set(key, value, timeout, version=version)
+        prefix = self._prefix_of(key)
+        if prefix is not None:
+            self._bump(prefix)
+            self._tier.put((key, version), value, self._local_ttl(timeout), prefix,
+                           self._tier.generations.get(prefix))
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        added = self.shared.add(key, value, timeout, version=version)
+        prefix = self._prefix_of(key)
+        if added and prefix is not None:
+            self._tier.put((key, version), value, self._local_ttl(timeout), prefix,
+                           self._tier.generations.get(prefix, 0))
+        return added
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        return self.shared.touch(key, timeout, version=version)
+
+    def delete(self, key, version=None):
+        deleted = self.shared.delete(key, version=version)
+        prefix = self._prefix_of(key)
+        if prefix is not None:
+            self._bump(prefix)
+        return deleted
+
+    def incr(self, key, delta=1, version=None):
+        value = self.shared.incr(key, delta, version=version)
+        prefix = self._prefix_of(key)
+        if prefix is not None:
+            self._bump(prefix)
+        return value
+
+    def has_key(self, key, version=None):
+        if self._prefix_of(key) is not None:
+            return self.get(key, _MISSING, version=version) is not _MISSING
+        return self.shared.has_key(key, version=version)
+
+    def clear(self):
+        self.shared.clear()
+        self._tier.clear()
+
+    def close(self, **kwargs):
+        self.shared.close(**kwargs)
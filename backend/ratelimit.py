@@ -0,0 +1,161 @@
+# backend/ratelimit.py
+"""
+Sliding-window-counter rate limiter shared by the DRF throttles
+(chat.views._LLM*Throttle) and the accounts.utils.rate_limit decorator.
+
+Each limiter key keeps two integers — the hit counts of the current and the
+previous fixed window — and estimates the sliding-window total as
+
+    previous * (1 - elapsed / window) + current
+
+so storage and work per request are O(1) no matter how large the limit is
+(DRF's SimpleRateThrottle stores and rewrites one timestamp per request).
+The counters are updated with add() + incr(), which are atomic on every
+Django cache backend, so concurrent workers never lose a hit.
+
+The store is the shared cache (settings.RATE_LIMIT_BACKEND = "cache",
+alias RATE_LIMIT_CACHE) or, for tests, an in-process LocalStore
+(RATE_LIMIT_BACKEND = "local").
+"""
+import math
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.throttling import BaseThrottle
+
+
+class LocalStore:
+    """In-memory stand-in for the cache API subset the limiter uses."""
+
+    def __init__(self):
+        self._data = {}   # key -> (value, expires_at)
+        self._lock = threading.Lock()
+
+    def _live(self, key, now):
+        entry = self._data.get(key)
+        if entry is None or entry[1] <= now:
+            self._data.pop(key, None)
+            return None
+        return entry
+
+    def add(self, key, value, timeout):
+        now = time.time()
+        with self._lock:
+            if self._live(key, now) is not None:
+                return False
+            self._data[key] = (value, now + timeout)
+            return True
+
+    def incr(self, key, delta=1):
+        with self._lock:
+            entry = self._live(key, time.time())
+            if entry is None:
+                raise ValueError(f"Key '{key}' not found")
+            self._data[key] = (entry[0] + delta, entry[1])
+            return entry[0] + delta
+
+    def decr(self, key, delta=1):
+        return self.incr(key, -delta)
+
+    def set(self, key, value, timeout):
+        with self._lock:
+            self._data[key] = (value, time.time() + timeout)
+
+    def get_many(self, keys):
+        now = time.time()
+        with self._lock:
+            return {k: e[0] for k in keys if (e := self._live(k, now)) is not None}
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+_local_store = LocalStore()
+
+
+def _store():
+    if getattr(settings, "RATE_LIMIT_BACKEND", "cache") == "local":
+        return _local_store
+    return caches[getattr(settings, "RATE_LIMIT_CACHE", "default")]
+
+
+def hit(key: str, limit: int, window: int, now: float = None) -> tuple[bool, float]:
+    """
+    Record one request against `key` and decide whether it is allowed.
+    Returns (allowed, retry_after_seconds). Rejected requests are not counted,
+    so a client that keeps retrying is not locked out for longer.
+    """
+    store = _store()
+    now = time.time() if now is None else now
+    index = int(now // window)
+    current_key = f"{key}:{index}"
+    previous_key = f"{key}:{index - 1}"
+
+    # Counters live for two windows: one as "current", one as "previous"
+    store.add(current_key, 0, 2 * window)
+    try:
+        current = store.incr(current_key)
+    except ValueError:   # expired between add and incr
+        store.set(current_key, 1, 2 * window)
+        current = 1
+    previous = store.get_many([previous_key]).get(previous_key, 0)
+
+    elapsed = now - index * window
+    previous_weight = previous * (1 - elapsed / window)
+    if previous_weight + current <= limit:
+        return True, 0.0
+
+    try:
+        store.decr(current_key)
+    except ValueError:
+        pass
+    return False, _retry_after(previous, current - 1, elapsed, limit, window)
+
+
+def _retry_after(previous: int, current: int, elapsed: float, limit: int, window: int) -> float:
+    """Seconds until one more request would fit under the limit."""
+    excess = previous * (1 - elapsed / window) + current + 1 - limit
+    if previous and excess <= previous * (1 - elapsed / window):
+        # The previous window's share decays at previous/window per second
+        return math.ceil(excess * window / previous)
+    # Wait for the next window, where today's hits become the decaying share
+    remaining = window - elapsed
+    if current + 1 <= limit:
+        return math.ceil(remaining)
+    return math.ceil(remaining + (current + 1 - limit) * window / max(current, 1))
+
+
+def parse_rate(rate: str) -> tuple[int, int]:
+    """'60/hour' -> (60, 3600). Same format as DRF's DEFAULT_THROTTLE_RATES."""
+    num, period = rate.split("/")
+    return int(num), {"s": 1, "m": 60, "h": 3600, "d": 86400}[period[0]]
+
+
+class SlidingWindowThrottle(BaseThrottle):
+    """
+    Drop-in replacement for DRF's UserRateThrottle backed by hit().
+    Rates come from REST_FRAMEWORK["DEFAULT_THROTTLE_RATES"][scope].
+    """
+    scope = None
+
+    def __init__(self):
+        from rest_framework.settings import api_settings
+        self.limit, self.window = parse_rate(api_settings.DEFAULT_THROTTLE_RATES[self.scope])
+        self._retry_after = None
+
+    def get_cache_key(self, request, view):
+        if request.user and request.user.is_authenticated:
+            ident = request.user.pk
+        else:
+            ident = self.get_ident(request)
+        return f"throttle:{self.scope}:{ident}"
+
+    def allow_request(self, request, view):
+        allowed, self._retry_after = hit(self.get_cache_key(request, view), self.limit, self.window)
+        return allowed
+
+    def wait(self):
+        return self._retry_after
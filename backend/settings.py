@@ -1,4 +1,5 @@
 import os
+import sys
 from pathlib import Path
 from dotenv import load_dotenv
 import dj_database_url
@@ -18,6 +19,8 @@ SECRET_KEY = os.environ["DJANGO_SECRET_KEY"]
 
 DEBUG = os.getenv("DEBUG", "false").lower() == "true"
 
+TESTING = len(sys.argv) > 1 and sys.argv[1] == "test"
+
 
 ALLOWED_HOSTS = [
     "localhost",
@@ -153,13 +156,42 @@ else:
 # without any extra services. Shared across all workers — rate limiting and
 # login lockouts are global, not per-process.
 # Run once after deploy: python manage.py createcachetable
+#
+# "default" layers a per-process LRU over it for read-mostly keys (ban lists,
+# profile flags) so they cost no SQL on each chat request; counters and
+# throttle histories still go straight to the shared table. See backend/cache.py.
 CACHES = {
     "default": {
+        "BACKEND": "backend.cache.TieredCache",
+        "OPTIONS": {
+            "SHARED": "shared",
+            "LOCAL_PREFIXES": ["bans:", "profile-flags:"],
+            "LOCAL_MAX_ENTRIES": 5000,
+            "LOCAL_TIMEOUT": 60,
+            "SYNC_INTERVAL": 1.0,
+        },
+    },
+    "shared": {
         "BACKEND": "django.core.cache.backends.db.DatabaseCache",
         "LOCATION": "cache_table",
-    }
+    },
 }
 
+# -------------------------
+# LLM usage accounting
+# -------------------------
+# ModelUsage rows are queued and bulk-written off the request thread (see
+# chat/usage_sink.py). Tests write synchronously so assertions see the rows.
+USAGE_BUFFERED = os.getenv("USAGE_BUFFERED", "true").lower() == "true" and not TESTING
+
+# -------------------------
+# Rate limiting
+# -------------------------
+# Sliding-window counters for the DRF throttles and accounts.utils.rate_limit
+# (see backend/ratelimit.py). Counters are never in the local cache tier.
+RATE_LIMIT_BACKEND = "local" if TESTING else "cache"
+RATE_LIMIT_CACHE = "default"
+
 # -------------------------
 # Default primary key
 # -------------------------
@@ -196,6 +228,7 @@ CSRF_TRUSTED_ORIGINS = [
 
 from corsheaders.defaults import default_headers
 CORS_ALLOW_HEADERS = list(default_headers) + ["Idempotency-Key", "X-CSRFToken", "X-Razorpay-Signature"]
+CORS_EXPOSE_HEADERS = ["Retry-After", "X-Retry-Count"]
 
 # -------------------------
 # Logging
@@ -219,7 +252,7 @@ REST_FRAMEWORK = {
     "DEFAULT_PERMISSION_CLASSES": [
         "rest_framework.permissions.IsAuthenticated",
     ],
-    # Per-user throttle scopes for LLM endpoints (uses Django cache backend).
+    # Per-user throttle scopes for LLM endpoints (backend/ratelimit.py).
     # Limits are per authenticated user, not per IP.
     "DEFAULT_THROTTLE_CLASSES": [],  # no global throttle — applied per-view only
     "DEFAULT_THROTTLE_RATES": {
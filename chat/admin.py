@@ -1,8 +1,7 @@
 from django.contrib import admin
-from django.db.models import Count
 from django.utils.html import format_html
 
-from .models import ChatSession, Message
+from .models import ChatSession, Message, refresh_session_stats
 
 
 # ─── Shared style maps ────────────────────────────────────────────────────────
@@ -117,9 +116,9 @@ class SessionStatusFilter(admin.SimpleListFilter):
 
     def queryset(self, _request, queryset):
         if self.value() == "active":
-            return queryset.annotate(_c=Count("messages")).filter(_c__gt=0)
+            return queryset.filter(message_count__gt=0)
         if self.value() == "empty":
-            return queryset.annotate(_c=Count("messages")).filter(_c=0)
+            return queryset.filter(message_count=0)
         return queryset
 
 
@@ -129,12 +128,14 @@ class SessionStatusFilter(admin.SimpleListFilter):
 class ChatSessionAdmin(admin.ModelAdmin):
     list_display  = (
         "title_col", "username_col", "mode_col",
-        "message_count_col", "created_at", "updated_at",
+        "message_count_col", "last_message_at", "created_at",
     )
     list_filter      = (ChatModeFilter, SessionStatusFilter)
     search_fields    = ("session_id", "title", "user__username", "user__email")
-    ordering         = ("-updated_at",)
-    readonly_fields  = ("session_id", "created_at", "updated_at")
+    ordering         = ("-last_message_at",)
+    readonly_fields  = (
+        "session_id", "created_at", "updated_at", "last_message_at", "message_count",
+    )
     list_select_related = ("user",)
     list_per_page    = 30
     date_hierarchy   = "created_at"
@@ -144,16 +145,11 @@ class ChatSessionAdmin(admin.ModelAdmin):
             "fields": ("session_id", "title", "mode", "user"),
         }),
         ("Timestamps", {
-            "fields": ("created_at", "updated_at"),
+            "fields": ("created_at", "updated_at", "last_message_at", "message_count"),
             "classes": ("collapse",),
         }),
     )
 
-    def get_queryset(self, request):
-        return super().get_queryset(request).annotate(
-            _message_count=Count("messages")
-        )
-
     def title_col(self, obj):
         title = obj.title or "Untitled"
         return format_html(
@@ -179,14 +175,14 @@ class ChatSessionAdmin(admin.ModelAdmin):
     mode_col.admin_order_field = "mode"
 
     def message_count_col(self, obj):
-        count  = obj._message_count
+        count  = obj.message_count
         colour = "#16a34a" if count > 0 else "#9ca3af"
         return format_html(
             '<span style="color:{};">{} msg{}</span>',
             colour, count, "s" if count != 1 else "",
         )
     message_count_col.short_description = "Messages"
-    message_count_col.admin_order_field = "_message_count"
+    message_count_col.admin_order_field = "message_count"
 
 
 # ─── Message admin ────────────────────────────────────────────────────────────
@@ -242,6 +238,16 @@ class MessageAdmin(admin.ModelAdmin):
     def has_change_permission(self, request, obj=None):
         return False
 
+    # Message deletes don't touch the session counters (see chat/models.py)
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        refresh_session_stats([obj.session_id])
+
+    def delete_queryset(self, request, queryset):
+        session_ids = list(queryset.order_by().values_list("session_id", flat=True).distinct())
+        super().delete_queryset(request, queryset)
+        refresh_session_stats(session_ids)
+
     # ── Columns ───────────────────────────────────────────────────────────────
 
     def username_col(self, obj):
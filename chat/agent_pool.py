@@ -0,0 +1,245 @@
+# chat/agent_pool.py
+"""
+Process-wide executor for the multi-debug specialist agents.
+
+Every agent job is tagged with the provider it is built for (the first step
+of its failover chain) and admitted against that provider's limits:
+
+    PROVIDER_CONCURRENCY   jobs running against one provider at a time
+    PROVIDER_QUEUE         jobs allowed to wait for a free slot; beyond
+                           that submit_all() raises Saturated, which the
+                           views turn into a 503 before any work is done
+
+Waiting jobs sit in a per-provider queue, not in the thread pool, so a slow
+provider cannot occupy every worker thread and stall the others. POOL_WORKERS
+bounds the thread count for the whole process regardless of how many
+requests are in flight.
+
+The async views (chat/async_views.py) admit their coroutine agents through
+asubmit_all() into the same lanes: they run on the event loop rather than in
+the thread pool, but count against PROVIDER_CONCURRENCY / PROVIDER_QUEUE
+exactly like thread jobs, and a queued one waits on an asyncio future, not
+in a thread.
+
+Two latencies are recorded in chat/metrics.py per provider:
+
+    agent.queue_wait.<provider>   submit() until the job starts running
+    agent.run.<provider>          the job itself (provider latency plus failover)
+
+A job that fails over still counts against its primary provider's slot.
+"""
+import asyncio
+import concurrent.futures
+import os
+import threading
+import time
+from collections import deque
+
+from . import metrics
+
+POOL_WORKERS = int(os.getenv("AGENT_POOL_WORKERS", 16))
+PROVIDER_CONCURRENCY = int(os.getenv("AGENT_PROVIDER_CONCURRENCY", 4))
+PROVIDER_QUEUE = int(os.getenv("AGENT_PROVIDER_QUEUE", 8))
+DEFAULT_RETRY_AFTER = 10   # seconds, until agent.run latencies are known
+
+_executor = concurrent.futures.ThreadPoolExecutor(max_workers=POOL_WORKERS, thread_name_prefix="agent")
+
+
+class Saturated(Exception):
+    """A provider's running slots and wait queue are both full."""
+
+    def __init__(self, provider: str, retry_after: float):
+        self.provider = provider
+        self.retry_after = retry_after
+        super().__init__(f"Agent queue for {provider} is full")
+
+
+class _Lane:
+    """Running count and wait queue for one provider."""
+
+    def __init__(self):
+        self.running = 0
+        self.waiting = deque()   # (start, submitted_at); start(submitted_at) launches the job
+
+
+_lanes: dict = {}
+_lock = threading.Lock()
+
+
+def _lane(provider: str) -> _Lane:
+    lane = _lanes.get(provider)
+    if lane is None:
+        lane = _lanes[provider] = _Lane()
+    return lane
+
+
+def _free(lane: _Lane) -> int:
+    return PROVIDER_CONCURRENCY - lane.running + PROVIDER_QUEUE - len(lane.waiting)
+
+
+def _retry_after(provider: str) -> float:
+    observed = metrics.percentile(f"agent.run.{provider}", 50, min_samples=5)
+    return DEFAULT_RETRY_AFTER if observed is None else observed
+
+
+def _needed(providers) -> dict:
+    needed = {}
+    for provider in providers:
+        needed[provider] = needed.get(provider, 0) + 1
+    return needed
+
+
+def _refuse_if_full(needed: dict) -> None:
+    # caller holds _lock
+    for provider, n in needed.items():
+        if _free(_lane(provider)) < n:
+            metrics.incr(f"agent.rejected.{provider}")
+            raise Saturated(provider, _retry_after(provider))
+
+
+def check(providers) -> None:
+    """Raise Saturated if submitting one job per entry of `providers` would be refused right now."""
+    with _lock:
+        _refuse_if_full(_needed(providers))
+
+
+def submit_all(jobs: dict) -> dict:
+    """
+    Admit {key: (provider, fn, args)} all-or-nothing and return
+    {future: key}. Raises Saturated without submitting anything when any
+    provider is full.
+    """
+    futures, start = {}, []
+    now = time.monotonic()
+    with _lock:
+        _refuse_if_full(_needed(provider for provider, _, _ in jobs.values()))
+        for key, (provider, fn, args) in jobs.items():
+            future = concurrent.futures.Future()
+            futures[future] = key
+            job = _thread_job(provider, future, fn, args)
+            lane = _lane(provider)
+            if lane.running < PROVIDER_CONCURRENCY:
+                lane.running += 1
+                start.append(job)
+            else:
+                lane.waiting.append((job, now))
+    for job in start:
+        job(now)
+    return futures
+
+
+def asubmit_all(jobs: dict) -> dict:
+    """
+    Async counterpart of submit_all() for {key: (provider, coroutine_fn, args)};
+    must be called on the event loop. Returns {key: asyncio.Task}. Raises
+    Saturated without starting anything when any provider is full.
+    Cancelling a task gives its slot (or its place in the queue) back.
+    """
+    loop = asyncio.get_running_loop()
+    now = time.monotonic()
+    admitted = {}
+    with _lock:
+        _refuse_if_full(_needed(provider for provider, _, _ in jobs.values()))
+        for key, (provider, fn, args) in jobs.items():
+            slot = loop.create_future()
+            lane = _lane(provider)
+            if lane.running < PROVIDER_CONCURRENCY:
+                lane.running += 1
+                slot.set_result(None)
+            else:
+                lane.waiting.append((_async_grant(provider, loop, slot), now))
+            admitted[key] = (provider, slot, fn, args)
+    tasks = {}
+    for key, (provider, slot, fn, args) in admitted.items():
+        task = tasks[key] = loop.create_task(_arun(slot, provider, fn, args, now))
+        task.add_done_callback(_async_done(provider, slot))
+    return tasks
+
+
+def _thread_job(provider: str, future, fn, args):
+    return lambda submitted_at: _executor.submit(_run, provider, future, fn, args, submitted_at)
+
+
+def _async_grant(provider: str, loop, slot):
+    """Queue entry that hands a freed slot to a waiting asyncio task (from any thread)."""
+    def grant():
+        if slot.done():   # the task was cancelled while queued — pass the slot on
+            _release(provider)
+        else:
+            slot.set_result(None)
+
+    def start(submitted_at):
+        try:
+            loop.call_soon_threadsafe(grant)
+        except RuntimeError:   # event loop closed
+            _release(provider)
+    return start
+
+
+def _run(provider: str, future, fn, args, submitted_at: float) -> None:
+    started = time.monotonic()
+    metrics.observe(f"agent.queue_wait.{provider}", started - submitted_at)
+    try:
+        if future.set_running_or_notify_cancel():
+            try:
+                future.set_result(fn(*args))
+            except Exception as exc:
+                future.set_exception(exc)
+            metrics.observe(f"agent.run.{provider}", time.monotonic() - started)
+    finally:
+        _release(provider)
+
+
+async def _arun(slot, provider: str, fn, args, submitted_at: float):
+    await slot
+    started = time.monotonic()
+    metrics.observe(f"agent.queue_wait.{provider}", started - submitted_at)
+    try:
+        return await fn(*args)
+    finally:
+        metrics.observe(f"agent.run.{provider}", time.monotonic() - started)
+
+
+def _async_done(provider: str, slot):
+    """
+    Task callback that settles its slot however the task ended — finished,
+    failed, or cancelled before or after it started.
+    """
+    def done(task):
+        if slot.done() and not slot.cancelled():   # held a slot
+            _release(provider)
+        else:
+            slot.cancel()   # still queued — its grant() passes the slot on
+    return done
+
+
+def _release(provider: str) -> None:
+    """Free one running slot of `provider`, or hand it straight to the next queued job."""
+    with _lock:
+        lane = _lane(provider)
+        nxt = lane.waiting.popleft() if lane.waiting else None
+        if nxt is None:
+            lane.running -= 1
+    if nxt is not None:
+        start, submitted_at = nxt
+        start(submitted_at)
+
+
+def stats() -> dict:
+    """{provider: {running, waiting, limit, queue_limit}} for this worker."""
+    with _lock:
+        lanes = {p: (lane.running, len(lane.waiting)) for p, lane in sorted(_lanes.items())}
+    return {
+        provider: {
+            "running": running,
+            "waiting": waiting,
+            "limit": PROVIDER_CONCURRENCY,
+            "queue_limit": PROVIDER_QUEUE,
+        }
+        for provider, (running, waiting) in lanes.items()
+    }
+
+
+def reset() -> None:
+    with _lock:
+        _lanes.clear()
@@ -0,0 +1,579 @@
+"""
+Native async (ASGI) versions of the LLM endpoints.
+
+When the project is served by an ASGI server and ASYNC_LLM_VIEWS=true,
+chat/urls.py routes /api/chat/, /api/ocr-qa/, /api/gemini-with-images/ and
+/api/multi-debug/ here instead of to the DRF views in chat/views.py.
+
+Validation, session handling and persistence are the exact same helpers the
+DRF views use (_prepare_chat_turn, _save_ocr_answer, ...), run through
+sync_to_async. Only the provider calls are awaited on the event loop, so a
+worker holds hundreds of in-flight LLM calls instead of one per thread.
+"""
+import asyncio
+import functools
+import json
+import logging
+import math
+import os
+import time
+
+from asgiref.sync import sync_to_async
+from django.http import JsonResponse
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework.response import Response
+
+from . import agent_pool, failover, hedging, llm_cache, metrics, retries, single_flight
+from .clients import get_client
+from .context import estimate_tokens, message_tokens
+from .providers import genai, openai
+from .views import (
+    ANTHROPIC_API_KEY, GEMINI_FILE_MODEL, GEMINI_TEXT_MODEL,
+    MISTRAL_API_KEY, MISTRAL_BASE_URL, OPENAI_API_KEY,
+    _CHAT_CHAINS, _DUPLICATE_IN_PROGRESS, _LOGIC_ANALYST_PROMPT, _NEW_CHAT_TITLE,
+    _PERF_SECURITY_PROMPT, _PROVIDER_TIMEOUT, _SERVER_ERROR, _SYNTAX_INSPECTOR_PROMPT, _SYNTHESIZER_PROMPT,
+    _UNCENSORED_PARAMS, _OPENROUTER_BASE_URL, _LLMChatThrottle, _LLMDebugThrottle, _LLMOcrThrottle,
+    _agent_cache_hits, _agent_cache_keys, _agent_chain, _agent_model_map, _agents_saturated, _anthropic_result,
+    _check_agent_capacity, _check_email_verified, _check_feature_ban, _completion_result, _debug_tier,
+    _finish_debug_turn, _gemini_contents, _gemini_result, _mark_gemini_fallback, _normalize_agent_result, _ocr_cache_key,
+    _parse_chunk, _prepare_chat_turn, _prepare_debug_turn, _prepare_image_turn, _prepare_ocr_question,
+    _prepare_synthesis, _providers_unavailable, _record_usage, _retry_plan, _save_chat_turn,
+    _save_image_turn, _save_ocr_answer, _split_system, _synth_model_for,
+    _synthesis_cache_key, _synthesis_fallback, _synthesis_input, _upload_images, _with_retry_count,
+)
+
+logger = logging.getLogger(__name__)
+
+_AGENT_TIMEOUT = 120  # seconds — same budget as the thread-pool path
+
+
+# ================================
+# Async provider clients (shared pools from chat.clients)
+# ================================
+
+def _mistral_async_client():
+    return get_client("mistral", MISTRAL_API_KEY, MISTRAL_BASE_URL, is_async=True)
+
+
+def _uncensored_async_client():
+    api_key = os.getenv("OPENROUTER_API_KEY")
+    if not api_key:
+        raise RuntimeError("OPENROUTER_API_KEY missing at runtime")
+    return get_client(
+        "openrouter",
+        api_key,
+        _OPENROUTER_BASE_URL,
+        is_async=True,
+        max_retries=0,
+        headers={
+            "Referer": os.getenv("FRONTEND_URL", "http://localhost:3000"),
+            "X-Title": "AI Chatbox",
+        },
+    )
+
+
+def _openai_async_client():
+    return get_client("openai", OPENAI_API_KEY, is_async=True)
+
+
+def _anthropic_async_client():
+    return get_client("anthropic", ANTHROPIC_API_KEY, is_async=True)
+
+
+def _openai_compatible_async_client(provider: str):
+    if provider == "mistral":
+        return _mistral_async_client()
+    if provider == "openrouter":
+        return _uncensored_async_client()
+    if provider == "openai":
+        return _openai_async_client()
+    raise ValueError(f"Unknown provider: {provider}")
+
+
+async def _acomplete(provider: str, model: str, messages: list[dict], max_tokens: int = None) -> tuple:
+    """Async counterpart of views._complete — (text, input_tokens, output_tokens); raises on failure."""
+    if provider == "gemini":
+        system, contents = _gemini_contents(messages)
+        m = genai.GenerativeModel(model, system_instruction=system)
+        resp = await m.generate_content_async(
+            contents,
+            generation_config={"max_output_tokens": max_tokens} if max_tokens else None,
+            request_options={"timeout": _PROVIDER_TIMEOUT},
+        )
+        return _gemini_result(resp)
+
+    if provider == "anthropic":
+        system, rest = _split_system(messages)
+        extra = {"system": system} if system else {}
+        msg = await _anthropic_async_client().messages.create(
+            model=model,
+            max_tokens=max_tokens or 4096,
+            messages=rest,
+            timeout=_PROVIDER_TIMEOUT,
+            **extra,
+        )
+        return _anthropic_result(msg)
+
+    extra = {"max_tokens": max_tokens} if max_tokens else {}
+    r = await _openai_compatible_async_client(provider).chat.completions.create(
+        model=model,
+        messages=messages,
+        timeout=_PROVIDER_TIMEOUT,
+        **extra,
+    )
+    return _completion_result(r)
+
+
+async def _arun_chain(chain, system_prompt: str, content: str, max_tokens: int) -> tuple:
+    """Async counterpart of views._run_chain — (text, input_tokens, output_tokens, served_model)."""
+    messages = [
+        {"role": "system", "content": system_prompt},
+        {"role": "user",   "content": content},
+    ]
+    result, _, model = await failover.arun(
+        chain, lambda provider, m: _acomplete(provider, m, messages, max_tokens),
+    )
+    return (*result, model)
+
+
+# ================================
+# Request plumbing
+# ================================
+
+class _AsyncRequest:
+    """
+    Minimal stand-in for a DRF Request so the shared sync helpers can be
+    reused unchanged — they only read .data, .user and .FILES.
+    """
+
+    def __init__(self, request, user, data):
+        self.user = user
+        self.data = data
+        self.FILES = request.FILES
+        self.META = request.META
+
+
+def _as_json(resp: Response) -> JsonResponse:
+    """Convert an (unrendered) DRF Response from a shared helper to a JsonResponse."""
+    out = JsonResponse(resp.data, status=resp.status_code, safe=False)
+    for header in ("Retry-After", "X-Retry-Count"):
+        if resp.has_header(header):
+            out[header] = resp[header]
+    return out
+
+
+def _parse_body(request):
+    """Return (data, None) or (None, JsonResponse) — JSON bodies and form posts."""
+    if (request.content_type or "").startswith("application/json"):
+        try:
+            return json.loads(request.body or b"{}"), None
+        except ValueError as exc:
+            return None, JsonResponse({"detail": f"JSON parse error - {exc}"}, status=400)
+    return request.POST, None
+
+
+def _async_llm_view(throttle_class):
+    """
+    Wrap an async handler with the checks DRF performs for the sync views:
+    POST only, session authentication (CSRF-exempt, like
+    CsrfExemptSessionAuthentication), body parsing and the per-user throttle.
+    Unexpected errors become the usual 500 payload.
+    """
+    def decorator(handler):
+        @csrf_exempt
+        @functools.wraps(handler)
+        async def view(request):
+            if request.method != "POST":
+                return JsonResponse({"detail": f'Method "{request.method}" not allowed.'}, status=405)
+
+            user = await request.auser()
+            if not user.is_authenticated:
+                return JsonResponse({"detail": "Authentication credentials were not provided."}, status=403)
+
+            data, error = _parse_body(request)
+            if error:
+                return error
+            shim = _AsyncRequest(request, user, data)
+
+            throttle = throttle_class()
+            if not await sync_to_async(throttle.allow_request)(shim, None):
+                wait = math.ceil(throttle.wait() or 0)
+                resp = JsonResponse(
+                    {"detail": f"Request was throttled. Expected available in {wait} seconds."},
+                    status=429,
+                )
+                resp["Retry-After"] = str(wait)
+                return resp
+
+            try:
+                return await handler(shim)
+            except Exception:
+                logger.exception("Async %s unexpected error", handler.__name__)
+                return JsonResponse({"error": _SERVER_ERROR}, status=500)
+        return view
+    return decorator
+
+
+async def _check_access(user, feature, tier=None):
+    """Async wrapper for the email-verified + feature-ban guards. Returns a JsonResponse or None."""
+    ev = await sync_to_async(_check_email_verified)(user)
+    if ev:
+        return _as_json(ev)
+    ban = await sync_to_async(_check_feature_ban)(user, feature, tier)
+    if ban:
+        return _as_json(ban)
+    return None
+
+
+async def _awith_retries(call_fn, max_attempts: int = 2, base_delay: int = 2, provider: str = "default"):
+    """
+    Async counterpart of views._with_retries: awaits call_fn() and retries
+    transient upstream errors with the same policy, returning
+    (result, retries_made). Waits use asyncio.sleep so the event loop keeps
+    serving other requests, which is why provider-demanded waits of up to
+    retries.MAX_DELAY are taken here rather than handed back to the client.
+    """
+    retries.budget(provider).record_request()
+    attempt = 0
+    while True:
+        try:
+            return await call_fn(), attempt
+        except (openai.APIStatusError, failover.UpstreamError) as e:
+            if e.status_code is None:
+                logger.exception("LLM client error in _awith_retries")
+                return Response({"error": _SERVER_ERROR}, status=502), attempt
+            delay, failure = _retry_plan(e, attempt, max_attempts, base_delay,
+                                         provider=provider, max_delay=retries.MAX_DELAY)
+            if failure is not None:
+                return failure, attempt
+            await asyncio.sleep(delay)
+            attempt += 1
+        except openai.APIError:
+            logger.exception("LLM client error in _awith_retries")
+            return Response({"error": _SERVER_ERROR}, status=502), attempt
+        except failover.NoHealthyProvider as e:
+            return _providers_unavailable(e), attempt
+
+
+# ================================
+# Chat
+# ================================
+
+async def _achat_reply(mode: str, messages: list[dict]) -> tuple:
+    """Async counterpart of views._chat_reply — (reply_text, input_tokens, output_tokens, model)."""
+    async def attempt(provider, model):
+        if provider == "openrouter":
+            r = await _uncensored_async_client().chat.completions.create(
+                model=model,
+                messages=messages,
+                **_UNCENSORED_PARAMS,
+            )
+            return (*_completion_result(r), model)
+        if provider == "mistral":
+            if hedging.enabled():
+                return await _ahedged_chat_reply(mode, provider, model, messages)
+            r = await _mistral_async_client().chat.completions.create(
+                model=model,
+                messages=messages,
+            )
+            return (*_completion_result(r), model)
+        return (*await _acomplete(provider, model, messages), model)
+
+    started = time.monotonic()
+    result, _, _ = await failover.arun(_CHAT_CHAINS[mode], attempt)
+    metrics.observe("chat.reply", time.monotonic() - started)
+    return result
+
+
+async def _astreamed_reply(provider: str, model: str, messages: list[dict], attempt) -> tuple:
+    """Async counterpart of views._streamed_reply — (reply_text, input_tokens, output_tokens, model)."""
+    if provider == "gemini":
+        # No async stream adapter for Gemini — the completion is its first token
+        result = await _acomplete(provider, model, messages)
+        attempt.token()
+        return (*result, model)
+
+    extra = {"stream_options": {"include_usage": True}} if provider in ("openai", "openrouter") else {}
+    if provider == "openrouter":
+        extra.update(_UNCENSORED_PARAMS)
+    stream = await _openai_compatible_async_client(provider).chat.completions.create(
+        model=model,
+        messages=messages,
+        stream=True,
+        **extra,
+    )
+    parts, usage = [], None
+    try:
+        async for chunk in stream:
+            texts, chunk_usage = _parse_chunk(chunk)
+            usage = chunk_usage or usage
+            if texts:
+                attempt.token()
+                parts.extend(texts)
+    finally:
+        await stream.close()
+    text = "".join(parts).strip()
+    if usage is None:
+        usage = (sum(message_tokens(model, m) for m in messages), estimate_tokens(model, text))
+    return (text, *usage, model)
+
+
+async def _ahedged_chat_reply(mode: str, provider: str, model: str, messages: list[dict]) -> tuple:
+    hedge_provider, hedge_model = hedging.hedge_target(_CHAT_CHAINS[mode], provider, model)
+    result, _ = await hedging.arun(
+        lambda attempt: _astreamed_reply(provider, model, messages, attempt),
+        lambda attempt: _astreamed_reply(hedge_provider, hedge_model, messages, attempt),
+        provider, hedge_provider,
+    )
+    return result
+
+
+@_async_llm_view(_LLMChatThrottle)
+async def chat(request):
+    """Async POST /api/chat/ — same contract as views.ChatView."""
+    turn, error = await sync_to_async(_prepare_chat_turn)(request)
+    if error:
+        return _as_json(error)
+    session_id = turn["session_id"]
+    title = turn["session"].title or _NEW_CHAT_TITLE
+
+    result, retry_count = await _awith_retries(
+        lambda: _achat_reply(turn["mode"], turn["messages"]),
+        max_attempts=2,
+        base_delay=2,
+        provider=_CHAT_CHAINS[turn["mode"]][0][0],
+    )
+    if isinstance(result, Response):
+        if result.status_code == 429:
+            result.data["session_id"] = session_id
+            result.data["title"] = title
+        return _as_json(_with_retry_count(result, retry_count))
+
+    reply, in_tok, out_tok, model = result
+    await sync_to_async(_record_usage)(
+        request.user, model, in_tok, out_tok, mode=turn["mode"],
+    )
+    user_msg_obj = await sync_to_async(_save_chat_turn)(turn, reply)
+
+    return _with_retry_count(JsonResponse({
+        "reply": reply,
+        "msg_id": user_msg_obj.id,
+        "session_id": session_id,
+        "title": title,
+    }), retry_count)
+
+
+# ================================
+# OCR Q&A and image analysis
+# ================================
+
+@_async_llm_view(_LLMOcrThrottle)
+async def ocr_qa(request):
+    """Async POST /api/ocr-qa/ — same contract as views.OcrQaView."""
+    denied = await _check_access(request.user, "ocr")
+    if denied:
+        return denied
+
+    qa, error = await sync_to_async(_prepare_ocr_question)(request)
+    if error:
+        return _as_json(error)
+
+    cache_key = _ocr_cache_key(qa)
+    hit = llm_cache.lookup(cache_key) if cache_key else None
+    if hit:
+        payload = await sync_to_async(_save_ocr_answer)(request.user, qa, hit, cached=True)
+        return JsonResponse(payload)
+
+    model = genai.GenerativeModel(GEMINI_TEXT_MODEL)
+    result = _gemini_result(await model.generate_content_async(qa["prompt"]))
+    if cache_key:
+        llm_cache.store(cache_key, result)
+    payload = await sync_to_async(_save_ocr_answer)(request.user, qa, result)
+    return JsonResponse(payload)
+
+
+@_async_llm_view(_LLMOcrThrottle)
+async def gemini_with_images(request):
+    """Async POST /api/gemini-with-images/ — same contract as views.GeminiWithImagesView."""
+    denied = await _check_access(request.user, "ocr")
+    if denied:
+        return denied
+
+    turn, error = await sync_to_async(_prepare_image_turn)(request)
+    if error:
+        return _as_json(error)
+
+    # Cloudinary and genai.upload_file have no async API — _upload_images
+    # fans the uploads out on its own pool; wait for it off the event loop.
+    try:
+        saved_attachments, uploads_for_gemini = await asyncio.to_thread(_upload_images, turn["images"])
+    except ValueError as exc:
+        return JsonResponse({"error": str(exc)}, status=400)
+
+    gemini_model = genai.GenerativeModel(GEMINI_FILE_MODEL)
+    response = await gemini_model.generate_content_async([turn["message"], *uploads_for_gemini])
+    payload = await sync_to_async(_save_image_turn)(request.user, turn, saved_attachments, response)
+    return JsonResponse(payload)
+
+
+# ================================
+# Multi-Debugger
+# ================================
+
+async def _aagent(tier: str, role: str, system_prompt: str, message: str, label: str) -> tuple:
+    """Run one specialist through its failover chain. Never raises."""
+    chain = _agent_chain(tier, role)
+    try:
+        result = await _arun_chain(chain, system_prompt, message, 2048)
+    except Exception as e:
+        logger.exception("Async multi-debug %s failed", label)
+        return f"[{label} unavailable: {str(e)[:300]}]", 0, 0, chain[0][1]
+    if tier == "free" and role == "perf_security_auditor":
+        return _mark_gemini_fallback(result)
+    return result
+
+
+def _async_agent_jobs(tier: str, message: str) -> dict:
+    """{agent_name: (coroutine_fn, args)} for the three specialists of a tier."""
+    return {
+        "logic_analyst":         (_aagent, (tier, "logic_analyst", _LOGIC_ANALYST_PROMPT, message, "Logic Analyst")),
+        "syntax_inspector":      (_aagent, (tier, "syntax_inspector", _SYNTAX_INSPECTOR_PROMPT, message,
+                                            "Syntax Inspector")),
+        "perf_security_auditor": (_aagent, (tier, "perf_security_auditor", _PERF_SECURITY_PROMPT, message,
+                                            "Perf & Security Auditor")),
+    }
+
+
+async def _arun_agents_parallel(tier: str, message: str) -> tuple:
+    """
+    Async counterpart of views._run_agents_parallel — same return shape.
+    The agents are admitted through chat/agent_pool.py like the thread-based
+    ones, so they share the per-provider limits; raises agent_pool.Saturated
+    when a provider is full.
+    """
+    model_map = _agent_model_map(tier)
+    cache_keys = _agent_cache_keys(tier, message)
+    results, usage = _agent_cache_hits(model_map, cache_keys)
+    jobs = {name: job for name, job in _async_agent_jobs(tier, message).items() if name not in results}
+    tasks = agent_pool.asubmit_all({
+        name: (_agent_chain(tier, name)[0][0], fn, args) for name, (fn, args) in jobs.items()
+    })
+    try:
+        outcomes = await asyncio.gather(
+            *(asyncio.wait_for(task, timeout=_AGENT_TIMEOUT) for task in tasks.values()),
+            return_exceptions=True,
+        )
+    finally:
+        for task in tasks.values():   # only still pending if the request itself was cancelled
+            task.cancel()
+
+    for name, raw in zip(tasks, outcomes):
+        label = name.replace('_', ' ').title()
+        if isinstance(raw, TimeoutError):
+            results[name] = f"[{label} timed out after {_AGENT_TIMEOUT} s]"
+            usage[name] = (model_map[name], 0, 0, False)
+        elif isinstance(raw, Exception):
+            results[name] = f"[{label} failed: {str(raw)[:200]}]"
+            usage[name] = (model_map[name], 0, 0, False)
+        else:
+            text, in_tok, out_tok, model = _normalize_agent_result(raw, model_map[name])
+            results[name] = text
+            usage[name] = (model, in_tok, out_tok, False)
+            if name in cache_keys:
+                llm_cache.store(cache_keys[name], (text, in_tok, out_tok))
+    return results, usage
+
+
+async def _asynthesize(tier: str, message: str, agent_results: dict) -> tuple:
+    """Async counterpart of views._synthesize — same 5-tuple return."""
+    final, early = _prepare_synthesis(agent_results)
+    if early:
+        return (*early, False, _synth_model_for(tier))
+
+    cache_key = _synthesis_cache_key(tier, message, final)
+    hit = llm_cache.lookup(cache_key) if cache_key else None
+    if hit:
+        return (*hit, True, _synth_model_for(tier))
+
+    text, in_tok, out_tok, model = await _asynthesis_call(tier, message, final)
+    if cache_key:
+        llm_cache.store(cache_key, (text, in_tok, out_tok))
+    return text, in_tok, out_tok, False, model
+
+
+async def _asynthesis_call(tier: str, message: str, final: dict) -> tuple:
+    logic, syntax, perf = final["logic_analyst"], final["syntax_inspector"], final["perf_security_auditor"]
+    chain = _agent_chain(tier, "synthesizer")
+    try:
+        return await _arun_chain(chain, _SYNTHESIZER_PROMPT, _synthesis_input(message, logic, syntax, perf), 4096)
+    except Exception as e:
+        logger.exception("Async multi-debug Agent 4 (Synthesizer) failed")
+        return (_synthesis_fallback(f"[Synthesizer error: {str(e)[:300]}]", logic, syntax, perf),
+                0, 0, chain[0][1])
+
+
+async def _acoalesced(request, scope: str, run):
+    """Async counterpart of views._coalesced — `run` returns a JsonResponse."""
+    key, ttl = await sync_to_async(single_flight.flight_key)(scope, request)
+    for _ in range(2):
+        leader, replay = await sync_to_async(single_flight.begin)(key)
+        if leader:
+            break
+        if replay is None:
+            state, replay = await _await_leader(key)
+            if state == "gone":
+                continue
+            if state == "stale":
+                return await run()
+        response = JsonResponse(replay["data"], status=replay["status"])
+        response["Idempotent-Replayed"] = "true"
+        return response
+    if not leader:
+        return JsonResponse({"error": _DUPLICATE_IN_PROGRESS}, status=409)
+
+    try:
+        response = await run()
+    except Exception:
+        await sync_to_async(single_flight.finish)(key, ttl)
+        raise
+    data = json.loads(response.content) if response.status_code == 200 else None
+    await sync_to_async(single_flight.finish)(key, ttl, data)
+    return response
+
+
+async def _await_leader(key: str) -> tuple:
+    """single_flight.wait without blocking the event loop."""
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + single_flight.STALE_AFTER
+    for delay in single_flight.backoff():
+        state, result = await sync_to_async(single_flight.poll)(key)
+        if state != "running":
+            return state, result
+        if loop.time() >= deadline:
+            return "stale", None
+        await asyncio.sleep(delay)
+
+
+@_async_llm_view(_LLMDebugThrottle)
+async def multi_debug(request):
+    """Async POST /api/multi-debug/ — same contract as views.MultiDebugView."""
+    return await _acoalesced(request, "multi-debug", lambda: _multi_debug(request))
+
+
+async def _multi_debug(request):
+    busy = _check_agent_capacity(_debug_tier(request))
+    if busy:
+        return _as_json(busy)
+    turn, error = await sync_to_async(_prepare_debug_turn)(request)
+    if error:
+        return _as_json(error)
+
+    try:
+        agent_results, agent_usage = await _arun_agents_parallel(turn["tier"], turn["user_message"])
+    except agent_pool.Saturated as e:   # filled up since the check above
+        return _as_json(_agents_saturated(e))
+    synth = await _asynthesize(turn["tier"], turn["user_message"], agent_results)
+    payload = await sync_to_async(_finish_debug_turn)(
+        request.user, turn, agent_results, agent_usage, synth,
+    )
+    return JsonResponse(payload)
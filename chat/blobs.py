@@ -0,0 +1,62 @@
+# chat/blobs.py
+"""
+Content-addressed record of uploaded files (ContentBlob, keyed by SHA-256).
+
+Uploading the same bytes again — the same screenshot attached twice, the
+same PDF dropped into a new OCR session — reuses what the first upload
+produced instead of repeating it:
+
+    cloudinary_url   _upload_images skips cloudinary.uploader.upload
+    gemini_uri       ... and genai.upload_file, while the Gemini file has
+                     more than GEMINI_EXPIRY_MARGIN left before it expires
+    extracted_text   OcrUploadView skips the extraction call (when it was
+                     made with the current GEMINI_FILE_MODEL)
+
+Entries are filled in field by field as the views do the work, so a blob
+first seen as an image can later gain its OCR text and vice versa.
+"""
+import hashlib
+from datetime import timedelta
+
+from django.utils import timezone
+
+from .models import ContentBlob
+
+GEMINI_EXPIRY_MARGIN = timedelta(hours=1)
+
+
+def digest(chunks) -> str:
+    """SHA-256 hex digest of an iterable of byte chunks."""
+    h = hashlib.sha256()
+    for chunk in chunks:
+        h.update(chunk)
+    return h.hexdigest()
+
+
+def get(sha256: str):
+    return ContentBlob.objects.filter(sha256=sha256).first()
+
+
+def record(sha256: str, size: int, **fields) -> None:
+    ContentBlob.objects.update_or_create(sha256=sha256, defaults={"size": size, **fields})
+
+
+def gemini_part(blob):
+    """A generate_content part referencing the blob's Gemini file, or None if it is missing or about to expire."""
+    if not blob or not blob.gemini_uri or not blob.gemini_expires_at:
+        return None
+    if blob.gemini_expires_at <= timezone.now() + GEMINI_EXPIRY_MARGIN:
+        return None
+    return {"file_data": {"file_uri": blob.gemini_uri, "mime_type": blob.gemini_mime_type}}
+
+
+def gemini_fields(handle) -> dict:
+    """ContentBlob fields for a file returned by genai.upload_file."""
+    expires = getattr(handle, "expiration_time", None)
+    if not getattr(handle, "uri", None) or not expires:
+        return {}
+    return {
+        "gemini_uri": handle.uri,
+        "gemini_mime_type": getattr(handle, "mime_type", "") or "",
+        "gemini_expires_at": expires,
+    }
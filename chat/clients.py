@@ -0,0 +1,96 @@
+# chat/clients.py
+"""
+Process-wide registry of pooled LLM provider clients.
+
+Every OpenAI-compatible (Mistral, OpenRouter, OpenAI) and Anthropic client
+used by chat/views.py and chat/async_views.py comes from get_client(), so
+each (provider, base URL, credentials) combination is built once per worker
+and its HTTP keep-alive pool is reused across requests. The multi-debugger
+agents in particular used to construct a fresh SDK client — and pay a new
+TLS handshake — on every call.
+
+Gemini is not covered here: google.generativeai manages one gRPC channel per
+process after genai.configure(), which chat.providers runs on first use.
+"""
+import hashlib
+import threading
+
+import httpx
+
+# Connection pool and timeout budget per provider.
+#   max_connections — hard cap on concurrent sockets to that provider
+#   keepalive       — idle sockets kept warm between requests
+#   timeout         — default read timeout (s); callers may still pass a
+#                     per-request `timeout=` which takes precedence
+_PROVIDER_LIMITS = {
+    "mistral":    {"max_connections": 50, "keepalive": 20, "timeout": 60.0},
+    "openrouter": {"max_connections": 50, "keepalive": 20, "timeout": 90.0},
+    "openai":     {"max_connections": 20, "keepalive": 10, "timeout": 90.0},
+    "anthropic":  {"max_connections": 20, "keepalive": 10, "timeout": 120.0},
+}
+_DEFAULT_LIMITS = {"max_connections": 20, "keepalive": 10, "timeout": 60.0}
+
+_CONNECT_TIMEOUT = 5.0     # seconds — fail fast when a provider is unreachable
+_KEEPALIVE_EXPIRY = 60.0   # seconds an idle pooled socket is kept open
+
+_lock = threading.Lock()
+_clients: dict = {}
+
+
+def _registry_key(provider, api_key, base_url, is_async, headers) -> tuple:
+    # Never keep raw secrets in the key — a digest is enough to tell
+    # credentials apart.
+    digest = hashlib.sha256((api_key or "").encode()).hexdigest()[:16]
+    return (provider, base_url or "", digest, is_async, tuple(sorted((headers or {}).items())))
+
+
+def _http_client(provider: str, is_async: bool):
+    limits = _PROVIDER_LIMITS.get(provider, _DEFAULT_LIMITS)
+    kwargs = {
+        "limits": httpx.Limits(
+            max_connections=limits["max_connections"],
+            max_keepalive_connections=limits["keepalive"],
+            keepalive_expiry=_KEEPALIVE_EXPIRY,
+        ),
+        "timeout": httpx.Timeout(limits["timeout"], connect=_CONNECT_TIMEOUT),
+    }
+    return httpx.AsyncClient(**kwargs) if is_async else httpx.Client(**kwargs)
+
+
+def _build(provider, api_key, base_url, is_async, headers, options):
+    http_client = _http_client(provider, is_async)
+    if headers:
+        options = {**options, "default_headers": headers}
+
+    if provider == "anthropic":
+        import anthropic
+        cls = anthropic.AsyncAnthropic if is_async else anthropic.Anthropic
+        return cls(api_key=api_key, http_client=http_client, **options)
+
+    import openai
+    cls = openai.AsyncOpenAI if is_async else openai.OpenAI
+    if base_url:
+        options = {**options, "base_url": base_url}
+    return cls(api_key=api_key, http_client=http_client, **options)
+
+
+def get_client(provider: str, api_key: str, base_url: str = None, *,
+               is_async: bool = False, headers: dict = None, **options):
+    """
+    Return the shared SDK client for this provider/base URL/credentials,
+    building it (with a tuned httpx pool) on first use.
+
+    provider: "mistral" | "openrouter" | "openai" | "anthropic"
+    options:  extra SDK constructor kwargs (e.g. max_retries=0); they are
+              applied only when the client is first built.
+    """
+    key = _registry_key(provider, api_key, base_url, is_async, headers)
+    client = _clients.get(key)
+    if client is not None:
+        return client
+    with _lock:
+        client = _clients.get(key)
+        if client is None:
+            client = _build(provider, api_key, base_url, is_async, headers, options)
+            _clients[key] = client
+    return client
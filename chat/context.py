@@ -0,0 +1,117 @@
+# chat/context.py
+"""
+Context-window builder for the chat endpoints.
+
+Walks a session's history newest → oldest exactly once, keeping a running
+token total, and stops at the first message that would overflow the model's
+prompt budget (context window minus the reserved reply budget). Token counts
+come from a per-model estimator, so Mistral and the OpenRouter model can each
+use their own approximation — or a real tokenizer registered at startup via
+register_token_estimator().
+"""
+import math
+import os
+from typing import Callable, Iterable
+
+# Fixed per-message cost of the chat template (role markers, separators).
+_MESSAGE_OVERHEAD_TOKENS = 4
+
+# Upper bound on rows pulled from the DB for one context build. The token
+# budget is what normally stops the walk; this only bounds the query.
+MAX_HISTORY_MESSAGES = 200
+
+
+def _chars_per_token_estimator(chars_per_token: float) -> Callable[[str], int]:
+    """
+    Estimator for BPE-style tokenizers. ASCII text averages `chars_per_token`
+    characters per token; non-ASCII characters (accents, CJK, emoji) mostly
+    cost a token or more each, so they are counted individually.
+    """
+    def estimate(text: str) -> int:
+        if not text:
+            return 0
+        non_ascii = sum(1 for ch in text if ord(ch) > 127)
+        return math.ceil((len(text) - non_ascii) / chars_per_token) + non_ascii
+    return estimate
+
+
+# First substring match (case-insensitive) wins.
+_TOKEN_ESTIMATORS: list[tuple[str, Callable[[str], int]]] = [
+    ("mistral", _chars_per_token_estimator(3.6)),   # Tekken / SentencePiece
+    ("dolphin", _chars_per_token_estimator(3.6)),   # Mistral-24B fine-tune on OpenRouter
+]
+_DEFAULT_ESTIMATOR = _chars_per_token_estimator(3.5)
+
+
+def register_token_estimator(model_substring: str, estimator: Callable[[str], int]) -> None:
+    """Plug in a tokenizer for models whose name contains `model_substring`.
+    Registered estimators take precedence over the built-in approximations."""
+    _TOKEN_ESTIMATORS.insert(0, (model_substring.lower(), estimator))
+
+
+def estimate_tokens(model: str, text: str) -> int:
+    lower = (model or "").lower()
+    for key, estimator in _TOKEN_ESTIMATORS:
+        if key in lower:
+            return estimator(text or "")
+    return _DEFAULT_ESTIMATOR(text or "")
+
+
+def message_tokens(model: str, message: dict) -> int:
+    return estimate_tokens(model, message.get("content") or "") + _MESSAGE_OVERHEAD_TOKENS
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.getenv(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+# Context window and reply reservation per chat mode. The uncensored reply is
+# capped at max_tokens=1024 in views._UNCENSORED_PARAMS; Mistral replies are
+# uncapped, so a larger share is held back for them.
+CONTEXT_LIMITS = {
+    "regular": {
+        "window": _env_int("REGULAR_CONTEXT_TOKENS", 32_000),
+        "reply":  _env_int("REGULAR_REPLY_TOKENS", 4_000),
+    },
+    "uncensored": {
+        "window": _env_int("UNCENSORED_CONTEXT_TOKENS", 32_000),
+        "reply":  1_024,
+    },
+}
+
+
+def build_context(model: str, mode: str, history_newest_first: Iterable[dict],
+                  current: dict, prefix: list[dict] = None) -> tuple[list[dict], bool]:
+    """
+    Assemble the prompt for one chat turn.
+
+    history_newest_first: prior messages, most recent first ({role, content}).
+                          Consumed lazily — iteration stops as soon as the
+                          budget is exhausted.
+    current:              the new user message; always included.
+    prefix:               messages that must lead the prompt (e.g. a system
+                          prompt); always included and counted.
+
+    Returns (messages_oldest_first, truncated) where `truncated` is True when
+    older history had to be left out.
+    """
+    limits = CONTEXT_LIMITS.get(mode, CONTEXT_LIMITS["regular"])
+    budget = limits["window"] - limits["reply"]
+    prefix = prefix or []
+
+    used = message_tokens(model, current) + sum(message_tokens(model, m) for m in prefix)
+    kept = []
+    truncated = False
+    for message in history_newest_first:
+        cost = message_tokens(model, message)
+        if used + cost > budget:
+            truncated = True
+            break
+        used += cost
+        kept.append(message)
+
+    kept.reverse()
+    return [*prefix, *kept, current], truncated
@@ -0,0 +1,258 @@
+# chat/failover.py
+"""
+Ordered provider failover with a per-provider circuit breaker.
+
+A chain is a sequence of (provider, model) steps, e.g.
+
+    (("mistral", "mistral-small-latest"), ("gemini", "gemini-2.5-flash"))
+
+run(chain, call) tries call(provider, model) for each step in order and
+returns (result, provider, model) for the first one that succeeds; arun()
+is the asyncio counterpart. The chains themselves (per chat mode and per
+multi-debug agent) live in chat/views.py next to the model settings.
+
+Every provider has a circuit breaker shared by all chains in the worker:
+
+    closed     calls go through; FAILURE_THRESHOLD consecutive provider
+               faults open the breaker
+    open       the provider is skipped without a request for COOLDOWN
+               seconds, so a dead upstream costs nothing instead of a
+               60-90 s timeout per user
+    half-open  after the cooldown one probe request is let through; success
+               closes the breaker, failure opens it for another cooldown
+
+Only provider faults count — timeouts, connection errors, 401/403/408/429
+and 5xx. Other 4xx responses are caused by the request itself: the chain
+still moves on, but the breaker is left alone.
+
+If every step fails, the last error is re-raised so the callers' existing
+error mapping (_retry_plan: 429 / 502) still applies. openai errors are
+re-raised as they are; anthropic and google.api_core errors are wrapped in
+UpstreamError, which carries the same status_code / response the mapping
+reads, so chains ending in Gemini or Claude still answer 429 with
+Retry-After instead of 500. If every step was skipped, NoHealthyProvider is
+raised with the time until the first breaker allows a probe.
+
+State is per process; each worker learns about an outage on its own after
+FAILURE_THRESHOLD failed calls.
+"""
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+FAILURE_THRESHOLD = int(os.getenv("LLM_BREAKER_FAILURES", 3))
+COOLDOWN = float(os.getenv("LLM_BREAKER_COOLDOWN", 30))   # seconds
+
+_CLOSED, _OPEN, _HALF_OPEN = "closed", "open", "half_open"
+_PROVIDER_FAULT_CODES = (401, 403, 408, 429)
+_WRAPPED_SDKS = ("anthropic", "google")   # top-level packages whose errors become UpstreamError
+
+
+class NoHealthyProvider(Exception):
+    """Every step of a chain was skipped because its breaker is open."""
+
+    def __init__(self, chain, retry_after: float):
+        self.retry_after = retry_after
+        providers = ", ".join(provider for provider, _ in chain)
+        super().__init__(f"No healthy provider available ({providers})")
+
+
+class UpstreamError(Exception):
+    """
+    A non-openai SDK error that ended a chain. status_code is the HTTP status
+    (None for connection errors and timeouts) and response the underlying
+    HTTP response, if the SDK kept one — the attributes views._retry_plan
+    reads from openai.APIStatusError.
+    """
+
+    def __init__(self, exc: BaseException):
+        self.status_code = _status_code(exc)
+        self.response = getattr(exc, "response", None)
+        super().__init__(str(exc))
+
+
+def _status_code(exc: BaseException):
+    # openai/anthropic expose .status_code, google.api_core exceptions .code
+    code = getattr(exc, "status_code", None) or getattr(exc, "code", None)
+    return code if isinstance(code, int) else None
+
+
+def _final_error(exc: BaseException) -> BaseException:
+    if type(exc).__module__.split(".")[0] not in _WRAPPED_SDKS:
+        return exc
+    error = UpstreamError(exc)
+    error.__cause__ = exc
+    return error
+
+
+class CircuitBreaker:
+    """Health record and breaker state for one provider."""
+
+    def __init__(self, provider: str):
+        self.provider = provider
+        self.state = _CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.probing = False
+        self.successes = 0
+        self.failures = 0
+        self.latency = None        # seconds, exponentially weighted
+        self.last_error = ""
+        self._lock = threading.Lock()
+
+    def retry_after(self, now: float = None) -> float:
+        now = time.monotonic() if now is None else now
+        return max(0.0, self.opened_at + COOLDOWN - now)
+
+    def acquire(self) -> bool:
+        """True if a call may be made now (claims the probe when half-open)."""
+        with self._lock:
+            if self.state == _CLOSED:
+                return True
+            if self.state == _OPEN and self.retry_after() > 0:
+                return False
+            if self.probing:
+                return False
+            self.state = _HALF_OPEN
+            self.probing = True
+            return True
+
+    def record_success(self, elapsed: float) -> None:
+        with self._lock:
+            if self.state != _CLOSED:
+                logger.info("LLM provider %s recovered — closing its circuit", self.provider)
+            self.state = _CLOSED
+            self.consecutive_failures = 0
+            self.probing = False
+            self.successes += 1
+            self.latency = elapsed if self.latency is None else 0.8 * self.latency + 0.2 * elapsed
+
+    def record_failure(self, exc: BaseException) -> None:
+        with self._lock:
+            self.failures += 1
+            self.consecutive_failures += 1
+            self.last_error = f"{type(exc).__name__}: {str(exc)[:200]}"
+            self.probing = False
+            if self.state == _HALF_OPEN or self.consecutive_failures >= FAILURE_THRESHOLD:
+                if self.state != _OPEN:
+                    logger.warning("LLM provider %s unhealthy (%s) — opening its circuit for %.0f s",
+                                   self.provider, self.last_error, COOLDOWN)
+                self.state = _OPEN
+                self.opened_at = time.monotonic()
+
+    def release(self) -> None:
+        """Give back a half-open probe that ended in a request-side (4xx) error."""
+        with self._lock:
+            self.probing = False
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "state": self.state,
+                "consecutive_failures": self.consecutive_failures,
+                "successes": self.successes,
+                "failures": self.failures,
+                "latency_ms": round(self.latency * 1000) if self.latency is not None else None,
+                "retry_after": round(self.retry_after(), 1) if self.state == _OPEN else 0,
+                "last_error": self.last_error,
+            }
+
+
+_breakers: dict = {}
+_breakers_lock = threading.Lock()
+
+
+def breaker(provider: str) -> CircuitBreaker:
+    b = _breakers.get(provider)
+    if b is None:
+        with _breakers_lock:
+            b = _breakers.setdefault(provider, CircuitBreaker(provider))
+    return b
+
+
+def is_open(provider: str) -> bool:
+    """True while the provider's breaker is open and still cooling down."""
+    b = _breakers.get(provider)
+    return b is not None and b.state == _OPEN and b.retry_after() > 0
+
+
+def health() -> dict:
+    """{provider: breaker snapshot} for every provider called in this worker."""
+    return {provider: b.snapshot() for provider, b in sorted(_breakers.items())}
+
+
+def reset() -> None:
+    with _breakers_lock:
+        _breakers.clear()
+
+
+def is_provider_fault(exc: BaseException) -> bool:
+    code = _status_code(exc)
+    if code is None or not 400 <= code < 500:
+        return True
+    return code in _PROVIDER_FAULT_CODES
+
+
+def _outcome(b: CircuitBreaker, exc: BaseException, provider: str, model: str) -> None:
+    if is_provider_fault(exc):
+        b.record_failure(exc)
+    else:
+        b.release()
+    logger.warning("LLM call to %s/%s failed (%s) — trying next provider",
+                   provider, model, str(exc)[:200])
+
+
+def _unavailable(chain) -> NoHealthyProvider:
+    now = time.monotonic()
+    return NoHealthyProvider(chain, min((breaker(p).retry_after(now) for p, _ in chain), default=COOLDOWN))
+
+
+def run(chain, call):
+    """Return (call(provider, model), provider, model) for the first healthy step that succeeds."""
+    last_error = None
+    for provider, model in chain:
+        b = breaker(provider)
+        if not b.acquire():
+            continue
+        started = time.monotonic()
+        try:
+            result = call(provider, model)
+        except Exception as exc:
+            _outcome(b, exc, provider, model)
+            last_error = exc
+            continue
+        except BaseException:   # cancelled / interrupted — not the provider's fault
+            b.release()
+            raise
+        b.record_success(time.monotonic() - started)
+        return result, provider, model
+    if last_error is not None:
+        raise _final_error(last_error)
+    raise _unavailable(chain)
+
+
+async def arun(chain, call):
+    """Async counterpart of run(): call(provider, model) returns an awaitable."""
+    last_error = None
+    for provider, model in chain:
+        b = breaker(provider)
+        if not b.acquire():
+            continue
+        started = time.monotonic()
+        try:
+            result = await call(provider, model)
+        except Exception as exc:
+            _outcome(b, exc, provider, model)
+            last_error = exc
+            continue
+        except BaseException:   # cancelled / interrupted — not the provider's fault
+            b.release()
+            raise
+        b.record_success(time.monotonic() - started)
+        return result, provider, model
+    if last_error is not None:
+        raise _final_error(last_error)
+    raise _unavailable(chain)
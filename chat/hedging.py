@@ -0,0 +1,220 @@
+# chat/hedging.py
+"""
+Hedged chat completions (opt-in: CHAT_HEDGE_ENABLED=1).
+
+The primary request is streamed. If it has not produced its first token
+within delay(provider), a second request (the hedge) is sent — to the same
+provider or, with CHAT_HEDGE_TARGET=alternate, to the next step of the chat
+failover chain. Whichever attempt completes first wins, and the loser is
+cancelled: its stream is closed, which drops the upstream connection.
+
+    delay      the CHAT_HEDGE_PERCENTILE-th percentile of the provider's
+               recent time-to-first-token (chat/metrics.py), never below
+               CHAT_HEDGE_MIN_DELAY; CHAT_HEDGE_DEFAULT_DELAY until enough
+               samples exist
+    rate cap   at most CHAT_HEDGE_MAX_RATE of recent requests are hedged;
+               above that the primary is simply awaited
+
+Counters in chat/metrics.py: chat.hedge.requests, .fired, .capped, .won
+(the hedge beat the primary). stats() reports them with the hedge rate.
+
+Only the winner's usage is recorded; the loser's partial output is not.
+Async losers are cancelled immediately; thread-based losers stop at their
+next chunk (a request still waiting for its first byte runs until then).
+
+run() is for the thread-based views, arun() for chat/async_views.py. The
+attempt callables receive an Attempt and must call attempt.token() on each
+streamed delta and attempt.check() between chunks.
+"""
+import asyncio
+import concurrent.futures
+import os
+import threading
+import time
+from collections import deque
+
+from . import failover, metrics
+
+ENABLED = os.getenv("CHAT_HEDGE_ENABLED", "").lower() in ("true", "1", "yes")
+PERCENTILE = float(os.getenv("CHAT_HEDGE_PERCENTILE", 95))
+MIN_DELAY = float(os.getenv("CHAT_HEDGE_MIN_DELAY", 0.25))           # seconds
+DEFAULT_DELAY = float(os.getenv("CHAT_HEDGE_DEFAULT_DELAY", 2.0))    # seconds
+MAX_RATE = float(os.getenv("CHAT_HEDGE_MAX_RATE", 0.1))
+TARGET = os.getenv("CHAT_HEDGE_TARGET", "same")                      # "same" | "alternate"
+
+_RATE_WINDOW = 200      # recent requests the cap is computed over
+_RATE_MIN_WINDOW = 20   # don't let the first few requests all hedge
+
+_executor = concurrent.futures.ThreadPoolExecutor(
+    max_workers=int(os.getenv("CHAT_HEDGE_WORKERS", 32)), thread_name_prefix="chat-hedge",
+)
+
+
+class Cancelled(Exception):
+    """Raised inside an attempt that lost the race."""
+
+
+class Attempt:
+    """Progress of one hedged request: first-token signal and cancellation flag."""
+
+    def __init__(self, provider: str, first_token=None):
+        self.provider = provider
+        self.started = time.monotonic()
+        self.first_token = first_token or threading.Event()
+        self.cancelled = False
+
+    def token(self) -> None:
+        if not self.first_token.is_set():
+            metrics.observe(f"chat.ttft.{self.provider}", time.monotonic() - self.started)
+            self.first_token.set()
+
+    def check(self) -> None:
+        if self.cancelled:
+            raise Cancelled()
+
+    def cancel(self) -> None:
+        self.cancelled = True
+        if not self.first_token.is_set():
+            # Censored sample — the real TTFT is at least this long. Without it
+            # slow primaries would drop out of the percentile and pull it down.
+            metrics.observe(f"chat.ttft.{self.provider}", time.monotonic() - self.started)
+
+
+class _RateCap:
+
+    def __init__(self):
+        self._recent = deque(maxlen=_RATE_WINDOW)
+        self._lock = threading.Lock()
+
+    def record(self, hedged: bool) -> None:
+        with self._lock:
+            self._recent.append(hedged)
+
+    def allows(self) -> bool:
+        with self._lock:
+            return sum(self._recent) < MAX_RATE * max(len(self._recent), _RATE_MIN_WINDOW)
+
+
+_cap = _RateCap()
+
+
+def enabled() -> bool:
+    return ENABLED
+
+
+def delay(provider: str) -> float:
+    """Seconds to wait for the primary's first token before hedging."""
+    observed = metrics.percentile(f"chat.ttft.{provider}", PERCENTILE)
+    if observed is None:
+        return DEFAULT_DELAY
+    return max(MIN_DELAY, observed)
+
+
+def hedge_target(chain, provider: str, model: str) -> tuple:
+    """(provider, model) for the hedge of a call to `provider`/`model` in `chain`."""
+    if TARGET == "alternate":
+        steps = [tuple(step) for step in chain]
+        index = steps.index((provider, model)) if (provider, model) in steps else -1
+        if 0 <= index < len(steps) - 1 and not failover.is_open(steps[index + 1][0]):
+            return steps[index + 1]
+    return provider, model
+
+
+def _should_hedge() -> bool:
+    if not _cap.allows():
+        metrics.incr("chat.hedge.capped")
+        _cap.record(False)
+        return False
+    metrics.incr("chat.hedge.fired")
+    _cap.record(True)
+    return True
+
+
+def run(primary, hedge, provider: str, hedge_provider: str) -> tuple:
+    """
+    Run primary(attempt); if it has no first token after delay(provider),
+    also run hedge(attempt). Returns (result, hedged_won).
+    """
+    metrics.incr("chat.hedge.requests")
+    first = Attempt(provider)
+    first_future = _executor.submit(primary, first)
+    first_token_or_done = first.first_token
+    first_future.add_done_callback(lambda _: first_token_or_done.set())
+
+    if first.first_token.wait(delay(provider)):
+        _cap.record(False)   # on time — still part of the window the cap is a share of
+        return first_future.result(), False
+    if not _should_hedge():
+        return first_future.result(), False
+
+    second = Attempt(hedge_provider)
+    second_future = _executor.submit(hedge, second)
+    attempts = {first_future: first, second_future: second}
+    pending = set(attempts)
+    error = None
+    while pending:
+        done, pending = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+        for future in done:
+            if future.exception() is None:
+                for other in pending:
+                    attempts[other].cancel()
+                won = future is second_future
+                if won:
+                    metrics.incr("chat.hedge.won")
+                return future.result(), won
+            error = future.exception()
+    raise error
+
+
+async def arun(primary, hedge, provider: str, hedge_provider: str) -> tuple:
+    """Async counterpart of run(); primary/hedge are coroutine functions taking an Attempt."""
+    metrics.incr("chat.hedge.requests")
+    first = Attempt(provider, first_token=asyncio.Event())
+    first_task = asyncio.ensure_future(primary(first))
+    first_task.add_done_callback(lambda _: first.first_token.set())
+
+    try:
+        await asyncio.wait_for(first.first_token.wait(), timeout=delay(provider))
+        got_token = True
+    except asyncio.TimeoutError:
+        got_token = False
+    if got_token:
+        _cap.record(False)
+        return await first_task, False
+    if not _should_hedge():
+        return await first_task, False
+
+    second = Attempt(hedge_provider, first_token=asyncio.Event())
+    second_task = asyncio.ensure_future(hedge(second))
+    attempts = {first_task: first, second_task: second}
+    pending = set(attempts)
+    error = None
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    won = task is second_task
+                    if won:
+                        metrics.incr("chat.hedge.won")
+                    return task.result(), won
+                error = task.exception()
+        raise error
+    finally:
+        for task in pending:
+            attempts[task].cancel()
+            task.cancel()
+
+
+def stats() -> dict:
+    requests = metrics.counter("chat.hedge.requests")
+    fired = metrics.counter("chat.hedge.fired")
+    return {
+        "enabled": ENABLED,
+        "requests": requests,
+        "fired": fired,
+        "capped": metrics.counter("chat.hedge.capped"),
+        "won": metrics.counter("chat.hedge.won"),
+        "rate": round(fired / requests, 3) if requests else 0.0,
+        "max_rate": MAX_RATE,
+    }
@@ -0,0 +1,82 @@
+# chat/llm_cache.py
+"""
+Exact-match cache for deterministic LLM calls.
+
+Entries are content-addressed on (model, system prompt, normalized input),
+so the same code pasted into /api/multi-debug/ twice — or the same question
+asked about the same OCR document — is answered from memory instead of
+paying for the provider calls again.
+
+The cache is per-process (cachetools.TTLCache): entries expire after
+LLM_CACHE_TTL seconds and the total cached text is bounded by
+LLM_CACHE_MAX_CHARS, evicting the least recently used first.
+"""
+import hashlib
+import json
+import os
+import threading
+
+from cachetools import TTLCache
+
+# Modes whose calls may be served from the cache. "uncensored" uses
+# high-temperature sampling on purpose and is never cached, whatever the
+# configuration says.
+_NEVER_CACHED = frozenset({"uncensored"})
+CACHED_MODES = frozenset(
+    m.strip()
+    for m in os.getenv("LLM_CACHE_MODES", "multi_debugger,ocr").split(",")
+    if m.strip()
+) - _NEVER_CACHED
+
+LLM_CACHE_TTL = int(os.getenv("LLM_CACHE_TTL", 60 * 60))                    # 1 hour
+LLM_CACHE_MAX_CHARS = int(os.getenv("LLM_CACHE_MAX_CHARS", 20_000_000))     # ~20 MB of text
+
+
+def _entry_size(entry) -> int:
+    return len(entry[0]) + 64
+
+
+_lock = threading.Lock()  # cachetools caches are not thread-safe
+_cache = TTLCache(maxsize=LLM_CACHE_MAX_CHARS, ttl=LLM_CACHE_TTL, getsizeof=_entry_size)
+
+
+def _normalize(text: str) -> str:
+    """Ignore differences that never change the answer: line endings and
+    trailing whitespace. Case and indentation are kept — they matter in code."""
+    lines = (text or "").replace("\r\n", "\n").replace("\r", "\n").split("\n")
+    return "\n".join(line.rstrip() for line in lines).strip()
+
+
+def make_key(model: str, system_prompt: str, user_input: str) -> str:
+    payload = json.dumps([model, system_prompt or "", _normalize(user_input)], ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def is_enabled(mode: str) -> bool:
+    return mode in CACHED_MODES
+
+
+def lookup(key: str):
+    """Return the cached (text, input_tokens, output_tokens) or None."""
+    with _lock:
+        return _cache.get(key)
+
+
+def store(key: str, result: tuple) -> None:
+    """
+    Cache a (text, input_tokens, output_tokens) result. Agent failures come
+    back as "[... unavailable: ...]" with zero tokens; those are never cached
+    so a transient provider outage is not replayed for an hour.
+    """
+    text, in_tok, out_tok = result
+    if not text or (text.startswith("[") and not in_tok and not out_tok):
+        return
+    if _entry_size(result) > LLM_CACHE_MAX_CHARS:
+        return
+    with _lock:
+        _cache[key] = (text, in_tok, out_tok)
+
+
+def clear() -> None:
+    with _lock:
+        _cache.clear()
@@ -0,0 +1,30 @@
+# chat/management/commands/backfill_session_stats.py
+"""
+Recompute ChatSession.last_message_at and message_count from the message
+table. Migration 0012 runs this once when the columns are added; run it
+again any time the counters are suspected to have drifted (e.g. after a
+raw SQL cleanup).
+
+    python manage.py backfill_session_stats [--batch-size 1000]
+
+Works in id-ordered batches, one UPDATE per batch, so it never holds long
+locks on a large chat_session table.
+"""
+from django.core.management.base import BaseCommand
+
+from chat.models import ChatSession, Message, backfill_session_stats
+
+
+class Command(BaseCommand):
+    help = "Recompute ChatSession.last_message_at and message_count from messages."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        updated = backfill_session_stats(
+            ChatSession, Message,
+            batch_size=max(1, options["batch_size"]),
+            progress=lambda n, last_id: self.stdout.write(f"  {n} sessions updated (through id {last_id})"),
+        )
+        self.stdout.write(self.style.SUCCESS(f"Backfilled {updated} chat sessions."))
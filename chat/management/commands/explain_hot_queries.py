@@ -0,0 +1,125 @@
+# chat/management/commands/explain_hot_queries.py
+"""
+EXPLAIN the hot Message/ChatSession queries from chat/views.py and
+chat/models.py against the configured database and flag any that scan
+chat_message sequentially.
+
+    python manage.py explain_hot_queries
+    python manage.py explain_hot_queries --session-id <id> --analyze
+    python manage.py explain_hot_queries --fail-on-seq-scan     # for CI
+
+Note: on a small development table PostgreSQL may legitimately prefer a
+sequential scan; run this against a production-sized database.
+"""
+import re
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from chat.context import MAX_HISTORY_MESSAGES
+from chat.models import ChatSession, DocumentIndex, Message
+from chat.views import ChatHistoryView
+
+# A full scan of the message table, as reported by each backend's planner.
+_SEQ_SCAN_PATTERNS = {
+    "postgresql": re.compile(r"Seq Scan on chat_message\b"),
+    "sqlite": re.compile(r"\bSCAN (?:TABLE )?chat_message\b(?! USING)"),
+    "mysql": re.compile(r"\bchat_message\b.*\bALL\b"),
+}
+
+
+def hot_queries(session: ChatSession, user) -> list[tuple[str, object]]:
+    """(label, queryset) for each hot query, mirroring the code it is named after."""
+    sid = session.session_id
+    mode = session.mode
+    ocr_documents = (
+        Message.objects.filter(session_id=sid, mode="ocr", role="system")
+        .defer("content").order_by("timestamp", "id")
+    )
+    # session_corpus passes the documents it just loaded; [0] keeps the
+    # plan meaningful for a session without any
+    document_ids = list(ocr_documents.values_list("id", flat=True)) or [0]
+    return [
+        (
+            "_prepare_chat_turn: prompt history",
+            Message.objects.filter(session_id=sid, mode=mode)
+            .order_by("-timestamp").values("role", "content")[:MAX_HISTORY_MESSAGES],
+        ),
+        (
+            "_prepare_chat_turn: prompt history after the rolling summary",
+            Message.objects.filter(session_id=sid, mode=mode, id__gt=session.summary_through_id or 0)
+            .order_by("-timestamp").values("role", "content")[:MAX_HISTORY_MESSAGES],
+        ),
+        (
+            "ChatHistoryView: load older (keyset)",
+            Message.objects.filter(session_id=sid, mode=mode)
+            .order_by("-timestamp", "-id")[:ChatHistoryView.PAGE_SIZE + 1],
+        ),
+        (
+            "ChatHistoryView: numbered page",
+            Message.objects.filter(session_id=sid, mode=mode)
+            .order_by("timestamp", "id")[:ChatHistoryView.PAGE_SIZE],
+        ),
+        (
+            "retrieval.session_corpus: session documents",
+            ocr_documents,
+        ),
+        (
+            "retrieval.session_corpus: document indexes",
+            DocumentIndex.objects.filter(message__in=document_ids).values_list("message_id", "data"),
+        ),
+        (
+            "list_sessions: sidebar",
+            ChatSession.objects.filter(user=user).order_by("-last_message_at"),
+        ),
+        (
+            "refresh_session_stats: latest remaining message",
+            Message.objects.filter(session_id=sid).order_by("-timestamp").values("timestamp")[:1],
+        ),
+    ]
+
+
+class Command(BaseCommand):
+    help = "EXPLAIN the hot chat queries and flag sequential scans of the message table."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--session-id", help="Session to plan against (default: the most recent one).")
+        parser.add_argument("--analyze", action="store_true",
+                            help="EXPLAIN ANALYZE (PostgreSQL only) — actually runs the queries.")
+        parser.add_argument("--fail-on-seq-scan", action="store_true",
+                            help="Exit with an error if any query scans chat_message sequentially.")
+
+    def handle(self, *args, **options):
+        if options["session_id"]:
+            session = ChatSession.objects.filter(session_id=options["session_id"]).first()
+        else:
+            session = ChatSession.objects.order_by("-id").first()
+        if session is None:
+            raise CommandError("No chat session to plan against — pass --session-id or create one.")
+
+        vendor = connection.vendor
+        pattern = _SEQ_SCAN_PATTERNS.get(vendor)
+        explain_options = {}
+        if options["analyze"]:
+            if vendor != "postgresql":
+                raise CommandError("--analyze is only supported on PostgreSQL.")
+            explain_options = {"analyze": True, "buffers": True}
+
+        flagged = []
+        for label, qs in hot_queries(session, session.user):
+            plan = qs.explain(**explain_options)
+            self.stdout.write(self.style.MIGRATE_HEADING(label))
+            self.stdout.write(plan + "\n")
+            if pattern and pattern.search(plan):
+                flagged.append(label)
+                self.stdout.write(self.style.WARNING("  ^ sequential scan of chat_message\n"))
+
+        if pattern is None:
+            self.stdout.write(self.style.NOTICE(f"Seq-scan detection is not implemented for '{vendor}'."))
+        elif flagged:
+            message = f"{len(flagged)} hot quer{'y' if len(flagged) == 1 else 'ies'} scan chat_message: " + "; ".join(flagged)
+            if options["fail_on_seq_scan"]:
+                raise CommandError(message)
+            self.stdout.write(self.style.WARNING(message))
+        else:
+            self.stdout.write(self.style.SUCCESS("All hot queries use an index."))
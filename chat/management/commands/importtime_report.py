@@ -0,0 +1,119 @@
+# chat/management/commands/importtime_report.py
+"""
+Measure worker boot cost with `python -X importtime`.
+
+Starts a fresh interpreter that runs django.setup() and imports what a
+gunicorn worker loads before serving (the WSGI module and ROOT_URLCONF),
+then reports the total import time, the cost per top-level package and the
+heaviest individual modules.
+
+    python manage.py importtime_report [--runs 3] [--top 15]
+                                       [--module chat.views ...]
+                                       [--json report.json] [--budget-ms 1500]
+
+Each run is a separate process; the per-module minimum across runs is
+reported to filter out disk-cache noise. --json writes the report so it can
+be tracked across deploys, and --budget-ms exits non-zero when the total
+exceeds the budget (for CI).
+"""
+import json
+import os
+import subprocess
+import sys
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+_SCRIPT = (
+    "import importlib, django\n"
+    "django.setup()\n"
+    "for name in {modules!r}:\n"
+    "    importlib.import_module(name)\n"
+)
+
+
+def parse_importtime(stderr: str) -> dict:
+    """
+    Parse `-X importtime` output into {module: (self_us, cumulative_us, depth)}.
+    Depth 0 entries are the ones imported directly by the script.
+    """
+    modules = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        parts = line[len("import time:"):].split("|")
+        if len(parts) != 3 or not parts[0].strip().isdigit():
+            continue   # the header line
+        name = parts[2].rstrip()
+        depth = (len(name) - len(name.lstrip())) // 2
+        modules[name.strip()] = (int(parts[0]), int(parts[1]), depth)
+    return modules
+
+
+class Command(BaseCommand):
+    help = "Report per-module import time of a worker boot (python -X importtime)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--module", action="append", dest="modules",
+                            help="Module to import after django.setup() (repeatable). "
+                                 "Default: the WSGI application module and ROOT_URLCONF.")
+        parser.add_argument("--runs", type=int, default=3)
+        parser.add_argument("--top", type=int, default=15)
+        parser.add_argument("--json", dest="json_path", help="Write the report to this file.")
+        parser.add_argument("--budget-ms", type=float,
+                            help="Fail when the total import time exceeds this many milliseconds.")
+
+    def handle(self, *args, **options):
+        modules = options["modules"] or [
+            settings.WSGI_APPLICATION.rsplit(".", 1)[0],
+            settings.ROOT_URLCONF,
+        ]
+        runs = [self._run(modules) for _ in range(max(1, options["runs"]))]
+
+        best = {}
+        for run in runs:
+            for name, timing in run.items():
+                if name not in best or timing[1] < best[name][1]:
+                    best[name] = timing
+        total_us = min(sum(cum for _, cum, depth in run.values() if depth == 0) for run in runs)
+
+        by_package = defaultdict(int)
+        for name, (self_us, _, _) in best.items():
+            by_package[name.split(".", 1)[0]] += self_us
+        packages = sorted(by_package.items(), key=lambda kv: kv[1], reverse=True)[:options["top"]]
+        heaviest = sorted(best.items(), key=lambda kv: kv[1][1], reverse=True)[:options["top"]]
+
+        self.stdout.write(f"Boot imports ({', '.join(modules)}): {total_us / 1000:.1f} ms "
+                          f"over {len(best)} modules, best of {len(runs)} run(s)")
+        self.stdout.write("\nSelf time by top-level package:")
+        for package, us in packages:
+            self.stdout.write(f"  {us / 1000:9.1f} ms  {package}")
+        self.stdout.write("\nHeaviest modules (cumulative):")
+        for name, (_, cum, _) in heaviest:
+            self.stdout.write(f"  {cum / 1000:9.1f} ms  {name}")
+
+        if options["json_path"]:
+            report = {
+                "modules": modules,
+                "total_ms": round(total_us / 1000, 1),
+                "packages": {p: round(us / 1000, 1) for p, us in by_package.items()},
+                "cumulative": {n: round(t[1] / 1000, 1) for n, t in best.items()},
+            }
+            with open(options["json_path"], "w", encoding="utf-8") as f:
+                json.dump(report, f, indent=2, sort_keys=True)
+
+        budget = options["budget_ms"]
+        if budget is not None and total_us / 1000 > budget:
+            raise CommandError(f"Boot imports took {total_us / 1000:.1f} ms (budget {budget:.0f} ms).")
+
+    def _run(self, modules) -> dict:
+        env = {**os.environ, "PYTHONDONTWRITEBYTECODE": "1"}
+        env.setdefault("DJANGO_SETTINGS_MODULE", os.environ.get("DJANGO_SETTINGS_MODULE", "backend.settings"))
+        proc = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", _SCRIPT.format(modules=modules)],
+            cwd=settings.BASE_DIR, env=env, capture_output=True, text=True,
+        )
+        if proc.returncode != 0:
+            raise CommandError(f"Import failed:\n{proc.stderr[-2000:]}")
+        return parse_importtime(proc.stderr)
@@ -0,0 +1,34 @@
+# chat/management/commands/rebuild_usage_rollups.py
+"""
+Rebuild the DailyUsage rollups from the raw ModelUsage rows. Run once after
+deploying the rollup table, or to repair drift.
+
+    python manage.py rebuild_usage_rollups [--user <id>]
+
+Migration 0014 seeds the table the same way. Each user is rebuilt in its
+own transaction — aggregate, delete, re-insert — under the per-user lock the
+usage sink also takes (chat.models.rebuild_daily_usage), so usage_stats never
+sees a half-built set of buckets and no live increment is lost or counted
+twice.
+"""
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+
+from chat.models import DailyUsage, ModelUsage, rebuild_daily_usage
+
+
+class Command(BaseCommand):
+    help = "Rebuild DailyUsage rollups from ModelUsage."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--user", type=int, help="Only rebuild this user id.")
+
+    def handle(self, *args, **options):
+        if options["user"]:
+            user_ids = [options["user"]]
+        else:
+            user_ids = ModelUsage.objects.order_by().values_list("user_id", flat=True).distinct()
+
+        user_model = get_user_model()
+        buckets = sum(rebuild_daily_usage(ModelUsage, DailyUsage, user_model, user_id) for user_id in user_ids)
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {buckets} daily usage buckets."))
@@ -0,0 +1,77 @@
+# chat/metrics.py
+"""
+In-process counters and latency samples for the LLM call paths.
+
+    metrics.incr("chat.hedge.fired")
+    metrics.observe("chat.ttft.mistral", 0.84)          # seconds
+    metrics.percentile("chat.ttft.mistral", 95)         # None until MIN_SAMPLES
+    metrics.snapshot()                                  # served by GET /api/metrics/
+
+Latencies keep the most recent SAMPLE_SIZE observations per name, so
+percentiles follow the provider's current behaviour rather than its
+all-time history. Everything is per worker process and reset on restart.
+"""
+import math
+import threading
+from collections import defaultdict, deque
+
+SAMPLE_SIZE = 500
+MIN_SAMPLES = 20
+
+_lock = threading.Lock()
+_counters = defaultdict(int)
+_samples = defaultdict(lambda: deque(maxlen=SAMPLE_SIZE))
+
+
+def incr(name: str, n: int = 1) -> None:
+    with _lock:
+        _counters[name] += n
+
+
+def observe(name: str, seconds: float) -> None:
+    with _lock:
+        _samples[name].append(seconds)
+
+
+def _percentile(values: list, pct: float) -> float:
+    ordered = sorted(values)
+    rank = max(0, math.ceil(pct / 100 * len(ordered)) - 1)
+    return ordered[rank]
+
+
+def percentile(name: str, pct: float, min_samples: int = MIN_SAMPLES):
+    """pct-th percentile (nearest rank) of the recent samples, or None if there are too few."""
+    with _lock:
+        values = list(_samples.get(name, ()))
+    if len(values) < min_samples:
+        return None
+    return _percentile(values, pct)
+
+
+def counter(name: str) -> int:
+    with _lock:
+        return _counters.get(name, 0)
+
+
+def snapshot() -> dict:
+    with _lock:
+        counters = dict(_counters)
+        samples = {name: list(values) for name, values in _samples.items() if values}
+    return {
+        "counters": dict(sorted(counters.items())),
+        "latency_ms": {
+            name: {
+                "count": len(values),
+                "p50": round(_percentile(values, 50) * 1000),
+                "p95": round(_percentile(values, 95) * 1000),
+                "p99": round(_percentile(values, 99) * 1000),
+            }
+            for name, values in sorted(samples.items())
+        },
+    }
+
+
+def reset() -> None:
+    with _lock:
+        _counters.clear()
+        _samples.clear()
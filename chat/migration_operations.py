@@ -0,0 +1,30 @@
+# chat/migration_operations.py
+"""
+Custom migration operations shared by chat/migrations.
+
+Migrations using them must set `atomic = False`: CREATE INDEX CONCURRENTLY
+cannot run inside a transaction.
+"""
+from django.db import migrations
+
+
+class AddIndexConcurrentlyOnPostgres(migrations.AddIndex):
+    """
+    CREATE INDEX CONCURRENTLY on PostgreSQL so building an index on the
+    multi-million-row message table does not block inserts; a plain
+    CREATE INDEX elsewhere (SQLite in development).
+    """
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor != "postgresql":
+            return super().database_forwards(app_label, schema_editor, from_state, to_state)
+        model = to_state.apps.get_model(app_label, self.model_name)
+        if self.allow_migrate_model(schema_editor.connection.alias, model):
+            schema_editor.add_index(model, self.index, concurrently=True)
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor != "postgresql":
+            return super().database_backwards(app_label, schema_editor, from_state, to_state)
+        model = from_state.apps.get_model(app_label, self.model_name)
+        if self.allow_migrate_model(schema_editor.connection.alias, model):
+            schema_editor.remove_index(model, self.index, concurrently=True)
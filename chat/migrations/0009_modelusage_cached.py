@@ -0,0 +1,18 @@
+# Generated by Django 5.2.8 on 2026-10-18 17:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0008_chatsession_summary'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='modelusage',
+            name='cached',
+            field=models.BooleanField(default=False),
+        ),
+    ]
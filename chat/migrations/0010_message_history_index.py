@@ -0,0 +1,21 @@
+# Generated by Django 5.2.8 on 2026-10-18 17:25
+
+from django.db import migrations, models
+
+from chat.migration_operations import AddIndexConcurrentlyOnPostgres
+
+
+class Migration(migrations.Migration):
+    # CONCURRENTLY cannot run inside a transaction
+    atomic = False
+
+    dependencies = [
+        ('chat', '0009_modelusage_cached'),
+    ]
+
+    operations = [
+        AddIndexConcurrentlyOnPostgres(
+            model_name='message',
+            index=models.Index(fields=['session', 'mode', 'timestamp', 'id'], name='chat_msg_session_mode_ts_idx'),
+        ),
+    ]
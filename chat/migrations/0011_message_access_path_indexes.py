@@ -0,0 +1,25 @@
+# Generated by Django 5.2.8 on 2026-10-18 17:26
+
+from django.db import migrations, models
+
+from chat.migration_operations import AddIndexConcurrentlyOnPostgres
+
+
+class Migration(migrations.Migration):
+    # CONCURRENTLY cannot run inside a transaction
+    atomic = False
+
+    dependencies = [
+        ('chat', '0010_message_history_index'),
+    ]
+
+    operations = [
+        AddIndexConcurrentlyOnPostgres(
+            model_name='message',
+            index=models.Index(fields=['session', 'timestamp'], name='chat_msg_session_ts_idx'),
+        ),
+        AddIndexConcurrentlyOnPostgres(
+            model_name='message',
+            index=models.Index(condition=models.Q(('mode', 'ocr'), ('role', 'system')), fields=['session', '-timestamp'], name='chat_msg_ocr_doc_idx'),
+        ),
+    ]
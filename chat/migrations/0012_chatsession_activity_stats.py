@@ -0,0 +1,40 @@
+# Generated by Django 5.2.8 on 2026-10-18 17:28
+
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill(apps, schema_editor):
+    from chat.models import backfill_session_stats
+
+    backfill_session_stats(apps.get_model('chat', 'ChatSession'), apps.get_model('chat', 'Message'))
+
+
+class Migration(migrations.Migration):
+    # Let each backfill batch commit on its own instead of holding one
+    # transaction over the whole chat_session table
+    atomic = False
+
+    dependencies = [
+        ('chat', '0011_message_access_path_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chatsession',
+            name='last_message_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AddField(
+            model_name='chatsession',
+            name='message_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='chatsession',
+            index=models.Index(fields=['user', '-last_message_at'], name='chat_session_user_recent_idx'),
+        ),
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.8 on 2026-10-18 17:29
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0012_chatsession_activity_stats'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='modelusage',
+            name='created_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+    ]
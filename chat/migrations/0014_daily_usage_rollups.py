@@ -0,0 +1,52 @@
+# Generated by Django 5.2.8 on 2026-10-18 17:30
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def seed_rollups(apps, schema_editor):
+    from chat.models import rebuild_daily_usage
+
+    usage_model = apps.get_model('chat', 'ModelUsage')
+    rollup_model = apps.get_model('chat', 'DailyUsage')
+    user_model = apps.get_model(settings.AUTH_USER_MODEL)
+    user_ids = list(usage_model.objects.order_by().values_list('user_id', flat=True).distinct())
+    for user_id in user_ids:
+        rebuild_daily_usage(usage_model, rollup_model, user_model, user_id)
+
+
+class Migration(migrations.Migration):
+    # One transaction per user while seeding, not one over all of ModelUsage
+    atomic = False
+
+    dependencies = [
+        ('chat', '0013_modelusage_created_at_default'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='modelusage',
+            name='mode',
+            field=models.CharField(blank=True, default='', max_length=16),
+        ),
+        migrations.CreateModel(
+            name='DailyUsage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('model_name', models.CharField(max_length=120)),
+                ('mode', models.CharField(blank=True, default='', max_length=16)),
+                ('cached', models.BooleanField(default=False)),
+                ('calls', models.PositiveIntegerField(default=0)),
+                ('input_tokens', models.PositiveBigIntegerField(default=0)),
+                ('output_tokens', models.PositiveBigIntegerField(default=0)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_usages', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('user', 'day', 'model_name', 'mode', 'cached'), name='chat_dailyusage_unique_bucket')],
+            },
+        ),
+        migrations.RunPython(seed_rollups, migrations.RunPython.noop),
+    ]
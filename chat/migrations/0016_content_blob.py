@@ -0,0 +1,31 @@
+# Generated by Django 5.2.8 on 2026-10-18 17:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0015_document_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ContentBlob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sha256', models.CharField(max_length=64, unique=True)),
+                ('size', models.PositiveBigIntegerField()),
+                ('cloudinary_url', models.URLField(blank=True, default='', max_length=500)),
+                ('gemini_uri', models.CharField(blank=True, default='', max_length=500)),
+                ('gemini_mime_type', models.CharField(blank=True, default='', max_length=100)),
+                ('gemini_expires_at', models.DateTimeField(blank=True, null=True)),
+                ('extracted_text', models.TextField(blank=True, default='')),
+                ('extraction_model', models.CharField(blank=True, default='', max_length=120)),
+                ('extraction_input_tokens', models.PositiveIntegerField(default=0)),
+                ('extraction_output_tokens', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
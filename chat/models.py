@@ -1,5 +1,10 @@
-from django.db import models
+from django.db import models, transaction
 from django.conf import settings
+from django.db.models import Count, F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce, TruncDate
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+from django.utils import timezone
 
 class ChatSession(models.Model):
     MODE_CHOICES = (
@@ -21,6 +26,26 @@ class ChatSession(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    # Rolling summary of older turns (see chat/summaries.py). Messages with
+    # id <= summary_through_id are represented by `summary` in the prompt
+    # instead of being re-sent verbatim.
+    summary = models.TextField(blank=True, default="")
+    summary_through_id = models.BigIntegerField(null=True, blank=True)
+
+    # Maintained at the bottom of this module (a receiver for creates,
+    # refresh_session_stats() after deletes) so the sidebar and the admin
+    # never aggregate over messages. A session without messages reports its
+    # creation time. Migration 0012 filled in existing rows;
+    # `manage.py backfill_session_stats` repairs drift.
+    last_message_at = models.DateTimeField(default=timezone.now)
+    message_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        indexes = [
+            # list_sessions: one user's sessions, most recently active first
+            models.Index(fields=["user", "-last_message_at"], name="chat_session_user_recent_idx"),
+        ]
+
     def __str__(self):
         return f"{self.session_id} [{self.mode}]"
 
@@ -51,11 +76,67 @@ class Message(models.Model):
 
     class Meta:
         ordering = ["timestamp"]
+        # Matched to the access paths in chat/views.py — check with
+        # `manage.py explain_hot_queries` after changing any of them.
+        indexes = [
+            # Prompt history (_prepare_chat_turn) and ChatHistoryView keyset pages
+            models.Index(fields=["session", "mode", "timestamp", "id"], name="chat_msg_session_mode_ts_idx"),
+            # Latest message per session (last_message_at upkeep and backfill)
+            models.Index(fields=["session", "timestamp"], name="chat_msg_session_ts_idx"),
+            # Uploaded OCR documents (retrieval.session_corpus) — only the
+            # few system rows are indexed
+            models.Index(
+                fields=["session", "-timestamp"],
+                condition=models.Q(role="system", mode="ocr"),
+                name="chat_msg_ocr_doc_idx",
+            ),
+        ]
 
     def __str__(self):
         return f"{self.timestamp:%Y-%m-%d %H:%M} {self.session_id} {self.role}"
 
 
+class DocumentIndex(models.Model):
+    """
+    BM25 chunk index over one uploaded OCR document (a role="system"
+    Message), built by chat/retrieval.py at upload time. `data` holds the
+    chunk spans, chunk lengths and postings; chunk text is sliced from the
+    Message itself.
+    """
+    message = models.OneToOneField(Message, on_delete=models.CASCADE, related_name="document_index")
+    data = models.JSONField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"index for message {self.message_id} ({len(self.data.get('spans', []))} chunks)"
+
+
+class ContentBlob(models.Model):
+    """
+    Work already done for one exact file, addressed by the SHA-256 of its
+    bytes, so a repeat upload skips the Cloudinary upload, the Gemini file
+    upload and/or the OCR extraction call (chat/blobs.py). Shared by all
+    users: only someone holding the same bytes can hit an entry.
+    """
+    sha256 = models.CharField(max_length=64, unique=True)
+    size = models.PositiveBigIntegerField()
+    cloudinary_url = models.URLField(max_length=500, blank=True, default="")
+    # Gemini deletes uploaded files after ~48 h; the reference is only reused before then
+    gemini_uri = models.CharField(max_length=500, blank=True, default="")
+    gemini_mime_type = models.CharField(max_length=100, blank=True, default="")
+    gemini_expires_at = models.DateTimeField(null=True, blank=True)
+    # OCR text and what extracting it cost (recorded as cached usage on reuse)
+    extracted_text = models.TextField(blank=True, default="")
+    extraction_model = models.CharField(max_length=120, blank=True, default="")
+    extraction_input_tokens = models.PositiveIntegerField(default=0)
+    extraction_output_tokens = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.sha256[:12]} ({self.size} bytes)"
+
+
 class ModelUsage(models.Model):
     """Tracks token usage per LLM API call, scoped to a user."""
     user = models.ForeignKey(
@@ -66,10 +147,152 @@ class ModelUsage(models.Model):
     model_name = models.CharField(max_length=120, db_index=True)
     input_tokens = models.PositiveIntegerField(default=0)
     output_tokens = models.PositiveIntegerField(default=0)
-    created_at = models.DateTimeField(auto_now_add=True)
+    # Served from chat/llm_cache.py — token counts are what the original call
+    # cost (i.e. what was saved); excluded from spend totals.
+    cached = models.BooleanField(default=False)
+    # Chat mode the call served ("" for rows recorded before it was tracked)
+    mode = models.CharField(max_length=16, blank=True, default="")
+    # Set when the call happened, not when the buffered row is flushed
+    # (chat/usage_sink.py passes it explicitly).
+    created_at = models.DateTimeField(default=timezone.now)
 
     class Meta:
         indexes = [models.Index(fields=['user', 'model_name'], name='chat_modelusage_user_model_idx')]
 
     def __str__(self):
         return f"{self.user_id} | {self.model_name} | in={self.input_tokens} out={self.output_tokens}"
+
+
+class DailyUsage(models.Model):
+    """
+    ModelUsage rolled up per (user, day, model, mode, cached). Maintained
+    incrementally by chat/usage_sink.py in the same transaction as the raw
+    rows; rebuild with `manage.py rebuild_usage_rollups`. usage_stats reads
+    only this table.
+    """
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='daily_usages',
+    )
+    day = models.DateField()
+    model_name = models.CharField(max_length=120)
+    mode = models.CharField(max_length=16, blank=True, default="")
+    cached = models.BooleanField(default=False)
+    calls = models.PositiveIntegerField(default=0)
+    input_tokens = models.PositiveBigIntegerField(default=0)
+    output_tokens = models.PositiveBigIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'day', 'model_name', 'mode', 'cached'],
+                name='chat_dailyusage_unique_bucket',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id} | {self.day} | {self.model_name} | calls={self.calls}"
+
+
+# ─── ChatSession.last_message_at / message_count maintenance ────────────────
+# Creates are counted by the receiver below. Deletes are not: a post_delete
+# receiver would stop Django from fast-deleting messages (one DELETE per row
+# instead of one per queryset), so the places that delete messages call
+# refresh_session_stats() once afterwards. Cascades from a session or user
+# deletion need no bookkeeping. QuerySet.update() and bulk_create() bypass
+# the receiver.
+
+@receiver(post_save, sender=Message)
+def _message_created(sender, instance, created, **kwargs):
+    if created:
+        ChatSession.objects.filter(session_id=instance.session_id).update(
+            message_count=F("message_count") + 1,
+            last_message_at=instance.timestamp,
+        )
+
+
+def _session_stats(message_model) -> dict:
+    """UPDATE kwargs that recompute a session's counters from its messages."""
+    message_count = Subquery(
+        message_model.objects.filter(session_id=OuterRef("session_id"))
+        .order_by().values("session_id").annotate(n=Count("id")).values("n")
+    )
+    latest = Subquery(
+        message_model.objects.filter(session_id=OuterRef("session_id"))
+        .order_by("-timestamp").values("timestamp")[:1]
+    )
+    return {
+        "message_count": Coalesce(message_count, Value(0)),
+        "last_message_at": Coalesce(latest, F("created_at")),
+    }
+
+
+def refresh_session_stats(session_ids) -> int:
+    """Recompute the counters of the given sessions (by session_id) in one UPDATE."""
+    return ChatSession.objects.filter(session_id__in=set(session_ids)).update(**_session_stats(Message))
+
+
+def backfill_session_stats(session_model, message_model, batch_size: int = 1000, progress=None) -> int:
+    """
+    Recompute last_message_at and message_count from the message table in
+    id-ordered batches, one UPDATE per batch. The models are passed in so
+    migration 0012 can run this with its historical models;
+    progress(updated, last_id) is called after each batch. Returns the
+    number of sessions updated.
+    """
+    stats = _session_stats(message_model)
+    updated = 0
+    last_id = 0
+    while True:
+        ids = list(
+            session_model.objects.filter(id__gt=last_id)
+            .order_by("id").values_list("id", flat=True)[:batch_size]
+        )
+        if not ids:
+            return updated
+        updated += session_model.objects.filter(id__gte=ids[0], id__lte=ids[-1]).update(**stats)
+        last_id = ids[-1]
+        if progress is not None:
+            progress(updated, last_id)
+
+
+# ─── DailyUsage rebuilds ─────────────────────────────────────────────────────
+# The usage sink (chat/usage_sink.py), rebuild_daily_usage() and the usage
+# reset in views.usage_stats all take lock_users() first, so a rebuild's
+# aggregate, delete and re-insert never interleave with a live increment.
+
+def lock_users(user_model, user_ids) -> None:
+    """SELECT ... FOR NO KEY UPDATE the given users, in id order (no-op on SQLite)."""
+    list(
+        user_model.objects.select_for_update(no_key=True)
+        .filter(pk__in=user_ids).order_by("pk").values_list("pk", flat=True)
+    )
+
+
+def rebuild_daily_usage(usage_model, rollup_model, user_model, user_id) -> int:
+    """
+    Replace one user's DailyUsage buckets with a fresh aggregate of their
+    ModelUsage rows, in a single transaction. The models are passed in so
+    migration 0014 can seed the table with its historical models. Returns
+    the number of buckets written.
+    """
+    with transaction.atomic():
+        lock_users(user_model, [user_id])
+        grouped = (
+            usage_model.objects.filter(user_id=user_id)
+            .annotate(day=TruncDate("created_at"))
+            .values("day", "model_name", "mode", "cached")
+            .annotate(calls=Count("id"), inp=Sum("input_tokens"), out=Sum("output_tokens"))
+            .order_by()
+        )
+        rollups = [
+            rollup_model(
+                user_id=user_id, day=g["day"], model_name=g["model_name"], mode=g["mode"],
+                cached=g["cached"], calls=g["calls"], input_tokens=g["inp"], output_tokens=g["out"],
+            )
+            for g in grouped
+        ]
+        rollup_model.objects.filter(user_id=user_id).delete()
+        rollup_model.objects.bulk_create(rollups, batch_size=1000)
+    return len(rollups)
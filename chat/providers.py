@@ -0,0 +1,66 @@
+# chat/providers.py
+"""
+Lazy handles for the provider SDKs used by chat/views.py and
+chat/async_views.py.
+
+google.generativeai (gRPC + protobuf) and openai (pydantic models for the
+whole API surface) used to be imported — and Gemini configured — when
+chat.views was loaded, which backend.urls does in every worker and every
+manage.py command. Together that was over half of the boot time. Each SDK is
+now imported on first attribute access instead:
+
+    from .providers import genai, openai
+
+    genai.GenerativeModel(...)          # imports + configures Gemini once
+    except openai.APIStatusError: ...   # imports openai only when evaluated
+
+Pooled OpenAI/Anthropic clients still come from chat.clients, which imports
+those SDKs inside get_client(). cloudinary.uploader stays a plain import: the
+cloudinary_storage app loads it during django.setup() anyway.
+
+`python manage.py importtime_report` measures what is left of the boot cost.
+"""
+import importlib
+import os
+import threading
+
+
+class LazySDK:
+    """Module proxy that imports `name` (and runs `setup(module)`) on first use."""
+
+    def __init__(self, name: str, setup=None):
+        self._name = name
+        self._setup = setup
+        self._module = None
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self) -> bool:
+        return self._module is not None
+
+    def load(self):
+        module = self._module
+        if module is None:
+            with self._lock:
+                if self._module is None:
+                    module = importlib.import_module(self._name)
+                    if self._setup is not None:
+                        self._setup(module)
+                    self._module = module
+                module = self._module
+        return module
+
+    def __getattr__(self, attr):
+        return getattr(self.load(), attr)
+
+    def __repr__(self):
+        state = "loaded" if self.loaded else "not loaded"
+        return f"<LazySDK {self._name} ({state})>"
+
+
+def _configure_gemini(module) -> None:
+    module.configure(api_key=os.getenv("GOOGLE_API_KEY"))
+
+
+genai = LazySDK("google.generativeai", setup=_configure_gemini)
+openai = LazySDK("openai")
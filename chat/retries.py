@@ -0,0 +1,119 @@
+# chat/retries.py
+"""
+Backoff and retry budgets for upstream LLM errors (views._retry_plan).
+
+Backoff is jittered so that workers hit by the same 429/503 do not retry in
+lock-step:
+
+    provider sent Retry-After   that value plus up to 10 %
+    otherwise                   uniform(0, base_delay * 2**attempt)  ("full jitter")
+
+Where the wait happens depends on the path:
+
+    async views   asyncio.sleep — the event loop keeps serving, so waits of
+                  up to MAX_DELAY seconds are taken
+    DRF views     blind backoff is capped at MAX_INLINE_DELAY; a longer wait
+                  demanded by the provider is not slept in the worker thread
+                  but handed back to the client as 429 + Retry-After
+
+Each provider also has a retry budget: within a BUDGET_WINDOW-second window
+at most BUDGET_MIN + BUDGET_RATIO x requests retries are allowed, so a
+provider outage cannot multiply our own traffic against it.
+
+Retries, budget refusals and hand-offs are counted in chat/metrics.py
+(llm.retry.<provider>, llm.retry_budget_exhausted.<provider>,
+llm.retry_handed_off.<provider>).
+"""
+import os
+import random
+import threading
+import time
+from collections import deque
+
+from . import metrics
+
+MAX_DELAY = float(os.getenv("LLM_RETRY_MAX_DELAY", 20))                 # seconds, async path
+MAX_INLINE_DELAY = float(os.getenv("LLM_RETRY_MAX_INLINE_DELAY", 1.0))  # seconds, thread path
+BUDGET_RATIO = float(os.getenv("LLM_RETRY_BUDGET_RATIO", 0.2))
+BUDGET_MIN = int(os.getenv("LLM_RETRY_BUDGET_MIN", 5))
+BUDGET_WINDOW = 60.0   # seconds
+
+
+def backoff(attempt: int, base_delay: float, retry_after: float = 0, cap: float = None) -> float:
+    """Jittered delay before retry number attempt + 1 (attempt is 0-based)."""
+    if retry_after:
+        return retry_after + random.uniform(0, 0.1 * retry_after)
+    ceiling = base_delay * (2 ** attempt)
+    if cap is not None:
+        ceiling = min(ceiling, cap)
+    return random.uniform(0, ceiling)
+
+
+class RetryBudget:
+    """Sliding-window count of requests and retries for one provider."""
+
+    def __init__(self):
+        self._requests = deque()
+        self._retries = deque()
+        self._lock = threading.Lock()
+
+    def _trim(self, now: float) -> None:
+        for events in (self._requests, self._retries):
+            while events and events[0] <= now - BUDGET_WINDOW:
+                events.popleft()
+
+    def record_request(self) -> None:
+        now = time.monotonic()
+        with self._lock:
+            self._trim(now)
+            self._requests.append(now)
+
+    def withdraw(self) -> bool:
+        """Claim one retry; False when the budget is spent."""
+        now = time.monotonic()
+        with self._lock:
+            self._trim(now)
+            if len(self._retries) >= BUDGET_MIN + BUDGET_RATIO * len(self._requests):
+                return False
+            self._retries.append(now)
+            return True
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            self._trim(time.monotonic())
+            requests, used = len(self._requests), len(self._retries)
+        return {
+            "requests": requests,
+            "retries": used,
+            "remaining": max(0, int(BUDGET_MIN + BUDGET_RATIO * requests) - used),
+        }
+
+
+_budgets: dict = {}
+_budgets_lock = threading.Lock()
+
+
+def budget(provider: str) -> RetryBudget:
+    b = _budgets.get(provider)
+    if b is None:
+        with _budgets_lock:
+            b = _budgets.setdefault(provider, RetryBudget())
+    return b
+
+
+def allow_retry(provider: str) -> bool:
+    if budget(provider).withdraw():
+        metrics.incr(f"llm.retry.{provider}")
+        return True
+    metrics.incr(f"llm.retry_budget_exhausted.{provider}")
+    return False
+
+
+def stats() -> dict:
+    """{provider: budget snapshot over the last BUDGET_WINDOW seconds}."""
+    return {provider: b.snapshot() for provider, b in sorted(_budgets.items())}
+
+
+def reset() -> None:
+    with _budgets_lock:
+        _budgets.clear()
@@ -0,0 +1,173 @@
+# chat/retrieval.py
+"""
+Chunked BM25 retrieval over the documents uploaded to an OCR session.
+
+OcrUploadView indexes each document's extracted text once, at upload time:
+
+    chunk_text()   splits it into ~CHUNK_CHARS windows that overlap by
+                   CHUNK_OVERLAP and prefer paragraph / sentence breaks
+    build_index()  an inverted index {term: [[chunk, tf], ...]} plus chunk
+                   lengths and the offsets of the "--- Page N ---" markers
+                   the extraction prompt asks for, stored as a DocumentIndex
+                   row next to the document's Message (spans only — chunk
+                   text is sliced from Message.content, never duplicated)
+
+A session is a corpus of such documents. For every question,
+search_corpus() scores the chunks of all of them with Okapi BM25 — document
+frequencies and lengths are combined across the corpus, so scores are
+comparable between documents — and only the TOP_K best go into the Gemini
+prompt, each labelled with its document and page(s) for citation. Prompt
+size depends on the question, not on how many or how long the documents
+are. Everything runs in-process; there is no external search service.
+
+Documents uploaded before the index existed are indexed on their first
+question (session_corpus()).
+"""
+import math
+import os
+import re
+from collections import Counter
+
+from .models import DocumentIndex, Message
+
+CHUNK_CHARS = int(os.getenv("OCR_CHUNK_CHARS", 1500))
+CHUNK_OVERLAP = int(os.getenv("OCR_CHUNK_OVERLAP", 200))
+TOP_K = int(os.getenv("OCR_TOP_K", 6))
+
+_K1 = 1.5
+_B = 0.75
+
+_WORD = re.compile(r"\w+", re.UNICODE)
+_STOPWORDS = frozenset("""
+    a an and are as at be by for from has have in is it its of on or that the this to was were
+    what when where which who why how with does did do can i you he she we they
+""".split())
+# Preferred split points, best first, searched for in the last third of a window
+_BREAKS = ("\n\n", "\n", ". ", " ")
+# Page separator requested from Gemini in _gemini_extract_text_from_file
+_PAGE_MARKER = re.compile(r"^-{3}\s*Page\s+(\d+)\s*-{3}\s*$", re.MULTILINE | re.IGNORECASE)
+
+
+def tokenize(text: str) -> list[str]:
+    return [w for w in _WORD.findall(text.lower()) if w not in _STOPWORDS]
+
+
+def chunk_text(text: str, size: int = None, overlap: int = None) -> list[tuple[int, int]]:
+    """[(start, end)] character spans covering `text`, each at most `size` long."""
+    size = size or CHUNK_CHARS
+    overlap = CHUNK_OVERLAP if overlap is None else overlap
+    spans = []
+    start, n = 0, len(text)
+    while start < n:
+        end = min(start + size, n)
+        if end < n:
+            for sep in _BREAKS:
+                cut = text.rfind(sep, start + size * 2 // 3, end)
+                if cut != -1:
+                    end = cut + len(sep)
+                    break
+        spans.append((start, end))
+        if end >= n:
+            break
+        start = max(end - overlap, start + 1)
+    return spans
+
+
+def build_index(text: str) -> dict:
+    """{"spans", "lengths", "postings", "pages"} for `text` — JSON-serialisable."""
+    spans = chunk_text(text)
+    postings: dict = {}
+    lengths = []
+    for i, (start, end) in enumerate(spans):
+        terms = Counter(tokenize(text[start:end]))
+        lengths.append(sum(terms.values()))
+        for term, tf in terms.items():
+            postings.setdefault(term, []).append([i, tf])
+    pages = [[m.start(), int(m.group(1))] for m in _PAGE_MARKER.finditer(text)]
+    return {"spans": [list(s) for s in spans], "lengths": lengths, "postings": postings, "pages": pages}
+
+
+def chunk_pages(index: dict, chunk: int) -> list[int]:
+    """Page numbers a chunk overlaps ([] when the document has no page markers)."""
+    start, end = index["spans"][chunk]
+    pages = index.get("pages") or []
+    if not pages:
+        return []
+    first = pages[0][1]
+    covered = []
+    for offset, page in pages:
+        if offset <= start:
+            first = page
+        elif offset < end:
+            covered.append(page)
+    return [first, *covered]
+
+
+def search_corpus(indexes: dict, query: str, k: int = None) -> list[tuple]:
+    """
+    The k best (doc_key, chunk) pairs for `query` across {doc_key: index},
+    grouped by document (in `indexes` order) and in document order within
+    each. Falls back to the first chunks when no query term occurs anywhere.
+    """
+    k = k or TOP_K
+    candidates = [(key, c) for key, index in indexes.items() for c in range(len(index["lengths"]))]
+    if len(candidates) <= k:
+        return candidates
+    n = len(candidates)
+    avgdl = (sum(sum(index["lengths"]) for index in indexes.values()) / n) or 1
+    scores: dict = {}
+    for term in set(tokenize(query)):
+        hits = [(key, index, index["postings"].get(term)) for key, index in indexes.items()]
+        hits = [(key, index, postings) for key, index, postings in hits if postings]
+        df = sum(len(postings) for _, _, postings in hits)
+        if not df:
+            continue
+        idf = math.log(1 + (n - df + 0.5) / (df + 0.5))
+        for key, index, postings in hits:
+            for chunk, tf in postings:
+                norm = tf + _K1 * (1 - _B + _B * index["lengths"][chunk] / avgdl)
+                scores[(key, chunk)] = scores.get((key, chunk), 0.0) + idf * tf * (_K1 + 1) / norm
+    order = {key: i for i, key in enumerate(indexes)}
+    if not scores:
+        best = candidates[:k]
+    else:
+        best = sorted(scores, key=lambda kc: (-scores[kc], order[kc[0]], kc[1]))[:k]
+    return sorted(best, key=lambda kc: (order[kc[0]], kc[1]))
+
+
+def search(index: dict, query: str, k: int = None) -> list[int]:
+    """Indices of the k best chunks of a single document, in document order."""
+    return [chunk for _, chunk in search_corpus({0: index}, query, k)]
+
+
+def excerpt(text: str, index: dict, chunk: int) -> str:
+    start, end = index["spans"][chunk]
+    return text[start:end].strip()
+
+
+def index_document(message) -> DocumentIndex:
+    """Build and store the DocumentIndex for an OCR document Message."""
+    data = build_index(message.content)
+    doc_index, _ = DocumentIndex.objects.update_or_create(message=message, defaults={"data": data})
+    return doc_index
+
+
+def session_corpus(session_id: str) -> list[tuple]:
+    """
+    [(document Message, index data)] for every document uploaded to an OCR
+    session, oldest first. Message.content is deferred — it is only loaded
+    for documents a chunk is actually taken from (or that still need
+    indexing).
+    """
+    documents = list(
+        Message.objects.filter(session_id=session_id, mode="ocr", role="system")
+        .defer("content")
+        .order_by("timestamp", "id")
+    )
+    indexes = dict(
+        DocumentIndex.objects.filter(message__in=documents).values_list("message_id", "data")
+    )
+    return [
+        (doc, indexes[doc.id] if doc.id in indexes else index_document(doc).data)
+        for doc in documents
+    ]
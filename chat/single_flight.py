@@ -0,0 +1,115 @@
+# chat/single_flight.py
+"""
+Request coalescing ("single-flight") for the paid LLM endpoints.
+
+A double-click or a client retry used to start a second MultiDebugView run
+(four paid calls) while the first was still in progress. Requests are now
+keyed on the client's Idempotency-Key header — or, when it is absent, on the
+user + a hash of the request body — and:
+
+  * the first request with a key runs normally (the "leader");
+  * concurrent duplicates wait for the leader and receive its response,
+    polling with exponential backoff (POLL_INTERVAL doubling up to
+    MAX_POLL_INTERVAL);
+  * a leader running for longer than STALE_AFTER (the slowest possible
+    multi-debug run) is presumed dead — its duplicates stop waiting and make
+    their own call, so a follower never holds a worker longer than one run;
+  * a completed 200 response is replayed for REPLAY_TTL seconds
+    (FALLBACK_REPLAY_TTL when the key is only a payload hash, so a user can
+    deliberately resend the same message a moment later).
+
+State lives in the Django cache (cache.add is atomic), so duplicates are
+coalesced across workers, not just threads of one process.
+"""
+import hashlib
+import json
+import time
+
+from django.core.cache import cache
+
+REPLAY_TTL = 10 * 60        # seconds a result is replayable for an explicit Idempotency-Key
+FALLBACK_REPLAY_TTL = 15    # seconds, for payload-hash keys (covers double-clicks and quick retries)
+# Worst-case multi-debug run: the specialists (views._AGENT_TIMEOUT, 120 s),
+# then the synthesizer failing over across its two providers
+# (2 × views._PROVIDER_TIMEOUT, 180 s), plus 30 s for saving and slack.
+STALE_AFTER = 330           # seconds; a slower leader is not waited for
+_INFLIGHT_TTL = 360         # leader marker lifetime — must outlast STALE_AFTER
+POLL_INTERVAL = 0.25        # first pause between polls, doubled after each one ...
+MAX_POLL_INTERVAL = 4.0     # ... up to this
+
+_MAX_HEADER_LEN = 255
+
+
+def flight_key(scope: str, request) -> tuple[str, int]:
+    """
+    (key, replay_ttl) for a request. Keys are always per user, so one user's
+    Idempotency-Key can never replay another user's response.
+    """
+    idem = (request.META.get("HTTP_IDEMPOTENCY_KEY") or "").strip()[:_MAX_HEADER_LEN]
+    if idem:
+        basis, ttl = f"idem:{idem}", REPLAY_TTL
+    else:
+        body = json.dumps(dict(request.data), sort_keys=True, default=str)
+        basis, ttl = f"body:{body}", FALLBACK_REPLAY_TTL
+    digest = hashlib.sha256(basis.encode("utf-8")).hexdigest()
+    return f"sf:{scope}:{request.user.pk}:{digest}", ttl
+
+
+def _result_key(key: str) -> str:
+    return f"{key}:result"
+
+
+def begin(key: str) -> tuple[bool, dict | None]:
+    """
+    Try to become the leader for `key`.
+    Returns (True, None) for the leader, (False, result) when a finished
+    result can be replayed, and (False, None) when another request is running.
+    """
+    done = cache.get(_result_key(key))
+    if done is not None:
+        return False, done
+    if cache.add(key, time.time(), timeout=_INFLIGHT_TTL):
+        return True, None
+    return False, None
+
+
+def finish(key: str, ttl: int, data: dict = None, status: int = 200) -> None:
+    """Leader only: publish the response (when `data` is given) and release the key."""
+    if data is not None:
+        cache.set(_result_key(key), {"data": data, "status": status}, timeout=ttl)
+    cache.delete(key)
+
+
+def poll(key: str) -> tuple[str, dict | None]:
+    """("done", result) | ("running", None) | ("gone", None) — the leader
+    finished without a replayable result (an error) or its marker expired —
+    | ("stale", None) — the leader has been running for over STALE_AFTER."""
+    done = cache.get(_result_key(key))
+    if done is not None:
+        return "done", done
+    started = cache.get(key)
+    if started is None:
+        return "gone", None
+    if time.time() - started > STALE_AFTER:
+        return "stale", None
+    return "running", None
+
+
+def backoff():
+    """Pauses between polls: POLL_INTERVAL, doubling up to MAX_POLL_INTERVAL."""
+    delay = POLL_INTERVAL
+    while True:
+        yield delay
+        delay = min(delay * 2, MAX_POLL_INTERVAL)
+
+
+def wait(key: str) -> tuple[str, dict | None]:
+    """Block until the leader finishes or goes stale. Returns poll()'s final answer."""
+    deadline = time.monotonic() + STALE_AFTER
+    for delay in backoff():
+        state, result = poll(key)
+        if state != "running":
+            return state, result
+        if time.monotonic() >= deadline:
+            return "stale", None
+        time.sleep(delay)
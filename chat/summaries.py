@@ -0,0 +1,131 @@
+# chat/summaries.py
+"""
+Rolling conversation summaries for long chat sessions.
+
+Once a session has more than SUMMARY_KEEP_RECENT + SUMMARY_EVERY_MESSAGES
+unsummarized messages, a background thread folds everything except the most
+recent SUMMARY_KEEP_RECENT messages into ChatSession.summary and advances
+ChatSession.summary_through_id. _prepare_chat_turn then sends
+
+    [summary as a system message] + messages newer than summary_through_id
+
+so the prompt stays bounded no matter how long the session grows.
+"""
+import logging
+import threading
+
+from django.core.cache import cache
+from django.db import close_old_connections
+
+from .context import estimate_tokens
+from .models import ChatSession, Message
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_EVERY_MESSAGES = 20    # refresh after ~10 new turns
+SUMMARY_KEEP_RECENT = 12       # always left verbatim at the end of the prompt
+_FOLD_BATCH_TOKENS = 12_000    # max transcript folded per refresh (old sessions catch up over several turns)
+_SUMMARY_MAX_TOKENS = 600
+_LOCK_TTL = 300                # seconds — cross-worker guard against duplicate refreshes
+
+_SUMMARY_PROMPT = (
+    "You maintain a running summary of a conversation between a user and an AI assistant. "
+    "Merge the new messages into the existing summary. Preserve facts, decisions, user "
+    "preferences, names, code identifiers and open questions; drop small talk. "
+    "Write in the third person, at most about 300 words. Output only the updated summary."
+)
+
+
+def summary_message(summary: str) -> dict:
+    """Prompt prefix that stands in for the summarized part of the history."""
+    return {
+        "role": "system",
+        "content": f"Summary of the earlier part of this conversation:\n{summary}",
+    }
+
+
+def maybe_schedule_summary(session: ChatSession, mode: str) -> None:
+    """
+    Start a background refresh if enough unsummarized messages have piled up.
+    Cheap to call after every turn: one LIMITed COUNT query.
+    """
+    threshold = SUMMARY_KEEP_RECENT + SUMMARY_EVERY_MESSAGES
+    pending = Message.objects.filter(session_id=session.session_id, mode=mode)
+    if session.summary_through_id:
+        pending = pending.filter(id__gt=session.summary_through_id)
+    if pending.values("id")[:threshold + 1].count() <= threshold:
+        return
+
+    # cache.add is atomic — only one worker refreshes a given session at a time
+    lock_key = f"summary-lock:{session.session_id}"
+    if not cache.add(lock_key, 1, timeout=_LOCK_TTL):
+        return
+    _spawn(session.session_id, mode, lock_key)
+
+
+def _spawn(session_id: str, mode: str, lock_key: str) -> None:
+    def _run():
+        try:
+            refresh_summary(session_id, mode)
+        except Exception:
+            logger.exception("Summary refresh failed for session %s", session_id)
+        finally:
+            cache.delete(lock_key)
+            close_old_connections()
+
+    threading.Thread(target=_run, daemon=True).start()
+
+
+def refresh_summary(session_id: str, mode: str) -> None:
+    """Fold the oldest unsummarized messages (all but the recent tail) into the summary."""
+    from .views import _record_usage, _summary_completion, _chat_model_for
+
+    session = ChatSession.objects.filter(session_id=session_id).first()
+    if not session:
+        return
+
+    qs = Message.objects.filter(session_id=session_id, mode=mode).exclude(role="system")
+    if session.summary_through_id:
+        qs = qs.filter(id__gt=session.summary_through_id)
+    rows = list(qs.order_by("id").values("id", "role", "content"))
+    foldable = rows[:-SUMMARY_KEEP_RECENT] if len(rows) > SUMMARY_KEEP_RECENT else []
+    if not foldable:
+        return
+
+    model = _chat_model_for(mode)
+    batch, used = [], 0
+    for row in foldable:
+        cost = estimate_tokens(model, row["content"])
+        if batch and used + cost > _FOLD_BATCH_TOKENS:
+            break
+        batch.append(row)
+        used += cost
+
+    transcript = "\n\n".join(f"{row['role'].upper()}: {row['content']}" for row in batch)
+    prompt = [
+        {"role": "system", "content": _SUMMARY_PROMPT},
+        {"role": "user", "content": (
+            f"Existing summary:\n{session.summary or '(none yet)'}\n\n"
+            f"New messages:\n{transcript}"
+        )},
+    ]
+    text, in_tok, out_tok = _summary_completion(mode, prompt, _SUMMARY_MAX_TOKENS)
+    if session.user_id:
+        _record_usage(session.user, model, in_tok, out_tok, mode=mode)
+    if not text:
+        return
+
+    # Only advance if nobody reset the summary meanwhile (e.g. an edit that
+    # trimmed messages already folded in).
+    ChatSession.objects.filter(
+        session_id=session_id,
+        summary_through_id=session.summary_through_id,
+    ).update(summary=text, summary_through_id=batch[-1]["id"])
+
+
+def invalidate_summary(session_id: str, trim_from_id: int) -> None:
+    """Drop the summary if an edit removed messages it already covers."""
+    ChatSession.objects.filter(
+        session_id=session_id,
+        summary_through_id__gte=trim_from_id,
+    ).update(summary="", summary_through_id=None)
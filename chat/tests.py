@@ -1,3 +1,1180 @@
-from django.test import TestCase
+import json
+from io import StringIO
+from types import SimpleNamespace
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.test import SimpleTestCase, TestCase, TransactionTestCase
+
+from . import llm_cache
+from .models import Message, ModelUsage
+
+
+def _chunk(text=None, usage=None):
+    """Build a fake OpenAI-compatible stream chunk."""
+    choices = [SimpleNamespace(delta=SimpleNamespace(content=text))] if text is not None else []
+    return SimpleNamespace(choices=choices, usage=usage)
+
+
+class _VerifiedUserMixin:
+    def setUp(self):
+        self.user = User.objects.create_user("alice", "alice@example.com", "Passw0rd!")
+        self.user.profile.email_verified = True
+        self.user.profile.save()
+        self.client.force_login(self.user)
+
+
+class ChatStreamViewTests(_VerifiedUserMixin, TestCase):
+
+    def _post(self, **body):
+        return self.client.post(
+            "/api/chat/stream/",
+            {"message": "hello there", **body},
+            content_type="application/json",
+            HTTP_ACCEPT="text/event-stream",
+        )
+
+    def test_streams_deltas_and_persists_turn(self):
+        fake = [
+            _chunk("Hel"),
+            _chunk("lo!"),
+            _chunk(usage=SimpleNamespace(prompt_tokens=12, completion_tokens=3)),
+        ]
+        with mock.patch("chat.views._open_chat_stream", return_value=(iter(fake), "mistral-test")):
+            resp = self._post()
+            body = b"".join(resp.streaming_content).decode()
+
+        self.assertEqual(resp["Content-Type"], "text/event-stream")
+        self.assertIn('event: delta\ndata: {"text": "Hel"}', body)
+        self.assertIn("event: done", body)
+        self.assertEqual(
+            list(Message.objects.values_list("role", "content")),
+            [("user", "hello there"), ("assistant", "Hello!")],
+        )
+        usage = ModelUsage.objects.get()
+        self.assertEqual((usage.input_tokens, usage.output_tokens), (12, 3))
+
+    def test_validation_error_is_sent_as_sse_error_frame(self):
+        resp = self._post(message="")
+        self.assertEqual(resp.status_code, 400)
+        self.assertTrue(resp.content.startswith(b"event: error\n"))
+        self.assertFalse(Message.objects.exists())
+
+
+class AsyncChatViewTests(_VerifiedUserMixin, TestCase):
+
+    async def test_async_chat_reuses_sync_helpers_and_persists(self):
+        from django.test import AsyncRequestFactory
+        from . import async_views
+
+        request = AsyncRequestFactory().post(
+            "/api/chat/", {"message": "hi async"}, content_type="application/json",
+        )
+
+        async def _auser():
+            return self.user
+        request.auser = _auser
+
+        async def _reply(mode, messages):
+            self.assertEqual(messages[-1], {"role": "user", "content": "hi async"})
+            return "async reply", 5, 2, "mistral-test"
+
+        with mock.patch.object(async_views, "_achat_reply", _reply):
+            resp = await async_views.chat(request)
+
+        self.assertEqual(resp.status_code, 200)
+        contents = [c async for c in Message.objects.order_by("id").values_list("content", flat=True)]
+        self.assertEqual(contents, ["hi async", "async reply"])
+
+    async def test_async_uncensored_chat_bills_the_openrouter_model(self):
+        from django.test import AsyncRequestFactory
+        from . import async_views, failover
+        from .views import UNCENSORED_MODEL
+
+        failover.reset()
+        request = AsyncRequestFactory().post(
+            "/api/chat/", {"message": "hi", "mode": "uncensored"}, content_type="application/json",
+        )
+
+        async def _auser():
+            return self.user
+        request.auser = _auser
+
+        async def _create(**kwargs):
+            return SimpleNamespace(
+                choices=[SimpleNamespace(message=SimpleNamespace(content="uncensored reply"))],
+                usage=SimpleNamespace(prompt_tokens=7, completion_tokens=3),
+            )
+        client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=_create)))
+
+        with mock.patch.object(async_views, "_uncensored_async_client", return_value=client):
+            resp = await async_views.chat(request)
+
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(json.loads(resp.content)["reply"], "uncensored reply")
+        usage = await ModelUsage.objects.aget()
+        self.assertEqual((usage.model_name, usage.input_tokens), (UNCENSORED_MODEL, 7))
+
+
+class ClientRegistryTests(SimpleTestCase):
+
+    def test_clients_are_shared_per_provider_url_and_key(self):
+        from .clients import get_client
+
+        a = get_client("mistral", "key-1", "https://example.invalid/v1")
+        self.assertIs(a, get_client("mistral", "key-1", "https://example.invalid/v1"))
+        self.assertIsNot(a, get_client("mistral", "key-2", "https://example.invalid/v1"))
+        self.assertIsNot(a, get_client("mistral", "key-1", "https://example.invalid/v1", is_async=True))
+
+
+class BuildContextTests(SimpleTestCase):
+
+    def test_keeps_newest_history_that_fits_and_reserves_reply(self):
+        from . import context
+
+        limits = {"regular": {"window": 100, "reply": 40}}
+        history = iter([{"role": "assistant", "content": "x" * 72}] * 5)  # 20+4 tokens each
+        with mock.patch.dict(context.CONTEXT_LIMITS, limits):
+            messages, truncated = context.build_context(
+                "mistral-small", "regular", history, {"role": "user", "content": "hi"},
+            )
+        # budget 60: current (1+4) + two history messages (24 each) = 53
+        self.assertEqual(len(messages), 3)
+        self.assertEqual(messages[-1]["content"], "hi")
+        self.assertTrue(truncated)
+        # stopped at the first message that did not fit; the rest were never read
+        self.assertEqual(len(list(history)), 2)
+
+    def test_registered_estimator_takes_precedence(self):
+        from . import context
+
+        with mock.patch.object(context, "_TOKEN_ESTIMATORS", list(context._TOKEN_ESTIMATORS)):
+            context.register_token_estimator("mistral", lambda text: 7)
+            self.assertEqual(context.estimate_tokens("mistral-medium-latest", "anything"), 7)
+
+
+class RollingSummaryTests(_VerifiedUserMixin, TestCase):
+
+    def test_old_turns_are_folded_and_replaced_by_summary(self):
+        from . import summaries
+        from .models import ChatSession
+
+        session = ChatSession.objects.create(session_id="s1", mode="regular", user=self.user)
+        total = summaries.SUMMARY_KEEP_RECENT + summaries.SUMMARY_EVERY_MESSAGES + 2
+        for i in range(total):
+            Message.objects.create(session=session, mode="regular",
+                                   role="user" if i % 2 == 0 else "assistant", content=f"m{i}")
+
+        with mock.patch.object(summaries, "_spawn") as spawn:
+            summaries.maybe_schedule_summary(session, "regular")
+        spawn.assert_called_once()
+
+        with mock.patch("chat.views._summary_completion", return_value=("the gist", 50, 10)):
+            summaries.refresh_summary("s1", "regular")
+        session.refresh_from_db()
+        self.assertEqual(session.summary, "the gist")
+
+        captured = {}
+
+        def _reply(messages):
+            captured["messages"] = messages
+            return "ok", 1, 1
+
+        with mock.patch("chat.views._mistral_chat_reply", side_effect=_reply), \
+                mock.patch.object(summaries, "_spawn"):
+            self.client.post("/api/chat/", {"message": "next", "session_id": "s1"},
+                             content_type="application/json")
+
+        sent = captured["messages"]
+        self.assertEqual(sent[0]["role"], "system")
+        self.assertIn("the gist", sent[0]["content"])
+        # summary + the verbatim recent tail + the new message
+        self.assertEqual(len(sent), 1 + summaries.SUMMARY_KEEP_RECENT + 1)
+
+
+class LlmCacheTests(_VerifiedUserMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        llm_cache.clear()
+
+    def test_repeated_debug_input_is_served_from_cache(self):
+        from . import views
+
+        agents = {
+            "_agent_mistral_logic_analyst": ("logic ok", 10, 5),
+            "_agent_mistral_syntax_inspector": ("syntax ok", 10, 5),
+            "_agent_gemini_perf_security": ("[Perf unavailable: quota]", 0, 0),
+        }
+        patches = [mock.patch.object(views, name, return_value=value) for name, value in agents.items()]
+        for p in patches:
+            p.start()
+            self.addCleanup(p.stop)
+
+        views._run_agents_parallel("free", "def f():  \r\n  return 1")
+        results, usage = views._run_agents_parallel("free", "def f():\n  return 1")
+
+        self.assertEqual(views._agent_mistral_logic_analyst.call_count, 1)
+        self.assertEqual(results["logic_analyst"], "logic ok")
+        self.assertTrue(usage["logic_analyst"][3])
+        # failures are never cached
+        self.assertEqual(views._agent_gemini_perf_security.call_count, 2)
+        self.assertFalse(usage["perf_security_auditor"][3])
+
+    def test_usage_stats_reports_cache_hits_separately(self):
+        from .views import REGULAR_MODEL, _record_usage
+
+        _record_usage(self.user, REGULAR_MODEL, 1000, 500)
+        _record_usage(self.user, REGULAR_MODEL, 1000, 500, cached=True)
+
+        data = self.client.get("/api/usage/").json()
+        self.assertEqual(data["total_tokens"], 1500)
+        self.assertEqual(data["cache"]["hits"], 1)
+        self.assertEqual(data["cache"]["tokens_saved"], 1500)
+
+
+class UsageRollupTests(_VerifiedUserMixin, TestCase):
+
+    def test_stats_break_down_by_mode_and_date_range(self):
+        from datetime import timedelta
+        from django.core.management import call_command
+        from django.utils import timezone
+        from .models import DailyUsage
+        from .views import _record_usage
+
+        _record_usage(self.user, "mistral-small", 100, 10, mode="regular")
+        _record_usage(self.user, "mistral-small", 100, 10, mode="regular")
+        _record_usage(self.user, "gemini-2.5-flash", 50, 5, mode="ocr")
+        ModelUsage.objects.create(user=self.user, model_name="mistral-small", input_tokens=7,
+                                  mode="regular", created_at=timezone.now() - timedelta(days=3))
+        call_command("rebuild_usage_rollups", stdout=StringIO())
+        self.assertEqual(DailyUsage.objects.filter(user=self.user).count(), 3)
+
+        today = timezone.localdate().isoformat()
+        data = self.client.get("/api/usage/", {"from": today}).json()
+        modes = {m["mode"]: m for m in data["by_mode"]}
+        self.assertEqual(modes["regular"]["calls"], 2)
+        self.assertEqual(modes["regular"]["total_tokens"], 220)
+        self.assertEqual(modes["ocr"]["input_tokens"], 50)
+        self.assertEqual(data["total_tokens"], 275)
+
+        self.assertEqual(self.client.get("/api/usage/").json()["total_tokens"], 282)
+        self.assertEqual(self.client.get("/api/usage/", {"to": "nope"}).status_code, 400)
+
+
+class SingleFlightTests(_VerifiedUserMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        llm_cache.clear()
+
+    def _post(self, message, **headers):
+        return self.client.post("/api/multi-debug/", {"message": message},
+                                content_type="application/json", **headers)
+
+    def test_idempotency_key_replays_completed_result(self):
+        with mock.patch("chat.views._run_agents_parallel", return_value=({}, {})) as agents, \
+                mock.patch("chat.views._synthesize", return_value=("fixed", 1, 1, False, "mistral-test")):
+            code = "def add(a, b):\n    return a - b  # TypeError when called with None"
+            first = self._post(code, HTTP_IDEMPOTENCY_KEY="k1")
+            second = self._post(code, HTTP_IDEMPOTENCY_KEY="k1")
+            third = self._post(code, HTTP_IDEMPOTENCY_KEY="k2")
+
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(second.json(), first.json())
+        self.assertEqual(second["Idempotent-Replayed"], "true")
+        self.assertFalse(third.has_header("Idempotent-Replayed"))
+        self.assertEqual(agents.call_count, 2)
+        self.assertEqual(Message.objects.filter(role="user").count(), 2)
+
+    def test_stale_after_covers_a_full_multi_debug_run(self):
+        from . import single_flight, views
+
+        worst = views._AGENT_TIMEOUT + 2 * views._PROVIDER_TIMEOUT
+        self.assertGreater(single_flight.STALE_AFTER, worst)
+        self.assertGreater(single_flight._INFLIGHT_TTL, single_flight.STALE_AFTER)
+
+    def test_follower_backs_off_and_skips_a_stale_leader(self):
+        import time
+        from django.core.cache import cache
+        from . import single_flight
+
+        states = iter([("running", None)] * 6 + [("done", {"data": {}, "status": 200})])
+        with mock.patch.object(single_flight, "poll", side_effect=lambda key: next(states)), \
+                mock.patch("chat.single_flight.time.sleep") as sleep:
+            self.assertEqual(single_flight.wait("k")[0], "done")
+        self.assertEqual([c.args[0] for c in sleep.call_args_list], [0.25, 0.5, 1.0, 2.0, 4.0, 4.0])
+
+        code = "def f(x):\n    return x[0]  # IndexError on empty input"
+        with mock.patch("chat.views._run_agents_parallel", return_value=({}, {})) as agents, \
+                mock.patch("chat.views._synthesize", return_value=("fixed", 1, 1, False, "mistral-test")):
+            key, _ = single_flight.flight_key("multi-debug", SimpleNamespace(
+                META={"HTTP_IDEMPOTENCY_KEY": "k3"}, data={}, user=self.user))
+            cache.set(key, time.time() - single_flight.STALE_AFTER - 1)
+            resp = self._post(code, HTTP_IDEMPOTENCY_KEY="k3")
+
+        self.assertEqual(resp.status_code, 200)
+        self.assertFalse(resp.has_header("Idempotent-Replayed"))
+        self.assertEqual(agents.call_count, 1)
+        self.assertIsNotNone(cache.get(key))   # ran without taking over the leader's key
+
+
+class ChatHistoryCursorTests(_VerifiedUserMixin, TestCase):
+
+    def test_load_older_walks_back_without_gaps(self):
+        from .models import ChatSession
+        from .views import ChatHistoryView
+
+        session = ChatSession.objects.create(session_id="h1", user=self.user)
+        ids = [Message.objects.create(session=session, role="user", content=f"m{i}").id for i in range(120)]
+
+        seen, cursor = [], None
+        while True:
+            params = {"session_id": "h1", "direction": "older"}
+            if cursor:
+                params["cursor"] = cursor
+            data = self.client.get("/api/history/", params).json()
+            self.assertLessEqual(len(data["history"]), ChatHistoryView.PAGE_SIZE)
+            self.assertNotIn("total", data)
+            seen = [m["msg_id"] for m in data["history"]] + seen
+            if not data["has_more"]:
+                break
+            cursor = data["older_cursor"]
+
+        self.assertEqual(seen, ids)
+        bad = self.client.get("/api/history/", {"session_id": "h1", "cursor": "!!"})
+        self.assertEqual(bad.status_code, 400)
+
+
+class ExplainHotQueriesTests(_VerifiedUserMixin, TestCase):
+
+    def test_hot_queries_use_indexes(self):
+        from django.core.management import call_command
+        from .models import ChatSession
+
+        ChatSession.objects.create(session_id="e1", user=self.user)
+        out = StringIO()
+        call_command("explain_hot_queries", "--fail-on-seq-scan", stdout=out)
+        self.assertIn("session_corpus: session documents", out.getvalue())
+        self.assertIn("after the rolling summary", out.getvalue())
+
+
+class SessionActivityStatsTests(_VerifiedUserMixin, TestCase):
+
+    def test_counters_follow_creates_and_deletes(self):
+        from django.core.management import call_command
+        from .models import ChatSession, refresh_session_stats
+
+        older = ChatSession.objects.create(session_id="a1", user=self.user)
+        newer = ChatSession.objects.create(session_id="a2", user=self.user)
+        Message.objects.create(session=newer, role="user", content="hi")
+        msgs = [Message.objects.create(session=older, role="user", content=f"m{i}") for i in range(3)]
+
+        older.refresh_from_db()
+        self.assertEqual(older.message_count, 3)
+        self.assertEqual(older.last_message_at, msgs[-1].timestamp)
+        ids = [s["session_id"] for s in self.client.get("/api/sessions/").json()]
+        self.assertEqual(ids, ["a1", "a2"])
+
+        # collect, DocumentIndex cascade, DELETE, UPDATE — nothing per row
+        with self.assertNumQueries(4):
+            Message.objects.filter(session_id="a1", id__gte=msgs[1].id).delete()
+            refresh_session_stats(["a1"])
+        older.refresh_from_db()
+        self.assertEqual(older.message_count, 1)
+        self.assertEqual(older.last_message_at, msgs[0].timestamp)
+
+        ChatSession.objects.filter(pk=older.pk).update(message_count=99)
+        call_command("backfill_session_stats", stdout=StringIO())
+        older.refresh_from_db()
+        self.assertEqual(older.message_count, 1)
+
+
+class DataMigrationTests(TransactionTestCase):
+    """Data steps of migrations, run against rows created at the previous migration."""
+
+    def _migrate(self, target):
+        from django.db import connection
+        from django.db.migrations.executor import MigrationExecutor
+
+        executor = MigrationExecutor(connection)
+        executor.loader.build_graph()
+        executor.migrate([("chat", target)])
+        return executor.loader.project_state([("chat", target)]).apps
+
+    def _latest(self):
+        from django.db import connection
+        from django.db.migrations.loader import MigrationLoader
+
+        return MigrationLoader(connection).graph.leaf_nodes("chat")[0][1]
+
+    def tearDown(self):
+        self._migrate(self._latest())
+
+    def test_activity_stats_are_backfilled(self):
+        apps = self._migrate("0011_message_access_path_indexes")
+        Session, Msg = apps.get_model("chat", "ChatSession"), apps.get_model("chat", "Message")
+        busy = Session.objects.create(session_id="busy")
+        Session.objects.create(session_id="idle")
+        for i in range(3):
+            Msg.objects.create(session=busy, role="user", content=f"m{i}")
+        latest = Msg.objects.latest("timestamp").timestamp
+
+        apps = self._migrate("0012_chatsession_activity_stats")
+        Session = apps.get_model("chat", "ChatSession")
+        busy, idle = Session.objects.get(session_id="busy"), Session.objects.get(session_id="idle")
+        self.assertEqual((busy.message_count, busy.last_message_at), (3, latest))
+        self.assertEqual((idle.message_count, idle.last_message_at), (0, idle.created_at))
+
+    def test_daily_usage_is_seeded(self):
+        apps = self._migrate("0013_modelusage_created_at_default")
+        user = apps.get_model("auth", "User").objects.create(username="seeded")
+        Usage = apps.get_model("chat", "ModelUsage")
+        for tokens in (100, 20):
+            Usage.objects.create(user=user, model_name="m", input_tokens=tokens, output_tokens=1)
+
+        apps = self._migrate("0014_daily_usage_rollups")
+        bucket = apps.get_model("chat", "DailyUsage").objects.get(user_id=user.pk)
+        self.assertEqual((bucket.calls, bucket.input_tokens, bucket.output_tokens), (2, 120, 2))
+
+
+class UsageSinkTests(_VerifiedUserMixin, TestCase):
+
+    def test_buffered_rows_flush_in_bulk_and_survive_db_outage(self):
+        import os
+        import tempfile
+        from django.test import override_settings
+        from . import usage_sink
+
+        fallback = os.path.join(tempfile.mkdtemp(), "usage.jsonl")
+        with override_settings(USAGE_BUFFERED=True), \
+                mock.patch.object(usage_sink, "_ensure_flusher"), \
+                mock.patch.object(usage_sink, "FALLBACK_FILE", fallback):
+            usage_sink.record(self.user.pk, "m", 10, 5)
+            usage_sink.record(self.user.pk, "m", 1, 1, cached=True)
+            self.assertEqual(ModelUsage.objects.count(), 0)
+
+            with mock.patch.object(ModelUsage.objects, "bulk_create", side_effect=RuntimeError("db down")):
+                self.assertEqual(usage_sink.flush(), 0)
+            self.assertTrue(os.path.exists(fallback))
+
+            self.assertEqual(usage_sink.flush(), 2)
+        self.assertFalse(os.path.exists(fallback))
+        self.assertEqual(ModelUsage.objects.filter(cached=True).count(), 1)
+
+    def test_usage_reset_discards_rows_still_buffered(self):
+        from django.test import override_settings
+        from . import usage_sink
+
+        with override_settings(USAGE_BUFFERED=True), mock.patch.object(usage_sink, "_ensure_flusher"):
+            usage_sink.record(self.user.pk, "m", 10, 5)
+            self.assertEqual(self.client.delete("/api/usage/").status_code, 200)
+            usage_sink.record(self.user.pk, "m", 1, 1)
+            usage_sink.flush()
+        self.assertEqual(list(ModelUsage.objects.values_list("input_tokens", flat=True)), [1])
+
+    def test_bad_row_is_dropped_instead_of_parked(self):
+        import os
+        import tempfile
+        from django.db import IntegrityError
+        from django.test import override_settings
+        from . import usage_sink
+
+        real_bulk_create = ModelUsage.objects.bulk_create
+
+        def bulk_create(objs):
+            if any(o.user_id == 0 for o in objs):
+                raise IntegrityError("FOREIGN KEY constraint failed")
+            return real_bulk_create(objs)
+
+        fallback = os.path.join(tempfile.mkdtemp(), "usage.jsonl")
+        with override_settings(USAGE_BUFFERED=True), \
+                mock.patch.object(usage_sink, "_ensure_flusher"), \
+                mock.patch.object(usage_sink, "FALLBACK_FILE", fallback), \
+                mock.patch.object(ModelUsage.objects, "bulk_create", side_effect=bulk_create):
+            usage_sink.record(self.user.pk, "m", 10, 5)
+            usage_sink.record(0, "m", 1, 1)   # user deleted while the row was queued
+            usage_sink.record(self.user.pk, "m", 2, 2)
+            self.assertEqual(usage_sink.flush(), 2)
+
+            self.assertFalse(os.path.exists(fallback))
+
+            # A row that keeps failing is parked at most MAX_ATTEMPTS times
+            row = {"user_id": self.user.pk}
+            for _ in range(usage_sink.MAX_ATTEMPTS):
+                usage_sink._append_fallback([row])
+                with open(fallback) as f:
+                    row = json.loads(f.readline())
+                os.remove(fallback)
+            usage_sink._append_fallback([row])
+            self.assertFalse(os.path.exists(fallback))
+        self.assertEqual(ModelUsage.objects.count(), 2)
+
+
+class TieredCacheTests(TestCase):
+
+    def _worker(self, name):
+        from backend.cache import TieredCache
+        return TieredCache(name, {"OPTIONS": {
+            "SHARED": "shared", "LOCAL_PREFIXES": ["bans:"], "SYNC_INTERVAL": 0,
+        }})
+
+    def test_local_hits_skip_shared_and_deletes_invalidate_other_workers(self):
+        from django.core.cache import caches
+
+        a, b = self._worker("worker-a"), self._worker("worker-b")
+        a.add("bans:7", ["ocr"], 60)
+        self.assertEqual(b.get("bans:7"), ["ocr"])       # filled from the shared tier
+
+        with mock.patch.object(caches["shared"], "get", side_effect=AssertionError("shared read")):
+            self.assertEqual(b.get("bans:7"), ["ocr"])   # served locally
+
+        a.delete("bans:7")
+        self.assertIsNone(b.get("bans:7"))
+
+        a.add("rl:x", 0, 60)
+        self.assertEqual(b.incr("rl:x"), 1)             # counters stay shared
+
+
+class ProfileFlagsCacheTests(_VerifiedUserMixin, TestCase):
+
+    def test_admin_premium_revoke_is_not_served_stale(self):
+        from django.contrib.admin.sites import site
+        from accounts.admin import ProfileAdmin
+        from accounts.models import Profile
+        from accounts.utils import get_profile_flags
+
+        profile = Profile.objects.get(user=self.user)
+        profile.is_premium = True
+        profile.save()
+        self.assertTrue(get_profile_flags(self.user)["is_premium"])
+
+        admin = ProfileAdmin(Profile, site)
+        with mock.patch.object(admin, "message_user"):
+            admin.revoke_premium(None, Profile.objects.filter(user=self.user))
+        self.assertFalse(get_profile_flags(self.user)["is_premium"])
+
+
+class SlidingWindowLimiterTests(SimpleTestCase):
+
+    def setUp(self):
+        from backend import ratelimit
+        ratelimit._local_store.clear()
+
+    def test_previous_window_decays_into_the_current_one(self):
+        from backend.ratelimit import hit
+
+        t0 = 6000.0   # start of a 60 s window
+        self.assertEqual([hit("k", 3, 60, now=t0 + i)[0] for i in range(4)], [True, True, True, False])
+
+        # Half-way through the next window the previous 3 hits weigh 1.5
+        self.assertTrue(hit("k", 3, 60, now=t0 + 90)[0])
+        allowed, retry_after = hit("k", 3, 60, now=t0 + 90)
+        self.assertFalse(allowed)
+        self.assertEqual(retry_after, 10)   # 0.5 excess at 3 hits / 60 s
+
+
+class LazyProviderImportTests(SimpleTestCase):
+
+    def test_worker_boot_does_not_import_provider_sdks(self):
+        import subprocess
+        import sys
+
+        script = (
+            "import sys, django\n"
+            "django.setup()\n"
+            "import backend.urls, chat.async_views\n"
+            "print(sorted(m for m in ('google.generativeai', 'openai') if m in sys.modules))\n"
+        )
+        out = subprocess.run([sys.executable, "-c", script], capture_output=True, text=True, check=True)
+        self.assertEqual(out.stdout.strip(), "[]")
+
+    def test_sdk_is_imported_and_set_up_once(self):
+        from .providers import LazySDK
+
+        setup = mock.Mock()
+        sdk = LazySDK("json", setup=setup)
+        self.assertFalse(sdk.loaded)
+        self.assertEqual(sdk.dumps([1]), "[1]")
+        self.assertEqual(sdk.loads("2"), 2)
+        setup.assert_called_once()
+
+    def test_parse_importtime(self):
+        from .management.commands.importtime_report import parse_importtime
+
+        stderr = (
+            "import time: self [us] | cumulative | imported package\n"
+            "import time:       120 |        120 |   chat.providers\n"
+            "import time:       300 |        420 | chat.views\n"
+        )
+        self.assertEqual(parse_importtime(stderr), {
+            "chat.providers": (120, 120, 1),
+            "chat.views": (300, 420, 0),
+        })
+
+
+class ProviderFailoverTests(_VerifiedUserMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        from . import failover
+        failover.reset()
+        self.addCleanup(failover.reset)
+
+    def test_breaker_opens_skips_provider_and_recovers_after_cooldown(self):
+        from . import failover
+
+        chain = (("a", "model-a"), ("b", "model-b"))
+        calls = []
+
+        def call(provider, model):
+            calls.append(provider)
+            if provider == "a":
+                raise TimeoutError("upstream timed out")
+            return "ok"
+
+        for _ in range(failover.FAILURE_THRESHOLD):
+            self.assertEqual(failover.run(chain, call), ("ok", "b", "model-b"))
+        calls.clear()
+        self.assertEqual(failover.run(chain, call), ("ok", "b", "model-b"))
+        self.assertEqual(calls, ["b"])   # "a" skipped without a request
+        self.assertEqual(failover.health()["a"]["state"], "open")
+
+        with mock.patch.object(failover, "COOLDOWN", 0):
+            self.assertEqual(failover.run(chain, lambda p, m: p), ("a", "a", "model-a"))
+        self.assertEqual(failover.health()["a"]["state"], "closed")
+
+    def test_request_errors_do_not_trip_the_breaker(self):
+        from . import failover
+
+        bad_request = RuntimeError("context too long")
+        bad_request.status_code = 400
+        for _ in range(failover.FAILURE_THRESHOLD + 1):
+            with self.assertRaises(RuntimeError):
+                failover.run((("a", "m"),), mock.Mock(side_effect=bad_request))
+        self.assertEqual(failover.health()["a"]["state"], "closed")
+
+    def test_regular_chat_fails_over_and_bills_the_serving_model(self):
+        from .views import GEMINI_FREE_MODEL
+
+        with mock.patch("chat.views._mistral_chat_reply", side_effect=TimeoutError("mistral down")), \
+                mock.patch("chat.views._complete", return_value=("from gemini", 7, 3)) as complete:
+            resp = self.client.post("/api/chat/", {"message": "hello"}, content_type="application/json")
+
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.json()["reply"], "from gemini")
+        self.assertEqual(complete.call_args[0][:2], ("gemini", GEMINI_FREE_MODEL))
+        self.assertEqual(ModelUsage.objects.get().model_name, GEMINI_FREE_MODEL)
+
+    def test_all_breakers_open_returns_503_without_calling_providers(self):
+        from . import failover
+
+        for provider in ("mistral", "gemini"):
+            for _ in range(failover.FAILURE_THRESHOLD):
+                failover.breaker(provider).record_failure(TimeoutError())
+
+        with mock.patch("chat.views._mistral_chat_reply") as mistral:
+            resp = self.client.post("/api/chat/", {"message": "hello"}, content_type="application/json")
+
+        self.assertEqual(resp.status_code, 503)
+        self.assertGreaterEqual(int(resp["Retry-After"]), 1)
+        mistral.assert_not_called()
+        self.assertFalse(Message.objects.exists())
+
+
+class HedgedRequestTests(SimpleTestCase):
+
+    def setUp(self):
+        from . import hedging, metrics
+        metrics.reset()
+        self.addCleanup(metrics.reset)
+        for name, value in {"DEFAULT_DELAY": 0.05, "MAX_RATE": 1.0, "_cap": hedging._RateCap()}.items():
+            patcher = mock.patch.object(hedging, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    @staticmethod
+    def _slow(attempt):
+        import time
+        for _ in range(200):
+            attempt.check()
+            time.sleep(0.01)
+        return "primary"
+
+    @staticmethod
+    def _fast(attempt):
+        attempt.token()
+        return "hedge"
+
+    def test_late_primary_is_hedged_and_loser_cancelled(self):
+        from . import hedging, metrics
+
+        primary = {}
+
+        def slow(attempt):
+            primary["attempt"] = attempt
+            return self._slow(attempt)
+
+        self.assertEqual(hedging.run(slow, self._fast, "mistral", "gemini"), ("hedge", True))
+        self.assertTrue(primary["attempt"].cancelled)
+        self.assertEqual(hedging.stats()["fired"], 1)
+        self.assertEqual(metrics.counter("chat.hedge.won"), 1)
+
+    def test_fast_primary_and_rate_cap_skip_the_hedge(self):
+        from . import hedging
+
+        hedge = mock.Mock()
+        self.assertEqual(hedging.run(self._fast, hedge, "mistral", "mistral"), ("hedge", False))
+        with mock.patch.object(hedging, "MAX_RATE", 0.0):
+            self.assertEqual(hedging.run(self._slow, hedge, "mistral", "mistral"), ("primary", False))
+        hedge.assert_not_called()
+        self.assertEqual(hedging.stats()["capped"], 1)
+
+    def test_rate_cap_is_a_share_of_all_requests(self):
+        from . import hedging
+
+        with mock.patch.object(hedging, "MAX_RATE", 0.1):
+            for _ in range(45):
+                hedging.run(self._fast, self._fast, "mistral", "mistral")
+            for _ in range(5):
+                self.assertEqual(hedging.run(self._slow, self._fast, "mistral", "mistral"), ("hedge", True))
+            self.assertEqual(hedging.run(self._slow, self._fast, "mistral", "mistral"), ("primary", False))
+
+        stats = hedging.stats()
+        self.assertEqual((stats["requests"], stats["fired"], stats["capped"]), (51, 5, 1))
+
+    def test_async_hedge_cancels_the_primary_task(self):
+        import asyncio
+        from . import hedging
+
+        cancelled = []
+
+        async def slow(attempt):
+            try:
+                await asyncio.sleep(5)
+            except asyncio.CancelledError:
+                cancelled.append(True)
+                raise
+
+        async def fast(attempt):
+            attempt.token()
+            return "hedge"
+
+        async def main():
+            result = await hedging.arun(slow, fast, "mistral", "mistral")
+            await asyncio.sleep(0)
+            return result
+
+        self.assertEqual(asyncio.run(main()), ("hedge", True))
+        self.assertEqual(cancelled, [True])
+
+    def test_delay_follows_the_first_token_percentile(self):
+        from . import hedging, metrics
+
+        self.assertEqual(hedging.delay("mistral"), 0.05)   # too few samples yet
+        for i in range(1, 101):
+            metrics.observe("chat.ttft.mistral", i / 100)
+        self.assertEqual(hedging.delay("mistral"), 0.95)
+
+
+def _status_error(code, retry_after=None):
+    import httpx
+    from .providers import openai
+
+    headers = {"retry-after": str(retry_after)} if retry_after else {}
+    response = httpx.Response(code, headers=headers, request=httpx.Request("POST", "https://llm.test/"))
+    return openai.APIStatusError(f"HTTP {code}", response=response, body=None)
+
+
+class RetrySchedulingTests(_VerifiedUserMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        from . import metrics, retries
+        retries.reset()
+        metrics.reset()
+        self.addCleanup(retries.reset)
+        self.addCleanup(metrics.reset)
+
+    def _post(self):
+        return self.client.post("/api/chat/", {"message": "hello"}, content_type="application/json")
+
+    def test_backoff_is_jittered_and_capped(self):
+        from . import retries
+
+        delays = [retries.backoff(3, 2, cap=5) for _ in range(200)]
+        self.assertTrue(all(0 <= d <= 5 for d in delays))
+        self.assertGreater(len(set(delays)), 1)
+        self.assertTrue(all(30 <= retries.backoff(0, 2, retry_after=30) <= 33 for _ in range(50)))
+
+    def test_retry_budget_is_spent_per_provider(self):
+        from . import metrics, retries
+
+        with mock.patch.object(retries, "BUDGET_MIN", 2), mock.patch.object(retries, "BUDGET_RATIO", 0):
+            self.assertEqual([retries.allow_retry("mistral") for _ in range(3)], [True, True, False])
+            self.assertTrue(retries.allow_retry("gemini"))
+        self.assertEqual(metrics.counter("llm.retry_budget_exhausted.mistral"), 1)
+        self.assertEqual(retries.stats()["mistral"]["retries"], 2)
+
+    def test_long_retry_after_is_handed_to_the_client_without_sleeping(self):
+        from . import metrics
+
+        with mock.patch("chat.views._chat_reply", side_effect=_status_error(429, retry_after=30)), \
+                mock.patch("chat.views.time.sleep") as sleep:
+            resp = self._post()
+
+        self.assertEqual(resp.status_code, 429)
+        self.assertEqual(resp["Retry-After"], "30")
+        self.assertEqual(resp["X-Retry-Count"], "0")
+        self.assertEqual(resp.json()["retries"], 0)
+        sleep.assert_not_called()
+        self.assertEqual(metrics.counter("llm.retry_handed_off.mistral"), 1)
+
+    def test_long_retry_after_on_a_503_keeps_the_header(self):
+        from . import metrics
+
+        with mock.patch("chat.views._chat_reply", side_effect=_status_error(503, retry_after=30)), \
+                mock.patch("chat.views.time.sleep") as sleep:
+            resp = self._post()
+
+        self.assertEqual(resp.status_code, 503)
+        self.assertEqual(resp["Retry-After"], "30")
+        sleep.assert_not_called()
+        self.assertEqual(metrics.counter("llm.retry_handed_off.mistral"), 1)
+
+    def test_transient_error_is_retried_and_counted(self):
+        from . import retries
+
+        side_effect = [_status_error(503), ("recovered", 4, 2, "mistral-test")]
+        with mock.patch("chat.views._chat_reply", side_effect=side_effect), \
+                mock.patch("chat.views.time.sleep") as sleep:
+            resp = self._post()
+
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.json()["reply"], "recovered")
+        self.assertEqual(resp["X-Retry-Count"], "1")
+        self.assertLessEqual(sleep.call_args[0][0], retries.MAX_INLINE_DELAY)
+
+    def test_non_openai_rate_limit_at_the_end_of_the_chain_is_a_429(self):
+        import httpx
+        from . import failover
+
+        failover.reset()
+        self.addCleanup(failover.reset)
+        # Shaped like google.api_core.exceptions.ResourceExhausted
+        ResourceExhausted = type("ResourceExhausted", (Exception,), {"__module__": "google.api_core.exceptions", "code": 429})
+        error = ResourceExhausted("429 Resource has been exhausted")
+        error.response = httpx.Response(429, headers={"retry-after": "30"})
+
+        with mock.patch("chat.views._mistral_chat_reply", side_effect=error), \
+                mock.patch("chat.views._complete", side_effect=error), \
+                mock.patch("chat.views.time.sleep"):
+            resp = self._post()
+
+        self.assertEqual(resp.status_code, 429)
+        self.assertEqual(resp["Retry-After"], "30")
+
+
+class MultiDebugStreamTests(_VerifiedUserMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        from . import failover
+        llm_cache.clear()
+        failover.reset()
+        self.addCleanup(failover.reset)
+
+    def test_agents_are_sent_as_they_finish_then_synthesis_streams(self):
+        import re
+        import time
+        from . import views
+
+        def slow_syntax(message):
+            time.sleep(0.2)
+            return "Syntax: the subtraction should be an addition on line 2.", 10, 5
+
+        agents = {
+            "_agent_mistral_logic_analyst": mock.Mock(return_value=("Logic: add() subtracts its arguments.", 10, 5)),
+            "_agent_mistral_syntax_inspector": mock.Mock(side_effect=slow_syntax),
+            "_agent_gemini_perf_security": mock.Mock(return_value=("Perf: nothing to report for add().", 10, 5)),
+        }
+        fake = [_chunk("Fixed "), _chunk("it."), _chunk(usage=SimpleNamespace(prompt_tokens=40, completion_tokens=2))]
+        with mock.patch.multiple(views, **agents), \
+                mock.patch("chat.views._open_provider_stream", return_value=iter(fake)) as opened:
+            resp = self.client.post(
+                "/api/multi-debug/stream/",
+                {"message": "def add(a, b):\n    return a - b\n"},
+                content_type="application/json",
+                HTTP_ACCEPT="text/event-stream",
+            )
+            body = b"".join(resp.streaming_content).decode()
+
+        events = re.findall(r"^event: (\w+)", body, re.M)
+        self.assertEqual(events, ["meta", "agent", "agent", "agent", "delta", "delta", "done"])
+        self.assertIn('"name": "syntax_inspector"', body.split("event: agent")[-1])
+        self.assertEqual(opened.call_args[0][:2], ("mistral", views.REGULAR_MODEL))
+        reply = Message.objects.get(role="assistant")
+        self.assertEqual(reply.content, "Fixed it.")
+        self.assertEqual(set(reply.agent_data), {"logic_analyst", "syntax_inspector", "perf_security_auditor", "_tier"})
+        self.assertEqual(ModelUsage.objects.count(), 4)
+
+
+class AgentPoolTests(_VerifiedUserMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        from . import agent_pool, metrics
+        agent_pool.reset()
+        metrics.reset()
+        self.addCleanup(agent_pool.reset)
+        self.addCleanup(metrics.reset)
+
+    def test_provider_lane_queues_then_refuses(self):
+        import concurrent.futures
+        import threading
+        from . import agent_pool, metrics
+
+        gate = threading.Event()
+        with mock.patch.object(agent_pool, "PROVIDER_CONCURRENCY", 1), \
+                mock.patch.object(agent_pool, "PROVIDER_QUEUE", 1):
+            futures = agent_pool.submit_all({
+                "first": ("mistral", gate.wait, (5,)),
+                "second": ("mistral", lambda: "queued", ()),
+            })
+            self.assertEqual(agent_pool.stats()["mistral"]["waiting"], 1)
+            with self.assertRaises(agent_pool.Saturated):
+                agent_pool.submit_all({"third": ("mistral", lambda: "x", ())})
+            agent_pool.submit_all({"other": ("gemini", lambda: "ok", ())})   # other lanes unaffected
+            gate.set()
+            done = concurrent.futures.wait(futures, timeout=5).done
+
+        self.assertEqual({futures[f]: f.result() for f in done}, {"first": True, "second": "queued"})
+        self.assertEqual(metrics.counter("agent.rejected.mistral"), 1)
+        self.assertIn("agent.queue_wait.mistral", metrics.snapshot()["latency_ms"])
+
+    def test_async_agents_share_the_provider_lanes(self):
+        import asyncio
+        import threading
+        from . import agent_pool
+
+        gate = threading.Event()
+
+        async def agent(text):
+            return text
+
+        async def main():
+            thread_job = agent_pool.submit_all({"sync": ("mistral", gate.wait, (5,))})
+            tasks = agent_pool.asubmit_all({"async": ("mistral", agent, ("done",))})
+            waiting = agent_pool.stats()["mistral"]["waiting"]
+            abandoned = agent_pool.asubmit_all({"cancelled": ("mistral", agent, ("never",))})["cancelled"]
+            abandoned.cancel()
+            gate.set()
+            result = await asyncio.wait_for(tasks["async"], 5)
+            await asyncio.sleep(0.05)   # let the cancelled waiter pass its slot on
+            return waiting, result, list(thread_job)[0].result()
+
+        with mock.patch.object(agent_pool, "PROVIDER_CONCURRENCY", 1), \
+                mock.patch.object(agent_pool, "PROVIDER_QUEUE", 2):
+            waiting, result, sync_result = asyncio.run(main())
+            lane = agent_pool.stats()["mistral"]
+
+        self.assertEqual((waiting, result, sync_result), (1, "done", True))
+        self.assertEqual((lane["running"], lane["waiting"]), (0, 0))
+
+    def test_saturated_pool_returns_503_before_persisting(self):
+        from . import agent_pool
+
+        with mock.patch.object(agent_pool, "PROVIDER_QUEUE", -agent_pool.PROVIDER_CONCURRENCY), \
+                mock.patch("chat.views._run_agents_parallel") as agents:
+            resp = self.client.post("/api/multi-debug/", {"message": "def f(x):\n    return x +\n"},
+                                    content_type="application/json")
+
+        self.assertEqual(resp.status_code, 503)
+        self.assertGreaterEqual(int(resp["Retry-After"]), 1)
+        agents.assert_not_called()
+        self.assertFalse(Message.objects.exists())
+
+
+class OcrRetrievalTests(_VerifiedUserMixin, TestCase):
+
+    def _document(self):
+        filler = "\n\n".join(f"Section {i}. General remarks about the warehouse layout." for i in range(200))
+        return filler + "\n\nRefund policy: customers may return items within 45 days of purchase.\n\n" + filler
+
+    def test_chunks_cover_the_text_and_search_finds_the_relevant_one(self):
+        from . import retrieval
+
+        text = self._document()
+        index = retrieval.build_index(text)
+        spans = index["spans"]
+        self.assertEqual((spans[0][0], spans[-1][1]), (0, len(text)))
+        self.assertTrue(all(b[0] <= a[1] for a, b in zip(spans, spans[1:])))   # no gaps
+        self.assertTrue(all(end - start <= retrieval.CHUNK_CHARS for start, end in spans))
+
+        best = retrieval.search(index, "How many days do I have for a refund?", k=1)
+        self.assertIn("45 days", retrieval.excerpt(text, index, best[0]))
+
+    def test_question_prompt_contains_only_retrieved_chunks(self):
+        from .models import DocumentIndex
+        from .utils import _ensure_session
+
+        session_id = _ensure_session(None, "ocr", user=self.user)
+        text = self._document()
+        Message.objects.create(role="system", content=text, session_id=session_id, mode="ocr")
+
+        with mock.patch("chat.views.genai") as genai:
+            genai.GenerativeModel.return_value.generate_content.return_value = SimpleNamespace(
+                text="45 days.", usage_metadata=None,
+            )
+            resp = self.client.post("/api/ocr-qa/", {"question": "What is the refund window?", "session_id": session_id},
+                                    content_type="application/json")
+
+        self.assertEqual(resp.status_code, 200)
+        prompt = genai.GenerativeModel.return_value.generate_content.call_args[0][0]
+        self.assertIn("45 days of purchase", prompt)
+        self.assertLess(len(prompt), len(text) // 4)
+        self.assertTrue(DocumentIndex.objects.exists())   # built lazily for the pre-existing document
+
+    def test_questions_search_every_document_and_cite_the_source(self):
+        from . import retrieval
+        from .utils import _ensure_session
+
+        session_id = _ensure_session(None, "ocr", user=self.user)
+        handbook = "--- Page 1 ---\n" + self._document() + "\n--- Page 2 ---\nOffice hours are 9 to 5."
+        for name, text in (("handbook.pdf", handbook), ("notes.txt", "Parking is free on weekends.")):
+            retrieval.index_document(Message.objects.create(
+                role="system", content=text, session_id=session_id, mode="ocr", attachments=[{"name": name}],
+            ))
+
+        with mock.patch("chat.views.genai") as genai:
+            genai.GenerativeModel.return_value.generate_content.return_value = SimpleNamespace(
+                text="Refunds within 45 days [1].", usage_metadata=None,
+            )
+            resp = self.client.post("/api/ocr-qa/", {"question": "refund days", "session_id": session_id},
+                                    content_type="application/json")
+
+        prompt = genai.GenerativeModel.return_value.generate_content.call_args[0][0]
+        self.assertIn("45 days of purchase", prompt)
+        self.assertLess(len(prompt), len(handbook) // 4)
+        cited = resp.json()["citations"]
+        self.assertEqual(cited[0]["document"], "handbook.pdf")
+        self.assertEqual(cited[0]["pages"], [1])
+        self.assertIn("(handbook.pdf, page 1)", prompt)
+
+
+def _png(width, height, salt=b""):
+    import struct
+    return b"\x89PNG\r\n\x1a\n" + b"\x00\x00\x00\rIHDR" + struct.pack(">II", width, height) + b"\x08\x02\x00\x00\x00" + salt
+
+
+class ContentDedupTests(_VerifiedUserMixin, TestCase):
+
+    def test_repeat_image_upload_skips_cloudinary_and_gemini(self):
+        from datetime import timedelta
+        from django.core.files.uploadedfile import SimpleUploadedFile
+        from django.utils import timezone
+        from .views import _upload_images
+
+        png = _png(64, 64)
+        handle = SimpleNamespace(uri="https://gemini.test/files/abc", mime_type="image/png",
+                                 expiration_time=timezone.now() + timedelta(hours=48))
+        with mock.patch("chat.views.cloudinary.uploader.upload", return_value={"secure_url": "https://cdn.test/a.png"}) as cdn, \
+                mock.patch("chat.views.genai") as genai:
+            genai.upload_file.return_value = handle
+            first = _upload_images([SimpleUploadedFile("a.png", png, content_type="image/png")])
+            second = _upload_images([SimpleUploadedFile("copy.png", png, content_type="image/png")])
+
+        self.assertEqual(cdn.call_count, 1)
+        self.assertEqual(genai.upload_file.call_count, 1)
+        self.assertEqual(second[0][0]["url"], first[0][0]["url"])
+        self.assertEqual(second[0][0]["name"], "copy.png")
+        self.assertEqual(second[1], [{"file_data": {"file_uri": handle.uri, "mime_type": "image/png"}}])
+
+    def test_repeat_ocr_upload_reuses_extracted_text(self):
+        from django.core.files.uploadedfile import SimpleUploadedFile
+
+        def upload():
+            return self.client.post("/api/ocr/", {"file": SimpleUploadedFile("scan.txt", b"same bytes", content_type="text/plain")})
+
+        with mock.patch("chat.views.GOOGLE_API_KEY", "test"), \
+                mock.patch("chat.views._gemini_extract_text_from_file", return_value=("Invoice 42", 300, 20)) as extract:
+            first, second = upload(), upload()
+
+        self.assertEqual(extract.call_count, 1)
+        self.assertEqual(second.json()["text"], "Invoice 42")
+        self.assertNotEqual(second.json()["session_id"], first.json()["session_id"])
+        self.assertEqual(list(ModelUsage.objects.order_by("id").values_list("cached", flat=True)), [False, True])
+
+
+class ParallelImageUploadTests(_VerifiedUserMixin, TestCase):
+
+    def _images(self, n):
+        from django.core.files.uploadedfile import SimpleUploadedFile
+        return [SimpleUploadedFile(f"{i}.png", _png(32, 32, bytes([i])), content_type="image/png") for i in range(n)]
+
+    def test_uploads_run_concurrently_and_keep_input_order(self):
+        import threading
+        from .views import _upload_images
+
+        barrier = threading.Barrier(8, timeout=5)   # 4 images x 2 destinations
+
+        def cloudinary_upload(data, **kwargs):
+            barrier.wait()
+            return {"secure_url": f"https://cdn.test/{data[-1]}.png", "public_id": str(data[-1])}
+
+        def gemini_upload(source, mime_type):
+            barrier.wait()
+            return SimpleNamespace(name=f"files/{id(source)}", uri=None)
+
+        with mock.patch("chat.views.cloudinary.uploader.upload", side_effect=cloudinary_upload), \
+                mock.patch("chat.views.genai") as genai:
+            genai.upload_file.side_effect = gemini_upload
+            attachments, handles = _upload_images(self._images(4))
+
+        self.assertEqual([a["url"] for a in attachments], [f"https://cdn.test/{i}.png" for i in range(4)])
+        self.assertEqual(len(handles), 4)
+
+    def test_failed_upload_removes_the_ones_that_succeeded(self):
+        from .models import ContentBlob
+        from .views import _upload_images
+
+        def cloudinary_upload(data, **kwargs):
+            if data[-1] == 1:
+                raise RuntimeError("cloudinary down")
+            return {"secure_url": "https://cdn.test/x.png", "public_id": f"img{data[-1]}"}
+
+        with mock.patch("chat.views.cloudinary.uploader.upload", side_effect=cloudinary_upload), \
+                mock.patch("chat.views.cloudinary.uploader.destroy") as destroy, \
+                mock.patch("chat.views.genai") as genai:
+            genai.upload_file.side_effect = lambda source, mime_type: SimpleNamespace(name=f"files/{id(source)}", uri=None)
+            with self.assertRaises(RuntimeError):
+                _upload_images(self._images(2))
+
+        destroy.assert_called_once_with("img0", resource_type="image")
+        self.assertEqual(genai.delete_file.call_count, 2)
+        self.assertFalse(ContentBlob.objects.exists())
+
+    def test_large_upload_is_sent_from_djangos_temp_file(self):
+        from django.core.files.uploadedfile import TemporaryUploadedFile
+        from .models import ContentBlob
+        from .views import _upload_images
+
+        png = _png(64, 48, b"big")
+        image = TemporaryUploadedFile("big.png", "image/png", len(png), None)
+        image.write(png)
+        image.seek(0)
+        path = image.temporary_file_path()
+        handle = SimpleNamespace(name="files/big", uri="https://gemini.test/files/big")
+
+        with mock.patch("chat.views._CLOUDINARY_CHUNK_BYTES", 16), \
+                mock.patch("chat.views.cloudinary.uploader.upload_large",
+                           return_value={"secure_url": "https://cdn.test/big.png", "public_id": "big"}) as upload_large, \
+                mock.patch("chat.views.genai") as genai:
+            genai.upload_file.return_value = handle
+            attachments, _ = _upload_images([image])
+        image.close()
+
+        self.assertEqual(upload_large.call_args.args, (path,))
+        genai.upload_file.assert_called_once_with(path, mime_type="image/png")
+        self.assertEqual(attachments[0]["url"], "https://cdn.test/big.png")
+        self.assertEqual(ContentBlob.objects.get().size, len(png))
@@ -1,16 +1,35 @@
+import os
+
 from django.urls import path
 from .views import (
-    ChatView, ChatHistoryView, OcrUploadView, OcrQaView,
+    ChatView, ChatStreamView, ChatHistoryView, OcrUploadView, OcrQaView,
     create_session, list_sessions, delete_session,
-    GeminiWithImagesView, rename_session, MultiDebugView, usage_stats, model_info,
+    GeminiWithImagesView, rename_session, MultiDebugView, MultiDebugStreamView, usage_stats, model_info,
+    llm_metrics,
 )
 
+# Under an ASGI server (see backend/asgi.py) the LLM endpoints can be served by
+# the native async views instead of the thread-bound DRF views.
+if os.getenv("ASYNC_LLM_VIEWS", "").lower() in ("true", "1", "yes"):
+    from . import async_views
+    chat_view        = async_views.chat
+    multi_debug_view = async_views.multi_debug
+    ocr_qa_view      = async_views.ocr_qa
+    images_view      = async_views.gemini_with_images
+else:
+    chat_view        = ChatView.as_view()
+    multi_debug_view = MultiDebugView.as_view()
+    ocr_qa_view      = OcrQaView.as_view()
+    images_view      = GeminiWithImagesView.as_view()
+
 urlpatterns = [
-    path('chat/', ChatView.as_view(), name='chat'),
-    path('multi-debug/', MultiDebugView.as_view(), name='multi-debug'),
+    path('chat/', chat_view, name='chat'),
+    path('chat/stream/', ChatStreamView.as_view(), name='chat-stream'),
+    path('multi-debug/', multi_debug_view, name='multi-debug'),
+    path('multi-debug/stream/', MultiDebugStreamView.as_view(), name='multi-debug-stream'),
     path('history/', ChatHistoryView.as_view(), name='history'),
     path('ocr/', OcrUploadView.as_view(), name='ocr'),
-    path('ocr-qa/', OcrQaView.as_view(), name='ocr-qa'),
+    path('ocr-qa/', ocr_qa_view, name='ocr-qa'),
 
     path('create-session/', create_session, name='create-session'),
 
@@ -18,8 +37,9 @@ urlpatterns = [
     # IMPORTANT: static route goes BEFORE the dynamic route
     path('sessions/new/', create_session, name='create-session-legacy'),
     path('sessions/<str:session_id>/delete/', delete_session, name='delete-session'),
-     path("gemini-with-images/", GeminiWithImagesView.as_view(), name="gemini-with-images"),
+     path("gemini-with-images/", images_view, name="gemini-with-images"),
      path("sessions/<str:session_id>/rename/", rename_session, name="rename_session"),
      path("usage/", usage_stats, name="usage-stats"),
      path("models/", model_info, name="model-info"),
+     path("metrics/", llm_metrics, name="llm-metrics"),
 ]
@@ -0,0 +1,239 @@
+# chat/usage_sink.py
+"""
+Buffered writer for ModelUsage rows.
+
+_record_usage used to INSERT one row per LLM call on the request thread —
+four in a row before MultiDebugView could respond. Records are now queued
+in-process and written with one bulk_create by a background thread whenever
+USAGE_FLUSH_SIZE rows are pending or every USAGE_FLUSH_INTERVAL seconds,
+and once more when the worker shuts down (atexit).
+
+Each batch also bumps the per-day DailyUsage rollups in the same
+transaction, so usage_stats never has to aggregate raw rows.
+
+If a batch fails it is retried one row at a time. Rows that are bad in
+themselves (an IntegrityError such as a user deleted while the row was
+queued, a DataError, ...) are logged and dropped. If the database is
+unreachable the rest are appended to a JSON-lines fallback file
+(USAGE_FALLBACK_FILE) instead of being lost; the next successful flush
+replays it. A row is parked at most USAGE_MAX_ATTEMPTS times, so nothing
+can circulate through the file forever.
+
+Every write takes the per-user lock of chat.models.lock_users first, so it
+serialises with rebuild_daily_usage() and with a user resetting their
+usage. discard() makes a reset stick: rows queued in this worker before it
+— buffered, in an in-flight batch or in the fallback file — are never
+written.
+
+settings.USAGE_BUFFERED = False (the default under `manage.py test`)
+writes every record synchronously.
+"""
+import atexit
+import json
+import logging
+import os
+import threading
+
+from django.conf import settings
+from django.db import DataError, IntegrityError, close_old_connections, transaction
+from django.db.models import F
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+logger = logging.getLogger(__name__)
+
+FLUSH_SIZE = int(os.getenv("USAGE_FLUSH_SIZE", 50))
+FLUSH_INTERVAL = float(os.getenv("USAGE_FLUSH_INTERVAL", 2.0))   # seconds
+FALLBACK_FILE = os.getenv("USAGE_FALLBACK_FILE") or str(settings.BASE_DIR / "usage_fallback.jsonl")
+MAX_ATTEMPTS = int(os.getenv("USAGE_MAX_ATTEMPTS", 5))
+
+# Errors caused by the row itself — retrying it can never succeed
+_BAD_ROW_ERRORS = (IntegrityError, DataError, ValueError, TypeError, KeyError)
+
+_lock = threading.Lock()
+_buffer: list[dict] = []
+_wakeup = threading.Event()
+_flusher = None
+_file_lock = threading.Lock()
+_discarded: dict = {}   # user_id -> ISO time; rows created up to then are dropped
+
+
+def record(user_id: int, model_name: str, input_tokens: int, output_tokens: int,
+           cached: bool = False, mode: str = "") -> None:
+    """Queue one usage row (written synchronously when buffering is off)."""
+    row = {
+        "user_id": user_id,
+        "model_name": model_name,
+        "input_tokens": max(0, input_tokens or 0),
+        "output_tokens": max(0, output_tokens or 0),
+        "cached": cached,
+        "mode": mode or "",
+        "created_at": timezone.now().isoformat(),
+    }
+    if not getattr(settings, "USAGE_BUFFERED", True):
+        _write([row])
+        return
+
+    with _lock:
+        _buffer.append(row)
+        full = len(_buffer) >= FLUSH_SIZE
+    _ensure_flusher()
+    if full:
+        _wakeup.set()
+
+
+def flush() -> int:
+    """Write everything queued (and any fallback file) now. Returns rows written."""
+    with _lock:
+        rows = _buffer[:]
+        del _buffer[:]
+    written, parked = _write(rows) if rows else (0, 0)
+    if not parked:  # DB reachable — try the rows stranded earlier
+        written += _replay_fallback()
+    return written
+
+
+def discard(user_id: int) -> None:
+    """Drop every row queued for `user_id` so far (their usage is being reset)."""
+    cutoff = timezone.now().isoformat()
+    with _lock:
+        _discarded[user_id] = cutoff
+        _buffer[:] = [row for row in _buffer if row["user_id"] != user_id]
+
+
+def _kept(rows: list[dict]) -> list[dict]:
+    return [
+        row for row in rows
+        if row["user_id"] not in _discarded or row["created_at"] > _discarded[row["user_id"]]
+    ]
+
+
+def _ensure_flusher() -> None:
+    global _flusher
+    if _flusher is not None:
+        return
+    with _lock:
+        if _flusher is None:
+            _flusher = threading.Thread(target=_run, name="usage-sink", daemon=True)
+            _flusher.start()
+            atexit.register(flush)
+
+
+def _run() -> None:
+    while True:
+        _wakeup.wait(FLUSH_INTERVAL)
+        _wakeup.clear()
+        try:
+            flush()
+        except Exception:
+            logger.exception("Usage sink flush failed")
+        finally:
+            close_old_connections()
+
+
+def _write(rows: list[dict]) -> tuple:
+    """
+    bulk_create the rows and update their rollups. Returns (written, parked):
+    rows written, and rows parked in the fallback file because the database
+    looked unreachable. Rows that fail on their own are dropped.
+    """
+    if len(rows) > 1:
+        try:
+            return _insert(rows), 0
+        except Exception:
+            logger.warning("Usage batch of %d rows failed — retrying one row at a time", len(rows),
+                           exc_info=True)
+
+    written = 0
+    for i, row in enumerate(rows):
+        try:
+            written += _insert([row])
+        except _BAD_ROW_ERRORS:
+            logger.exception("Dropping usage row that cannot be written: %s", row)
+        except Exception:
+            # Not the row's fault — stop hammering the database and park the rest
+            parked = rows[i:]
+            logger.exception("Failed to write %d usage rows — saving to %s", len(parked), FALLBACK_FILE)
+            _append_fallback(parked)
+            return written, len(parked)
+    return written, 0
+
+
+def _insert(rows: list[dict]) -> int:
+    from django.contrib.auth import get_user_model
+    from .models import ModelUsage, lock_users
+
+    with transaction.atomic():
+        lock_users(get_user_model(), {row["user_id"] for row in rows})
+        objs = []
+        for row in _kept(rows):
+            fields = {k: v for k, v in row.items() if k != "attempts"}
+            fields["created_at"] = parse_datetime(fields["created_at"])
+            objs.append(ModelUsage(**fields))
+        ModelUsage.objects.bulk_create(objs)
+        _apply_rollups(objs)
+    return len(objs)
+
+
+def _apply_rollups(usages) -> None:
+    """Add a batch of ModelUsage objects to their DailyUsage buckets."""
+    from .models import DailyUsage
+
+    buckets = {}
+    for u in usages:
+        key = (u.user_id, timezone.localdate(u.created_at), u.model_name, u.mode, u.cached)
+        totals = buckets.setdefault(key, [0, 0, 0])
+        totals[0] += 1
+        totals[1] += u.input_tokens
+        totals[2] += u.output_tokens
+
+    for (user_id, day, model_name, mode, cached), (calls, inp, out) in buckets.items():
+        bucket = DailyUsage.objects.filter(
+            user_id=user_id, day=day, model_name=model_name, mode=mode, cached=cached,
+        )
+        increment = {
+            "calls": F("calls") + calls,
+            "input_tokens": F("input_tokens") + inp,
+            "output_tokens": F("output_tokens") + out,
+        }
+        if bucket.update(**increment):
+            continue
+        try:
+            with transaction.atomic():
+                DailyUsage.objects.create(
+                    user_id=user_id, day=day, model_name=model_name, mode=mode, cached=cached,
+                    calls=calls, input_tokens=inp, output_tokens=out,
+                )
+        except IntegrityError:  # another worker created the bucket first
+            bucket.update(**increment)
+
+
+def _append_fallback(rows: list[dict]) -> None:
+    rows = [{**row, "attempts": row.get("attempts", 0) + 1} for row in rows]
+    expired = [row for row in rows if row["attempts"] > MAX_ATTEMPTS]
+    if expired:
+        logger.error("Dropping %d usage rows after %d failed attempts: %s", len(expired), MAX_ATTEMPTS, expired)
+        rows = [row for row in rows if row["attempts"] <= MAX_ATTEMPTS]
+    if not rows:
+        return
+    try:
+        with _file_lock, open(FALLBACK_FILE, "a", encoding="utf-8") as f:
+            f.writelines(json.dumps(row) + "\n" for row in rows)
+    except OSError:
+        logger.exception("Could not write usage fallback file; %d rows lost", len(rows))
+
+
+def _replay_fallback() -> int:
+    if not os.path.exists(FALLBACK_FILE):
+        return 0
+    # Claim the file first so concurrent workers never replay the same rows twice
+    claimed = f"{FALLBACK_FILE}.{os.getpid()}.replay"
+    try:
+        with _file_lock:
+            os.replace(FALLBACK_FILE, claimed)
+    except OSError:
+        return 0
+    with open(claimed, encoding="utf-8") as f:
+        rows = [json.loads(line) for line in f if line.strip()]
+    os.remove(claimed)
+    return _write(rows)[0] if rows else 0
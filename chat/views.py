@@ -1,31 +1,38 @@
+import base64
 import concurrent.futures
+import functools
+import io
+import json
 import logging
 import math
+import mimetypes
 import os
 import struct
 import tempfile
 import time
+from types import SimpleNamespace
 from typing import Optional
 
 logger = logging.getLogger(__name__)
 
 import cloudinary.uploader
-import google.generativeai as genai
-from openai import OpenAI as OpenAIClient, APIStatusError, APIError
 
 from django.core.files.uploadedfile import TemporaryUploadedFile
 from django.db import transaction
-from django.db.models import Max
+from django.db.models import Q
+from django.http import StreamingHttpResponse
 from django.utils import timezone as tz
 
 from rest_framework import status
 from rest_framework.decorators import api_view, authentication_classes, permission_classes
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
+from rest_framework.renderers import BaseRenderer, JSONRenderer
 from rest_framework.response import Response
-from rest_framework.throttling import UserRateThrottle
 from rest_framework.views import APIView
 
 from accounts.models import Profile as UserProfile
+from accounts.utils import get_profile_flags
+from backend.ratelimit import SlidingWindowThrottle
 
 
 def _ban_matches(ban, feature, tier):
@@ -64,9 +71,7 @@ def _check_feature_ban(user, feature, tier=None):
     """
     from django.core.cache import cache
 
-    try:
-        profile = user.profile
-    except UserProfile.DoesNotExist:
+    if get_profile_flags(user) is None:
         return None
 
     cache_key = f"bans:{user.id}"
@@ -78,7 +83,8 @@ def _check_feature_ban(user, feature, tier=None):
         expired = []
         active  = []  # list of (feature, expires_at_iso_or_None, reason)
 
-        for ban in profile.feature_bans.all():
+        from accounts.models import FeatureBan as _FB
+        for ban in _FB.objects.filter(profile__user_id=user.id):
             if ban.expires_at and now >= ban.expires_at:
                 expired.append(ban.pk)
                 continue
@@ -89,10 +95,10 @@ def _check_feature_ban(user, feature, tier=None):
             })
 
         if expired:
-            from accounts.models import FeatureBan as _FB
             _FB.objects.filter(pk__in=expired).delete()
 
-        cache.set(cache_key, active, timeout=_BAN_CACHE_TTL)
+        # add(), not set(): this is a fill from the DB, not a change — see backend/cache.py
+        cache.add(cache_key, active, timeout=_BAN_CACHE_TTL)
         cached = active
 
     # Check cached ban list against requested feature/tier
@@ -132,14 +138,8 @@ def _check_email_verified(user):
     Returns a 403 Response if the user's email is not verified, otherwise None.
     A missing Profile is treated as unverified.
     """
-    try:
-        if not user.profile.email_verified:
-            return Response(
-                {"error": "email_not_verified",
-                 "detail": "Please verify your email address before using the chat."},
-                status=status.HTTP_403_FORBIDDEN,
-            )
-    except UserProfile.DoesNotExist:
+    flags = get_profile_flags(user)
+    if not flags or not flags["email_verified"]:
         return Response(
             {"error": "email_not_verified",
              "detail": "Please verify your email address before using the chat."},
@@ -160,17 +160,23 @@ class _DebugBypassMixin:
             return True
         return super().allow_request(request, view)
 
-class _LLMChatThrottle(_DebugBypassMixin, UserRateThrottle):
+class _LLMChatThrottle(_DebugBypassMixin, SlidingWindowThrottle):
     scope = "llm_chat"   # 60/hour — regular & uncensored chat
 
-class _LLMOcrThrottle(_DebugBypassMixin, UserRateThrottle):
+class _LLMOcrThrottle(_DebugBypassMixin, SlidingWindowThrottle):
     scope = "llm_ocr"    # 30/hour — OCR Q&A and image analysis
 
-class _LLMDebugThrottle(_DebugBypassMixin, UserRateThrottle):
+class _LLMDebugThrottle(_DebugBypassMixin, SlidingWindowThrottle):
     scope = "llm_debug"  # 20/hour — multi-debugger (most expensive)
 
 from .authentication import CsrfExemptSessionAuthentication
-from .models import Message, ChatSession
+from . import agent_pool, failover, hedging, llm_cache, metrics, retries
+from . import blobs, retrieval, single_flight, usage_sink
+from .clients import get_client
+from .providers import genai, openai
+from .context import MAX_HISTORY_MESSAGES, build_context, estimate_tokens, message_tokens
+from .summaries import invalidate_summary, maybe_schedule_summary, summary_message
+from .models import Message, ChatSession, refresh_session_stats
 from .utils import _ensure_session, _update_title_if_empty
 
 # Shared constants used across views
@@ -200,12 +206,14 @@ MISTRAL_API_KEY  = _require_env("MISTRAL_API_KEY")
 MISTRAL_BASE_URL = _require_env("MISTRAL_BASE_URL")
 REGULAR_MODEL    = _require_env("MISTRAL_MODEL")
 
-mistral_client = OpenAIClient(
-    api_key=MISTRAL_API_KEY,
-    base_url=MISTRAL_BASE_URL,
-)
+
+def _mistral_client():
+    """Shared Mistral client, built (and the openai SDK imported) on first use."""
+    return get_client("mistral", MISTRAL_API_KEY, MISTRAL_BASE_URL)
+
 
 # OpenRouter — used for uncensored chat mode
+_OPENROUTER_BASE_URL = "https://openrouter.ai/api/v1"
 UNCENSORED_MODEL = os.getenv(
     "UNCENSORED_MODEL",
     "cognitivecomputations/dolphin-mistral-24b-venice-edition:free"
@@ -217,8 +225,7 @@ FRONTEND_URL = os.getenv("FRONTEND_URL", "http://localhost:3000")
 GOOGLE_API_KEY    = _require_env("GOOGLE_API_KEY")
 GEMINI_TEXT_MODEL = _require_env("GEMINI_TEXT_MODEL")
 GEMINI_FILE_MODEL = _require_env("GEMINI_FILE_MODEL")
-
-genai.configure(api_key=GOOGLE_API_KEY)
+# genai is configured with GOOGLE_API_KEY on first use (chat/providers.py)
 
 # ================================
 # Multi-Debugger Configuration
@@ -259,6 +266,7 @@ _MODEL_PRICING = [
 ]
 
 
+@functools.lru_cache(maxsize=256)
 def _get_model_pricing(model_name: str) -> dict:
     lower = (model_name or "").lower()
     for key, inp, out in _MODEL_PRICING:
@@ -267,16 +275,13 @@ def _get_model_pricing(model_name: str) -> dict:
     return {"input": 0.10, "output": 0.30}
 
 
-def _record_usage(user, model_name: str, input_tokens: int, output_tokens: int) -> None:
-    """Persist one API call's token counts to the DB (best-effort, never raises)."""
+def _record_usage(user, model_name: str, input_tokens: int, output_tokens: int,
+                  cached: bool = False, mode: str = "") -> None:
+    """Queue one API call's token counts for chat/usage_sink.py (best-effort, never raises).
+    cached=True marks a response served from chat/llm_cache.py; mode is the
+    chat mode the call served (for the per-mode breakdown in usage_stats)."""
     try:
-        from .models import ModelUsage
-        ModelUsage.objects.create(
-            user=user,
-            model_name=model_name,
-            input_tokens=max(0, input_tokens or 0),
-            output_tokens=max(0, output_tokens or 0),
-        )
+        usage_sink.record(user.pk, model_name, input_tokens, output_tokens, cached=cached, mode=mode)
     except Exception:
         logger.exception("Failed to record token usage")
 
@@ -459,137 +464,75 @@ _SYNTHESIZER_PROMPT = (
 # ================================
 
 def _agent_logic_analyst(message: str, model: str = None) -> tuple:
-    """Agent 1 — Logic Analyst: Google Gemini (free: Flash / premium: Pro).
-    Returns (text, input_tokens, output_tokens)."""
-    model = model or GEMINI_DEBUG_MODEL
+    """Agent 1 — Logic Analyst: Google Gemini (free: Flash / premium: Pro), failing over to OpenAI.
+    Returns (text, input_tokens, output_tokens, served_model)."""
+    chain = _agent_chain("premium", "logic_analyst", model)
     try:
-        m = genai.GenerativeModel(model, system_instruction=_LOGIC_ANALYST_PROMPT)
-        resp = m.generate_content(message)
-        text = (resp.text or "").strip()
-        _um = getattr(resp, 'usage_metadata', None)
-        return (
-            text,
-            getattr(_um, 'prompt_token_count', 0) or 0,
-            getattr(_um, 'candidates_token_count', 0) or 0,
-        )
+        return _run_chain(chain, _LOGIC_ANALYST_PROMPT, message, 2048)
     except Exception as e:
         logger.exception("Multi-debug Agent 1 (Logic Analyst) failed")
-        return f"[Logic Analyst unavailable: {str(e)[:300]}]", 0, 0
+        return f"[Logic Analyst unavailable: {str(e)[:300]}]", 0, 0, chain[0][1]
 
 
 def _agent_syntax_inspector(message: str, model: str = None) -> tuple:
-    """Agent 2 — Syntax & Runtime Inspector: OpenAI (premium: GPT-4.1).
-    Returns (text, input_tokens, output_tokens)."""
-    model = model or DEBUG_SYNTAX_MODEL
+    """Agent 2 — Syntax & Runtime Inspector: OpenAI (premium: GPT-4.1), failing over to Gemini.
+    Returns (text, input_tokens, output_tokens, served_model)."""
+    chain = _agent_chain("premium", "syntax_inspector", model)
     try:
-        if not OPENAI_API_KEY:
-            return "[Syntax Inspector unavailable: OPENAI_API_KEY not configured]", 0, 0
-        client = OpenAIClient(api_key=OPENAI_API_KEY)
-        r = client.chat.completions.create(
-            model=model,
-            messages=[
-                {"role": "system", "content": _SYNTAX_INSPECTOR_PROMPT},
-                {"role": "user",   "content": message},
-            ],
-            max_tokens=2048,
-            timeout=90,
-        )
-        text = (r.choices[0].message.content or "").strip()
-        u = getattr(r, 'usage', None)
-        return text, getattr(u, 'prompt_tokens', 0) or 0, getattr(u, 'completion_tokens', 0) or 0
+        return _run_chain(chain, _SYNTAX_INSPECTOR_PROMPT, message, 2048)
     except Exception as e:
         logger.exception("Multi-debug Agent 2 (Syntax Inspector) failed")
-        return f"[Syntax Inspector unavailable: {str(e)[:300]}]", 0, 0
+        return f"[Syntax Inspector unavailable: {str(e)[:300]}]", 0, 0, chain[0][1]
 
 
 def _agent_mistral_logic_analyst(message: str) -> tuple:
-    """Agent 1 (Free) — Logic Analyst using Mistral.
-    Returns (text, input_tokens, output_tokens)."""
+    """Agent 1 (Free) — Logic Analyst using Mistral, failing over to Gemini Flash.
+    Returns (text, input_tokens, output_tokens, served_model)."""
+    chain = _agent_chain("free", "logic_analyst")
     try:
-        r = mistral_client.chat.completions.create(
-            model=REGULAR_MODEL,
-            messages=[
-                {"role": "system", "content": _LOGIC_ANALYST_PROMPT},
-                {"role": "user",   "content": message},
-            ],
-            max_tokens=2048,
-        )
-        text = (r.choices[0].message.content or "").strip()
-        u = getattr(r, 'usage', None)
-        return text, getattr(u, 'prompt_tokens', 0) or 0, getattr(u, 'completion_tokens', 0) or 0
+        return _run_chain(chain, _LOGIC_ANALYST_PROMPT, message, 2048)
     except Exception as e:
         logger.exception("Multi-debug Agent 1 Free (Mistral Logic) failed")
-        return f"[Logic Analyst unavailable: {str(e)[:300]}]", 0, 0
+        return f"[Logic Analyst unavailable: {str(e)[:300]}]", 0, 0, chain[0][1]
 
 
 def _agent_mistral_syntax_inspector(message: str) -> tuple:
-    """Agent 2 (Free) — Syntax & Runtime Inspector using Mistral.
-    Returns (text, input_tokens, output_tokens)."""
+    """Agent 2 (Free) — Syntax & Runtime Inspector using Mistral, failing over to Gemini Flash.
+    Returns (text, input_tokens, output_tokens, served_model)."""
+    chain = _agent_chain("free", "syntax_inspector")
     try:
-        r = mistral_client.chat.completions.create(
-            model=REGULAR_MODEL,
-            messages=[
-                {"role": "system", "content": _SYNTAX_INSPECTOR_PROMPT},
-                {"role": "user",   "content": message},
-            ],
-            max_tokens=2048,
-        )
-        text = (r.choices[0].message.content or "").strip()
-        u = getattr(r, 'usage', None)
-        return text, getattr(u, 'prompt_tokens', 0) or 0, getattr(u, 'completion_tokens', 0) or 0
+        return _run_chain(chain, _SYNTAX_INSPECTOR_PROMPT, message, 2048)
     except Exception as e:
         logger.exception("Multi-debug Agent 2 Free (Mistral Syntax) failed")
-        return f"[Syntax Inspector unavailable: {str(e)[:300]}]", 0, 0
+        return f"[Syntax Inspector unavailable: {str(e)[:300]}]", 0, 0, chain[0][1]
 
 
 _GEMINI_FALLBACK_MARKER = "__GEMINI_UNAVAILABLE__\n"
 
 
+def _mark_gemini_fallback(result: tuple) -> tuple:
+    """Prefix _GEMINI_FALLBACK_MARKER when Agent 3 (Free) was served by a fallback provider."""
+    text, in_tok, out_tok, model = result
+    if model != GEMINI_FREE_MODEL and not text.startswith("["):
+        text = f"{_GEMINI_FALLBACK_MARKER}{text}"
+    return text, in_tok, out_tok, model
+
+
 def _agent_gemini_perf_security(message: str) -> tuple:
     """Agent 3 (Free) — Perf & Security Auditor.
     Primary: Gemini 2.5 Flash. Fallback: Mistral.
-    Returns (text, input_tokens, output_tokens)."""
+    Returns (text, input_tokens, output_tokens, served_model)."""
+    chain = _agent_chain("free", "perf_security_auditor")
     try:
-        m = genai.GenerativeModel(
-            GEMINI_FREE_MODEL,
-            system_instruction=_PERF_SECURITY_PROMPT,
-        )
-        resp = m.generate_content(message)
-        text = (resp.text or "").strip()
-        _um = getattr(resp, 'usage_metadata', None)
-        return (
-            text,
-            getattr(_um, 'prompt_token_count', 0) or 0,
-            getattr(_um, 'candidates_token_count', 0) or 0,
-        )
+        return _mark_gemini_fallback(_run_chain(chain, _PERF_SECURITY_PROMPT, message, 2048))
     except Exception as e:
-        err_str = str(e)
-        logger.warning("Gemini quota hit for Agent 3, falling back to Mistral: %s", err_str[:120])
-        try:
-            r = mistral_client.chat.completions.create(
-                model=REGULAR_MODEL,
-                messages=[
-                    {"role": "system", "content": _PERF_SECURITY_PROMPT},
-                    {"role": "user",   "content": message},
-                ],
-                max_tokens=2048,
-            )
-            mistral_analysis = (r.choices[0].message.content or "").strip()
-            u = getattr(r, 'usage', None)
-            return (
-                f"{_GEMINI_FALLBACK_MARKER}{mistral_analysis}",
-                getattr(u, 'prompt_tokens', 0) or 0,
-                getattr(u, 'completion_tokens', 0) or 0,
-            )
-        except Exception as e2:
-            logger.exception("Multi-debug Agent 3 Free fallback (Mistral Perf) also failed")
-            return f"[Perf & Security Auditor unavailable: {str(e2)[:300]}]", 0, 0
+        logger.exception("Multi-debug Agent 3 Free (Perf & Security) failed")
+        return f"[Perf & Security Auditor unavailable: {str(e)[:300]}]", 0, 0, chain[0][1]
 
 
-def _agent_mistral_synthesizer(original: str, logic: str, syntax: str, perf: str) -> tuple:
-    """Agent 4 (Free) — Synthesizer using Mistral.
-    Returns (text, input_tokens, output_tokens)."""
-    combined = (
+def _synthesis_input(original: str, logic: str, syntax: str, perf: str) -> str:
+    """User prompt handed to Agent 4 — the original input plus all three diagnoses."""
+    return (
         f"## Original Code / Bug Description\n{original}\n\n"
         f"---\n## Diagnosis from Agent 1 — Logic Analyst\n{logic}\n\n"
         f"---\n## Diagnosis from Agent 2 — Syntax & Runtime Inspector\n{syntax}\n\n"
@@ -599,92 +542,53 @@ def _agent_mistral_synthesizer(original: str, logic: str, syntax: str, perf: str
         f"Now build the unified issue map, resolve any conflicts between agents, "
         f"and produce the single complete fix."
     )
+
+
+def _synthesis_fallback(header: str, logic: str, syntax: str, perf: str) -> str:
+    """Raw agent diagnoses shown to the user when the synthesizer cannot run."""
+    return (
+        f"{header}\n\n"
+        f"**Logic Analyst:**\n{logic}\n\n"
+        f"**Syntax Inspector:**\n{syntax}\n\n"
+        f"**Perf & Security:**\n{perf}"
+    )
+
+
+def _agent_mistral_synthesizer(original: str, logic: str, syntax: str, perf: str) -> tuple:
+    """Agent 4 (Free) — Synthesizer using Mistral, failing over to Gemini Flash.
+    Returns (text, input_tokens, output_tokens, served_model)."""
+    chain = _agent_chain("free", "synthesizer")
+    combined = _synthesis_input(original, logic, syntax, perf)
     try:
-        r = mistral_client.chat.completions.create(
-            model=REGULAR_MODEL,
-            messages=[
-                {"role": "system", "content": _SYNTHESIZER_PROMPT},
-                {"role": "user",   "content": combined},
-            ],
-            max_tokens=4096,
-        )
-        text = (r.choices[0].message.content or "").strip()
-        u = getattr(r, 'usage', None)
-        return text, getattr(u, 'prompt_tokens', 0) or 0, getattr(u, 'completion_tokens', 0) or 0
+        return _run_chain(chain, _SYNTHESIZER_PROMPT, combined, 4096)
     except Exception as e:
         logger.exception("Multi-debug Agent 4 Free (Mistral Synth) failed")
-        return (
-            f"[Synthesizer error: {str(e)[:300]}]\n\n"
-            f"**Logic Analyst:**\n{logic}\n\n"
-            f"**Syntax Inspector:**\n{syntax}\n\n"
-            f"**Perf & Security:**\n{perf}",
-            0, 0,
-        )
+        return (_synthesis_fallback(f"[Synthesizer error: {str(e)[:300]}]", logic, syntax, perf),
+                0, 0, chain[0][1])
 
 
 def _agent_perf_security(message: str) -> tuple:
-    """Agent 3 (Premium) — Performance & Security Auditor: Claude Opus 4.5.
-    Returns (text, input_tokens, output_tokens)."""
+    """Agent 3 (Premium) — Performance & Security Auditor: Claude Opus 4.5, failing over to OpenAI.
+    Returns (text, input_tokens, output_tokens, served_model)."""
+    chain = _agent_chain("premium", "perf_security_auditor")
     try:
-        if not ANTHROPIC_API_KEY:
-            return "[Perf & Security Auditor unavailable: ANTHROPIC_API_KEY not configured]", 0, 0
-        import anthropic as _anthropic
-        client = _anthropic.Anthropic(api_key=ANTHROPIC_API_KEY)
-        msg = client.messages.create(
-            model=DEBUG_PERF_MODEL,
-            max_tokens=2048,
-            system=_PERF_SECURITY_PROMPT,
-            messages=[{"role": "user", "content": message}],
-        )
-        text = (msg.content[0].text or "").strip()
-        return text, msg.usage.input_tokens or 0, msg.usage.output_tokens or 0
+        return _run_chain(chain, _PERF_SECURITY_PROMPT, message, 2048)
     except Exception as e:
         logger.exception("Multi-debug Agent 3 (Perf & Security) failed")
-        return f"[Perf & Security Auditor unavailable: {str(e)[:300]}]", 0, 0
+        return f"[Perf & Security Auditor unavailable: {str(e)[:300]}]", 0, 0, chain[0][1]
 
 
 def _agent_synthesizer(original: str, logic: str, syntax: str, perf: str, model: str = None) -> tuple:
-    """Agent 4 — Synthesizer: Claude Sonnet 4.5 (premium).
-    Returns (text, input_tokens, output_tokens)."""
-    model = model or DEBUG_SYNTH_MODEL
-    combined = (
-        f"## Original Code / Bug Description\n{original}\n\n"
-        f"---\n## Diagnosis from Agent 1 — Logic Analyst\n{logic}\n\n"
-        f"---\n## Diagnosis from Agent 2 — Syntax & Runtime Inspector\n{syntax}\n\n"
-        f"---\n## Diagnosis from Agent 3 — Performance & Security Auditor\n{perf}\n\n"
-        f"---\n"
-        f"All three agents have completed their diagnosis. "
-        f"Now build the unified issue map, resolve any conflicts between agents, "
-        f"and produce the single complete fix."
-    )
+    """Agent 4 — Synthesizer: Claude Sonnet 4.5 (premium), failing over to OpenAI.
+    Returns (text, input_tokens, output_tokens, served_model)."""
+    chain = _agent_chain("premium", "synthesizer", model)
+    combined = _synthesis_input(original, logic, syntax, perf)
     try:
-        if not ANTHROPIC_API_KEY:
-            return (
-                "[Synthesizer unavailable: ANTHROPIC_API_KEY not configured]\n\n"
-                f"**Logic Analyst:**\n{logic}\n\n"
-                f"**Syntax Inspector:**\n{syntax}\n\n"
-                f"**Perf & Security:**\n{perf}",
-                0, 0,
-            )
-        import anthropic as _anthropic
-        client = _anthropic.Anthropic(api_key=ANTHROPIC_API_KEY)
-        msg = client.messages.create(
-            model=model,
-            max_tokens=4096,
-            system=_SYNTHESIZER_PROMPT,
-            messages=[{"role": "user", "content": combined}],
-        )
-        text = (msg.content[0].text or "").strip()
-        return text, msg.usage.input_tokens or 0, msg.usage.output_tokens or 0
+        return _run_chain(chain, _SYNTHESIZER_PROMPT, combined, 4096)
     except Exception as e:
         logger.exception("Multi-debug Agent 4 (Synthesizer) failed")
-        return (
-            f"[Synthesizer error: {str(e)[:300]}]\n\n"
-            f"**Logic Analyst:**\n{logic}\n\n"
-            f"**Syntax Inspector:**\n{syntax}\n\n"
-            f"**Perf & Security:**\n{perf}",
-            0, 0,
-        )
+        return (_synthesis_fallback(f"[Synthesizer error: {str(e)[:300]}]", logic, syntax, perf),
+                0, 0, chain[0][1])
 
 
 # ================================
@@ -712,11 +616,7 @@ def _is_valid_image(data: bytes) -> bool:
 # Token / Character Limits
 # ================================
 
-# ~4 chars per token is a safe approximation for English text
-_CHARS_PER_TOKEN = 4
-# Keep context well under the model's 32k limit; reserve ~1000 tokens for the reply
-_MAX_CONTEXT_TOKENS = 28_000
-_MAX_CONTEXT_CHARS = _MAX_CONTEXT_TOKENS * _CHARS_PER_TOKEN
+# Context-window budgets and per-model token estimates live in chat/context.py.
 # Hard cap on a single incoming user message (~4000 tokens)
 _MAX_MESSAGE_CHARS = 16_000
 
@@ -725,60 +625,196 @@ _MAX_MESSAGE_CHARS = 16_000
 # Internal Helper Functions
 # ================================
 
-_uncensored_client: "OpenAIClient | None" = None
-
-def get_uncensored_client() -> OpenAIClient:
+def get_uncensored_client() -> "openai.OpenAI":
     """
-    Return a cached OpenAI-compatible client pointed at OpenRouter.
-    Built once on first call (lazy singleton) — avoids reconstructing the
-    HTTP client on every uncensored request.
+    Return the shared OpenAI-compatible client pointed at OpenRouter
+    (pooled via chat.clients — no HTTP client is rebuilt per request).
     SDK retries are disabled — _with_retries() manages retry logic instead.
     """
-    global _uncensored_client
-    if _uncensored_client is not None:
-        return _uncensored_client
-
     api_key = os.getenv("OPENROUTER_API_KEY")
     frontend_url = os.getenv("FRONTEND_URL", "http://localhost:3000")
 
     if not api_key:
         raise RuntimeError("OPENROUTER_API_KEY missing at runtime")
 
-    _uncensored_client = OpenAIClient(
-        api_key=api_key,
-        base_url="https://openrouter.ai/api/v1",
+    return get_client(
+        "openrouter",
+        api_key,
+        _OPENROUTER_BASE_URL,
         max_retries=0,
-        default_headers={
+        headers={
             "Referer": frontend_url,
             "X-Title": "AI Chatbox",
         },
     )
-    return _uncensored_client
 
 
-def _trim_to_token_limit(messages: list[dict]) -> list[dict]:
+# High-temperature sampling for the uncensored model (shared by every call path)
+_UNCENSORED_PARAMS = {
+    "temperature": 1.1,
+    "top_p": 0.95,
+    "frequency_penalty": 0.2,
+    "max_tokens": 1024,
+    "timeout": 90,
+}
+
+
+def _completion_result(r) -> tuple:
+    """(text, input_tokens, output_tokens) from an OpenAI-compatible completion."""
+    text = (r.choices[0].message.content or "").strip()
+    u = getattr(r, 'usage', None)
+    return text, getattr(u, 'prompt_tokens', 0) or 0, getattr(u, 'completion_tokens', 0) or 0
+
+
+def _gemini_result(resp) -> tuple:
+    """(text, input_tokens, output_tokens) from a Gemini generate_content response."""
+    text = (resp.text or "").strip()
+    _um = getattr(resp, 'usage_metadata', None)
+    return (
+        text,
+        getattr(_um, 'prompt_token_count', 0) or 0,
+        getattr(_um, 'candidates_token_count', 0) or 0,
+    )
+
+
+# ================================
+# Provider adapters and failover chains (chat/failover.py)
+# ================================
+
+# Ordered (provider, model) steps. The first step is the provider the
+# feature was built for; later steps take over while it is failing or its
+# circuit breaker is open. Chat streams need every step to support
+# streaming (see _open_provider_stream).
+_CHAT_CHAINS = {
+    "regular":    (("mistral", REGULAR_MODEL), ("gemini", GEMINI_FREE_MODEL)),
+    "uncensored": (("openrouter", UNCENSORED_MODEL),),
+}
+
+_AGENT_CHAINS = {
+    ("free", "logic_analyst"):            (("mistral", REGULAR_MODEL), ("gemini", GEMINI_FREE_MODEL)),
+    ("free", "syntax_inspector"):         (("mistral", REGULAR_MODEL), ("gemini", GEMINI_FREE_MODEL)),
+    ("free", "perf_security_auditor"):    (("gemini", GEMINI_FREE_MODEL), ("mistral", REGULAR_MODEL)),
+    ("free", "synthesizer"):              (("mistral", REGULAR_MODEL), ("gemini", GEMINI_FREE_MODEL)),
+    ("premium", "logic_analyst"):         (("gemini", GEMINI_DEBUG_MODEL), ("openai", DEBUG_SYNTAX_MODEL)),
+    ("premium", "syntax_inspector"):      (("openai", DEBUG_SYNTAX_MODEL), ("gemini", GEMINI_DEBUG_MODEL)),
+    ("premium", "perf_security_auditor"): (("anthropic", DEBUG_PERF_MODEL), ("openai", DEBUG_SYNTAX_MODEL)),
+    ("premium", "synthesizer"):           (("anthropic", DEBUG_SYNTH_MODEL), ("openai", DEBUG_SYNTAX_MODEL)),
+}
+
+_PROVIDER_TIMEOUT = 90  # seconds per attempt
+
+
+def _agent_chain(tier: str, role: str, model: str = None) -> tuple:
+    """Failover chain for a multi-debug agent; `model` overrides the first step's model."""
+    chain = _AGENT_CHAINS[(tier, role)]
+    if model:
+        chain = ((chain[0][0], model), *chain[1:])
+    return chain
+
+
+def _split_system(messages: list[dict]) -> tuple:
+    """(system_text or None, the remaining messages) — for providers that take the system prompt separately."""
+    system = "\n\n".join(m["content"] for m in messages if m["role"] == "system")
+    return system or None, [m for m in messages if m["role"] != "system"]
+
+
+def _gemini_contents(messages: list[dict]) -> tuple:
+    """(system_instruction, contents) for an OpenAI-style message list."""
+    system, rest = _split_system(messages)
+    contents = [
+        {"role": "model" if m["role"] == "assistant" else "user", "parts": [m["content"]]}
+        for m in rest
+    ]
+    return system, contents
+
+
+def _openai_compatible_client(provider: str):
+    if provider == "mistral":
+        return _mistral_client()
+    if provider == "openrouter":
+        return get_uncensored_client()
+    if provider == "openai":
+        return get_client("openai", OPENAI_API_KEY)
+    raise ValueError(f"Unknown provider: {provider}")
+
+
+def _complete(provider: str, model: str, messages: list[dict], max_tokens: int = None) -> tuple:
+    """
+    One blocking completion on any provider.
+    Returns (text, input_tokens, output_tokens); raises on failure.
+    """
+    if provider == "gemini":
+        system, contents = _gemini_contents(messages)
+        m = genai.GenerativeModel(model, system_instruction=system)
+        resp = m.generate_content(
+            contents,
+            generation_config={"max_output_tokens": max_tokens} if max_tokens else None,
+            request_options={"timeout": _PROVIDER_TIMEOUT},
+        )
+        return _gemini_result(resp)
+
+    if provider == "anthropic":
+        system, rest = _split_system(messages)
+        extra = {"system": system} if system else {}
+        msg = get_client("anthropic", ANTHROPIC_API_KEY).messages.create(
+            model=model,
+            max_tokens=max_tokens or 4096,
+            messages=rest,
+            timeout=_PROVIDER_TIMEOUT,
+            **extra,
+        )
+        return _anthropic_result(msg)
+
+    extra = {"max_tokens": max_tokens} if max_tokens else {}
+    r = _openai_compatible_client(provider).chat.completions.create(
+        model=model,
+        messages=messages,
+        timeout=_PROVIDER_TIMEOUT,
+        **extra,
+    )
+    return _completion_result(r)
+
+
+def _anthropic_result(msg) -> tuple:
+    """(text, input_tokens, output_tokens) from an Anthropic message."""
+    return (msg.content[0].text or "").strip(), msg.usage.input_tokens or 0, msg.usage.output_tokens or 0
+
+
+def _run_chain(chain, system_prompt: str, content: str, max_tokens: int) -> tuple:
     """
-    Drop the oldest messages from the history until the total character
-    count fits within _MAX_CONTEXT_CHARS. Prevents hitting the model's
-    context window limit on long conversations.
+    Single-turn completion through a failover chain.
+    Returns (text, input_tokens, output_tokens, served_model); raises when
+    every provider failed or is unavailable.
     """
-    while messages:
-        total = sum(len(m.get("content") or "") for m in messages)
-        if total <= _MAX_CONTEXT_CHARS:
-            break
-        messages = messages[1:]
-    return messages
+    messages = [
+        {"role": "system", "content": system_prompt},
+        {"role": "user",   "content": content},
+    ]
+    result, _, model = failover.run(chain, lambda provider, m: _complete(provider, m, messages, max_tokens))
+    return (*result, model)
+
+
+def _providers_unavailable(e) -> Response:
+    """503 for a chain whose providers are all behind an open circuit breaker."""
+    retry_after = max(1, math.ceil(e.retry_after))
+    response = Response(
+        {
+            "error": f"The AI providers are temporarily unavailable. Please try again in {retry_after} seconds.",
+            "retry_after": retry_after,
+        },
+        status=status.HTTP_503_SERVICE_UNAVAILABLE,
+    )
+    response["Retry-After"] = str(retry_after)
+    return response
 
 
 def _mistral_chat_reply(messages: list[dict]) -> tuple:
     """Send a conversation history to Mistral and return (reply_text, input_tokens, output_tokens)."""
-    r = mistral_client.chat.completions.create(
+    r = _mistral_client().chat.completions.create(
         model=REGULAR_MODEL,
         messages=messages,
     )
-    text = (r.choices[0].message.content or "").strip()
-    u = getattr(r, 'usage', None)
-    return text, getattr(u, 'prompt_tokens', 0) or 0, getattr(u, 'completion_tokens', 0) or 0
+    return _completion_result(r)
 
 
 def _uncensored_chat_reply(messages: list[dict]) -> tuple:
@@ -790,28 +826,248 @@ def _uncensored_chat_reply(messages: list[dict]) -> tuple:
     r = client.chat.completions.create(
         model=UNCENSORED_MODEL,
         messages=messages,
-        temperature=1.1,
-        top_p=0.95,
-        frequency_penalty=0.2,
-        max_tokens=1024,
-        timeout=90,
+        **_UNCENSORED_PARAMS,
     )
-    text = (r.choices[0].message.content or "").strip()
-    u = getattr(r, 'usage', None)
-    return text, getattr(u, 'prompt_tokens', 0) or 0, getattr(u, 'completion_tokens', 0) or 0
+    return _completion_result(r)
+
+
+def _chat_model_for(mode: str) -> str:
+    """Model name billed for a regular/uncensored chat turn."""
+    return UNCENSORED_MODEL if mode == "uncensored" else REGULAR_MODEL
+
+
+def _summary_completion(mode: str, messages: list[dict], max_tokens: int) -> tuple:
+    """
+    Low-temperature completion used by chat/summaries.py to maintain a
+    session's rolling summary, on the same provider as the session's mode.
+    Returns (text, input_tokens, output_tokens).
+    """
+    if mode == "uncensored":
+        client, model = get_uncensored_client(), UNCENSORED_MODEL
+    else:
+        client, model = _mistral_client(), REGULAR_MODEL
+    r = client.chat.completions.create(
+        model=model,
+        messages=messages,
+        temperature=0.2,
+        max_tokens=max_tokens,
+        timeout=60,
+    )
+    return _completion_result(r)
+
+
+def _chat_reply(mode: str, messages: list[dict]) -> tuple:
+    """
+    Blocking reply for a chat turn from the first healthy provider in the
+    mode's failover chain. Returns (reply_text, input_tokens, output_tokens, model).
+    """
+    def attempt(provider, model):
+        if provider == "mistral":
+            if hedging.enabled():
+                return _hedged_chat_reply(mode, provider, model, messages)
+            return (*_mistral_chat_reply(messages), model)
+        if provider == "openrouter":
+            return (*_uncensored_chat_reply(messages), model)
+        return (*_complete(provider, model, messages), model)
+
+    started = time.monotonic()
+    result, _, _ = failover.run(_CHAT_CHAINS[mode], attempt)
+    metrics.observe("chat.reply", time.monotonic() - started)
+    return result
+
+
+def _streamed_reply(provider: str, model: str, messages: list[dict], attempt) -> tuple:
+    """
+    A blocking chat reply read from a provider stream, reporting the first
+    token to a chat/hedging.py Attempt and stopping once it is cancelled.
+    Returns (reply_text, input_tokens, output_tokens, model).
+    """
+    stream = _open_provider_stream(provider, model, messages)
+    parts, usage = [], None
+    try:
+        for kind, payload in _iter_chat_stream(stream):
+            attempt.check()
+            if kind == "delta":
+                attempt.token()
+                parts.append(payload)
+            else:
+                usage = payload
+    finally:
+        _close_quietly(stream)
+    text = "".join(parts).strip()
+    if usage is None:
+        usage = (sum(message_tokens(model, m) for m in messages), estimate_tokens(model, text))
+    return (text, *usage, model)
+
+
+def _hedged_chat_reply(mode: str, provider: str, model: str, messages: list[dict]) -> tuple:
+    """_streamed_reply with a hedge request when the first token is late (chat/hedging.py)."""
+    hedge_provider, hedge_model = hedging.hedge_target(_CHAT_CHAINS[mode], provider, model)
+    result, _ = hedging.run(
+        lambda attempt: _streamed_reply(provider, model, messages, attempt),
+        lambda attempt: _streamed_reply(hedge_provider, hedge_model, messages, attempt),
+        provider, hedge_provider,
+    )
+    return result
+
+
+def _open_provider_stream(provider: str, model: str, messages: list[dict], max_tokens: int = None):
+    """Start a streaming completion on one provider (OpenAI-style chunks)."""
+    if provider == "gemini":
+        system, contents = _gemini_contents(messages)
+        m = genai.GenerativeModel(model, system_instruction=system)
+        # stream=True fetches the first chunk here, so errors surface now
+        return _gemini_chunks(m.generate_content(
+            contents,
+            stream=True,
+            generation_config={"max_output_tokens": max_tokens} if max_tokens else None,
+            request_options={"timeout": _PROVIDER_TIMEOUT},
+        ))
+    if provider == "anthropic":
+        system, rest = _split_system(messages)
+        extra = {"system": system} if system else {}
+        return _anthropic_chunks(get_client("anthropic", ANTHROPIC_API_KEY).messages.create(
+            model=model,
+            max_tokens=max_tokens or 4096,
+            messages=rest,
+            stream=True,
+            timeout=_PROVIDER_TIMEOUT,
+            **extra,
+        ))
+    extra = {"max_tokens": max_tokens} if max_tokens else {}
+    if provider == "openrouter":
+        return get_uncensored_client().chat.completions.create(
+            model=model,
+            messages=messages,
+            **_UNCENSORED_PARAMS,
+            stream=True,
+            # OpenRouter only sends the usage frame when asked to
+            stream_options={"include_usage": True},
+        )
+    if provider == "openai":
+        return get_client("openai", OPENAI_API_KEY).chat.completions.create(
+            model=model,
+            messages=messages,
+            stream=True,
+            stream_options={"include_usage": True},
+            timeout=_PROVIDER_TIMEOUT,
+            **extra,
+        )
+    # Mistral always appends usage to the final chunk
+    return _mistral_client().chat.completions.create(
+        model=model,
+        messages=messages,
+        stream=True,
+        **extra,
+    )
+
+
+def _gemini_chunks(response):
+    """Re-shape a streaming Gemini response into the OpenAI-style chunks _iter_chat_stream reads."""
+    for chunk in response:
+        try:
+            text = chunk.text
+        except ValueError:   # chunk without text parts (e.g. a safety stop)
+            text = None
+        _um = getattr(chunk, "usage_metadata", None)
+        usage = SimpleNamespace(
+            prompt_tokens=getattr(_um, "prompt_token_count", 0) or 0,
+            completion_tokens=getattr(_um, "candidates_token_count", 0) or 0,
+        ) if _um else None
+        yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=text))], usage=usage)
+
+
+def _anthropic_chunks(stream):
+    """
+    Re-shape Anthropic stream events into OpenAI-style chunks: text deltas,
+    then one usage chunk (input tokens arrive in message_start, output
+    tokens in message_delta). Closing the generator closes the HTTP stream.
+    """
+    in_tok = 0
+    try:
+        for event in stream:
+            if event.type == "message_start":
+                in_tok = event.message.usage.input_tokens or 0
+            elif event.type == "content_block_delta" and getattr(event.delta, "text", None):
+                yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=event.delta.text))], usage=None)
+            elif event.type == "message_delta":
+                yield SimpleNamespace(choices=[], usage=SimpleNamespace(
+                    prompt_tokens=in_tok, completion_tokens=event.usage.output_tokens or 0,
+                ))
+    finally:
+        _close_quietly(stream)
+
+
+def _open_chat_stream(mode: str, messages: list[dict]) -> tuple:
+    """
+    Start a streaming completion for a chat turn on the first healthy
+    provider in the mode's failover chain. Returns (stream, model).
+    Uses the same model parameters as the blocking _*_chat_reply helpers.
+    Upstream errors (429, 5xx) are raised here, before any event is sent,
+    so _with_retries can handle them exactly as in the blocking path.
+    """
+    stream, _, model = failover.run(
+        _CHAT_CHAINS[mode],
+        lambda provider, m: _open_provider_stream(provider, m, messages),
+    )
+    return stream, model
+
+
+def _iter_chat_stream(stream):
+    """
+    Normalise an OpenAI-compatible chunk stream into
+    ("delta", text) items followed by at most one ("usage", (in_tok, out_tok)).
+    """
+    usage = None
+    for chunk in stream:
+        texts, chunk_usage = _parse_chunk(chunk)
+        usage = chunk_usage or usage
+        for text in texts:
+            yield "delta", text
+    if usage:
+        yield "usage", usage
+
+
+def _parse_chunk(chunk) -> tuple:
+    """([delta texts], (in_tok, out_tok) or None) for one OpenAI-compatible stream chunk."""
+    u = getattr(chunk, "usage", None)
+    usage = (getattr(u, "prompt_tokens", 0) or 0, getattr(u, "completion_tokens", 0) or 0) if u else None
+    texts = []
+    for choice in getattr(chunk, "choices", None) or []:
+        delta = getattr(choice, "delta", None)
+        text = getattr(delta, "content", None) if delta else None
+        if text:
+            texts.append(text)
+    return texts, usage
+
+
+def _close_quietly(stream) -> None:
+    """Close an SDK stream (drops the upstream HTTP connection), ignoring errors."""
+    try:
+        stream.close()
+    except Exception:
+        pass
+
 
+def _sse_frame(event: str, data) -> str:
+    """Encode one Server-Sent Events frame."""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
 
-def _gemini_extract_text_from_file(file_path: str, mime_type: Optional[str] = None) -> tuple:
+
+def _gemini_extract_text_from_file(file_path, mime_type: Optional[str] = None) -> tuple:
     """
     Upload a file (image / PDF / plain text) to Gemini and extract its
-    raw text content. Used by the OCR upload endpoint.
+    raw text content. Used by the OCR upload endpoint. `file_path` is a
+    path or a binary file object (which needs `mime_type`).
     Returns (text, input_tokens, output_tokens).
     """
     file = genai.upload_file(file_path, mime_type=mime_type)
     model = genai.GenerativeModel(GEMINI_FILE_MODEL)
     prompt = (
         "Extract the raw text content from this file as accurately as possible. "
-        "No extra commentary—just the text in reading order."
+        "No extra commentary—just the text in reading order. "
+        "If the file has more than one page, start each page with a line "
+        "of the form '--- Page N ---'."
     )
     resp = model.generate_content([prompt, file])
     text = (resp.text or "").strip()
@@ -823,7 +1079,7 @@ def _gemini_extract_text_from_file(file_path: str, mime_type: Optional[str] = No
     )
 
 
-def _get_retry_after(e: APIStatusError) -> int:
+def _get_retry_after(e: "openai.APIStatusError") -> int:
     """
     Parse the wait time (seconds) from an API 429 error response.
     Checks standard 'Retry-After' first, then OpenRouter's
@@ -849,55 +1105,160 @@ def _get_retry_after(e: APIStatusError) -> int:
 def _rate_limit_response(retry_after: int, base_delay: int) -> Response:
     """Build a user-friendly 429 response that includes the wait time in seconds."""
     ra = retry_after or base_delay
-    return Response(
+    response = Response(
         {
             "error": f"The AI provider is rate-limiting requests. Please wait {ra} seconds and try again.",
             "retry_after": ra,
         },
         status=429,
     )
+    response["Retry-After"] = str(ra)
+    return response
+
+
+def _unavailable_response(code: int, retry_after: int) -> Response:
+    """503 for an upstream 502/503/504 whose Retry-After was too long to wait out here."""
+    response = Response(
+        {
+            "error": f"The AI provider is temporarily unavailable ({code}). Please wait {retry_after} seconds and try again.",
+            "retry_after": retry_after,
+        },
+        status=503,
+    )
+    response["Retry-After"] = str(retry_after)
+    return response
 
 
-def _with_retries(call_fn, max_attempts: int = 2, base_delay: int = 2):
+def _retry_plan(e: "openai.APIStatusError", attempt: int, max_attempts: int, base_delay: int,
+                provider: str = "default", max_delay: float = retries.MAX_DELAY) -> tuple:
+    """
+    Decide what to do after an upstream APIStatusError (or a failover.UpstreamError
+    from an anthropic / Gemini step) on try number `attempt` (0-based).
+    Returns (delay_seconds, None) to retry after waiting, or (None, Response)
+    to give up. Shared by the sync and async retry loops.
+
+    Waits longer than max_delay are not taken: the error goes back to the
+    client with Retry-After instead (429, or 503 for a 502/503/504). Each
+    retry is drawn from the provider's retry budget (chat/retries.py).
+    """
+    code = getattr(e, "status_code", None)
+    retry_after = _get_retry_after(e)
+    retryable = code in (429, 502, 503, 504)
+    handed_off = False
+
+    if retryable and attempt < max_attempts - 1:
+        # For 429: only retry if the provider told us how long to wait.
+        # Free-tier models (e.g. OpenRouter :free) hit per-minute limits
+        # with no retry-after — blind backoff just wastes time and still
+        # returns 429, so fall through to the error return below.
+        if not (code == 429 and retry_after == 0):
+            delay = retries.backoff(attempt, base_delay, retry_after, cap=max_delay)
+            if delay > max_delay:
+                metrics.incr(f"llm.retry_handed_off.{provider}")
+                handed_off = True
+            elif retries.allow_retry(provider):
+                return delay, None
+
+    if code == 429:
+        return None, _rate_limit_response(retry_after, base_delay)
+    if handed_off:
+        return None, _unavailable_response(code, retry_after)
+    # Map any upstream error to 502 so it is never mistaken for a
+    # missing Django route (e.g. a 404 from OpenRouter becoming a
+    # Django "Not Found" response).
+    return None, Response({"error": f"Upstream error ({code})"}, status=502)
+
+
+def _with_retries(call_fn, max_attempts: int = 2, base_delay: int = 2, provider: str = "default") -> tuple:
     """
     Call call_fn() and retry on transient upstream errors (429, 502, 503, 504)
-    using exponential backoff. Returns either the function's result or a
-    DRF Response on unrecoverable failure.
+    using jittered exponential backoff. Returns (result, retries_made), where
+    result is the function's result or a DRF Response on unrecoverable failure.
+
+    This runs in a worker thread, so only short waits (retries.MAX_INLINE_DELAY)
+    are slept here; a longer Retry-After from the provider is returned to the
+    client as a 429 rather than holding the thread.
+
+    When every provider in the failover chain is behind an open circuit
+    breaker, returns a 503 with Retry-After instead of waiting.
 
     - max_attempts: total number of tries (including the first)
-    - base_delay:   seconds to wait before the first retry (doubles each attempt)
+    - base_delay:   backoff ceiling before the first retry (doubles each attempt)
+    - provider:     whose retry budget the retries are drawn from
     """
+    retries.budget(provider).record_request()
     attempt = 0
     while True:
         try:
-            return call_fn()
-        except APIStatusError as e:
-            code = getattr(e, "status_code", None)
-            retry_after = _get_retry_after(e)
-            retryable = code in (429, 502, 503, 504)
-
-            if retryable and attempt < max_attempts - 1:
-                delay = retry_after or (base_delay * (2 ** attempt))
-                # For 429: only retry if the provider told us how long to wait
-                # AND the wait is short enough to hold the request open.
-                # Free-tier models (e.g. OpenRouter :free) hit per-minute limits
-                # with no retry-after — blind backoff just wastes time and still
-                # returns 429, so fall through to the error return below.
-                should_retry = not (code == 429 and (retry_after == 0 or delay > 20))
-                if should_retry:
-                    time.sleep(delay)
-                    attempt += 1
-                    continue
-
-            if code == 429:
-                return _rate_limit_response(retry_after, base_delay)
-            # Map any upstream error to 502 so it is never mistaken for a
-            # missing Django route (e.g. a 404 from OpenRouter becoming a
-            # Django "Not Found" response).
-            return Response({"error": f"Upstream error ({code})"}, status=502)
-        except APIError:
+            return call_fn(), attempt
+        except (openai.APIStatusError, failover.UpstreamError) as e:
+            if e.status_code is None:
+                logger.exception("LLM client error in _with_retries")
+                return Response({"error": _SERVER_ERROR}, status=502), attempt
+            delay, failure = _retry_plan(e, attempt, max_attempts, base_delay,
+                                         provider=provider, max_delay=retries.MAX_INLINE_DELAY)
+            if failure is not None:
+                return failure, attempt
+            time.sleep(delay)
+            attempt += 1
+        except openai.APIError:
             logger.exception("LLM client error in _with_retries")
-            return Response({"error": _SERVER_ERROR}, status=502)
+            return Response({"error": _SERVER_ERROR}, status=502), attempt
+        except failover.NoHealthyProvider as e:
+            return _providers_unavailable(e), attempt
+
+
+def _with_retry_count(response, retries_made: int):
+    """Expose how many upstream retries a request took (X-Retry-Count, and in error bodies)."""
+    response["X-Retry-Count"] = str(retries_made)
+    if response.status_code >= 400 and isinstance(getattr(response, "data", None), dict):
+        response.data["retries"] = retries_made
+    return response
+
+
+# ================================
+# Request coalescing (chat/single_flight.py)
+# ================================
+
+_DUPLICATE_IN_PROGRESS = "An identical request is still being processed. Please retry shortly."
+
+
+def _replayed_response(result: dict) -> Response:
+    response = Response(result["data"], status=result["status"])
+    response["Idempotent-Replayed"] = "true"
+    return response
+
+
+def _coalesced(request, scope: str, run):
+    """
+    Run `run()` (returning a Response) at most once per idempotency key.
+    Concurrent duplicates wait for the first request and get its response;
+    completed 200 responses are replayed for a short window. Errors are never
+    replayed — a duplicate of a failed request runs again, and so does a
+    duplicate of a request that has gone stale (single_flight.STALE_AFTER).
+    """
+    key, ttl = single_flight.flight_key(scope, request)
+    for _ in range(2):
+        leader, replay = single_flight.begin(key)
+        if leader:
+            break
+        if replay is None:
+            state, replay = single_flight.wait(key)
+            if state == "gone":
+                continue  # the first request failed — take over
+            if state == "stale":
+                return run()  # don't wait on a leader that may be dead; the key stays its own
+        return _replayed_response(replay)
+    if not leader:
+        return Response({"error": _DUPLICATE_IN_PROGRESS}, status=status.HTTP_409_CONFLICT)
+
+    try:
+        response = run()
+    except Exception:
+        single_flight.finish(key, ttl)
+        raise
+    single_flight.finish(key, ttl, response.data if response.status_code == 200 else None)
+    return response
 
 
 # ================================
@@ -935,110 +1296,168 @@ def create_session(request):
     }, status=201)
 
 
-class ChatView(APIView):
+def _prepare_chat_turn(request):
     """
-    POST /api/chat/
-    Send a message and receive an AI reply.
-    Body: { message, session_id?, mode? }
-    Returns: { reply, session_id, title }
+    Validate a chat request, resolve its session and build the LLM context.
+    Returns (turn, None) on success or (None, Response) when the request must
+    be rejected. Shared by ChatView and ChatStreamView so both endpoints apply
+    exactly the same checks.
+
+    turn keys: mode, user_message, session, session_id, trim_from_id,
+               version_data, messages
     """
-    authentication_classes = [CsrfExemptSessionAuthentication]
-    permission_classes = [IsAuthenticated]
-    throttle_classes = [_LLMChatThrottle]
+    mode = request.data.get("mode", "regular")
+    if mode not in _VALID_MODES:
+        return None, Response({"error": f"Invalid mode. Must be one of: {', '.join(_VALID_MODES)}"}, status=status.HTTP_400_BAD_REQUEST)
 
-    def post(self, request):
-        try:
-            mode = request.data.get("mode", "regular")
-            if mode not in _VALID_MODES:
-                return Response({"error": f"Invalid mode. Must be one of: {', '.join(_VALID_MODES)}"}, status=status.HTTP_400_BAD_REQUEST)
+    ev = _check_email_verified(request.user)
+    if ev:
+        return None, ev
 
-            ev = _check_email_verified(request.user)
-            if ev:
-                return ev
+    ban = _check_feature_ban(request.user, mode)
+    if ban:
+        return None, ban
 
-            ban = _check_feature_ban(request.user, mode)
-            if ban:
-                return ban
+    user_message = request.data.get("message")
 
-            user_message = request.data.get("message")
+    # Validate the incoming message
+    if not user_message:
+        return None, Response(
+            {"error": "Message is required"},
+            status=status.HTTP_400_BAD_REQUEST
+        )
 
-            # Validate the incoming message
-            if not user_message:
-                return Response(
-                    {"error": "Message is required"},
-                    status=status.HTTP_400_BAD_REQUEST
-                )
+    if len(user_message) > _MAX_MESSAGE_CHARS:
+        return None, Response(
+            {"error": f"Message too long. Maximum {_MAX_MESSAGE_CHARS} characters allowed."},
+            status=status.HTTP_400_BAD_REQUEST
+        )
 
-            if len(user_message) > _MAX_MESSAGE_CHARS:
-                return Response(
-                    {"error": f"Message too long. Maximum {_MAX_MESSAGE_CHARS} characters allowed."},
-                    status=status.HTTP_400_BAD_REQUEST
-                )
+    incoming_session_id = request.data.get("session_id")
 
-            incoming_session_id = request.data.get("session_id")
+    # Resolve or create the session, always scoped to the logged-in user.
+    # If the session exists but belongs to a different mode (e.g. the user
+    # switched modes while a regular-session URL was still active), silently
+    # create a fresh session in the correct mode instead of erroring.
+    if incoming_session_id:
+        session = ChatSession.objects.filter(
+            session_id=incoming_session_id,
+            user=request.user
+        ).first()
 
-            # Resolve or create the session, always scoped to the logged-in user.
-            # If the session exists but belongs to a different mode (e.g. the user
-            # switched modes while a regular-session URL was still active), silently
-            # create a fresh session in the correct mode instead of erroring.
-            if incoming_session_id:
-                session = ChatSession.objects.filter(
-                    session_id=incoming_session_id,
-                    user=request.user
-                ).first()
+        if not session:
+            return None, Response(
+                {"error": _SESSION_NOT_FOUND},
+                status=status.HTTP_404_NOT_FOUND
+            )
 
-                if not session:
-                    return Response(
-                        {"error": _SESSION_NOT_FOUND},
-                        status=status.HTTP_404_NOT_FOUND
-                    )
+        if session.mode != mode:
+            session_id = _ensure_session(None, mode, user=request.user)
+            session = ChatSession.objects.get(session_id=session_id)
+        else:
+            session_id = session.session_id
+    else:
+        session_id = _ensure_session(None, mode, user=request.user)
+        session = ChatSession.objects.get(session_id=session_id)
 
-                if session.mode != mode:
-                    session_id = _ensure_session(None, mode, user=request.user)
-                    session = ChatSession.objects.get(session_id=session_id)
-                else:
-                    session_id = session.session_id
-            else:
-                session_id = _ensure_session(None, mode, user=request.user)
-                session = ChatSession.objects.get(session_id=session_id)
+    # Parse edit/version params
+    raw_trim = request.data.get("trim_from_id")
+    try:
+        trim_from_id = int(raw_trim) if raw_trim is not None else None
+        if trim_from_id is not None and trim_from_id <= 0:
+            trim_from_id = None
+    except (TypeError, ValueError):
+        trim_from_id = None
+
+    version_data = request.data.get("version_data") or None
+
+    # Auto-set the session title from the first message if still empty.
+    _update_title_if_empty(session_id, user_message)
+    session.refresh_from_db(fields=["title"])
+
+    # Pull as much recent history as fits the model's prompt budget, walking
+    # newest → oldest. Turns already folded into the rolling summary are
+    # replaced by the summary itself. The current user message is NOT yet
+    # saved — it is passed separately so that a 429 leaves no orphaned row.
+    history_qs = Message.objects.filter(session_id=session_id, mode=mode)
+    if session.summary_through_id:
+        history_qs = history_qs.filter(id__gt=session.summary_through_id)
+    history_qs = history_qs.order_by("-timestamp").values("role", "content")[:MAX_HISTORY_MESSAGES]
+    messages, _ = build_context(
+        _chat_model_for(mode),
+        mode,
+        history_qs.iterator(chunk_size=50),
+        {"role": "user", "content": user_message},
+        prefix=[summary_message(session.summary)] if session.summary else None,
+    )
 
-            # Parse edit/version params
-            raw_trim = request.data.get("trim_from_id")
-            try:
-                trim_from_id = int(raw_trim) if raw_trim is not None else None
-                if trim_from_id is not None and trim_from_id <= 0:
-                    trim_from_id = None
-            except (TypeError, ValueError):
-                trim_from_id = None
-
-            version_data = request.data.get("version_data") or None
-
-            # Auto-set the session title from the first message if still empty.
-            _update_title_if_empty(session_id, user_message)
-            session.refresh_from_db(fields=["title"])
-
-            # Fetch the last 10 messages as context for the LLM (oldest first).
-            # The current user message is NOT yet saved — we append it explicitly
-            # so that a 429 leaves no orphaned row in the DB.
-            history_qs = (
-                Message.objects
-                .filter(session_id=session_id, mode=mode)
-                .order_by("-timestamp")[:10][::-1]
-            )
-            messages = [
-                {"role": m.role, "content": m.content}
-                for m in history_qs
-            ]
-            messages = _trim_to_token_limit(messages)
-            # Append the current turn so the LLM sees it even though it isn't saved yet.
-            messages.append({"role": "user", "content": user_message})
+    return {
+        "mode": mode,
+        "user_message": user_message,
+        "session": session,
+        "session_id": session_id,
+        "trim_from_id": trim_from_id,
+        "version_data": version_data,
+        "messages": messages,
+    }, None
+
+
+def _save_chat_turn(turn: dict, reply: str):
+    """Persist the user/assistant pair for a completed chat turn atomically.
+    Returns the saved user Message (its id is the client's edit anchor)."""
+    session_id = turn["session_id"]
+    with transaction.atomic():
+        if turn["trim_from_id"]:
+            Message.objects.filter(
+                session_id=session_id,
+                id__gte=turn["trim_from_id"],
+            ).delete()
+            refresh_session_stats([session_id])
+            invalidate_summary(session_id, turn["trim_from_id"])
+        user_msg_obj = Message.objects.create(
+            role="user",
+            content=turn["user_message"],
+            session_id=session_id,
+            mode=turn["mode"],
+            agent_data=turn["version_data"],
+        )
+        Message.objects.create(
+            role="assistant",
+            content=reply,
+            session_id=session_id,
+            mode=turn["mode"],
+        )
+    maybe_schedule_summary(turn["session"], turn["mode"])
+    return user_msg_obj
 
-            def _call():
-                if mode == "uncensored":
-                    return _uncensored_chat_reply(messages)
-                return _mistral_chat_reply(messages)
 
-            result = _with_retries(_call, max_attempts=2, base_delay=2)
+class ChatView(APIView):
+    """
+    POST /api/chat/
+    Send a message and receive an AI reply.
+    Body: { message, session_id?, mode? }
+    Returns: { reply, session_id, title }
+    """
+    authentication_classes = [CsrfExemptSessionAuthentication]
+    permission_classes = [IsAuthenticated]
+    throttle_classes = [_LLMChatThrottle]
+
+    def post(self, request):
+        try:
+            turn, error = _prepare_chat_turn(request)
+            if error:
+                return error
+            mode = turn["mode"]
+            session = turn["session"]
+            session_id = turn["session_id"]
+            messages = turn["messages"]
+
+            result, retry_count = _with_retries(
+                lambda: _chat_reply(mode, messages),
+                max_attempts=2,
+                base_delay=2,
+                provider=_CHAT_CHAINS[mode][0][0],
+            )
 
             # On LLM error return early — no messages were written so retries
             # are completely safe (no duplicates, no orphaned rows).
@@ -1046,47 +1465,24 @@ class ChatView(APIView):
                 if result.status_code == 429:
                     result.data["session_id"] = session_id
                     result.data["title"] = session.title or _NEW_CHAT_TITLE
-                return result
+                return _with_retry_count(result, retry_count)
 
-            if not isinstance(result, tuple) or len(result) != 3:
+            if not isinstance(result, tuple) or len(result) != 4:
                 logger.error("Unexpected LLM response format: %s", type(result))
                 return Response({"error": _SERVER_ERROR}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
-            reply, in_tok, out_tok = result
-            _record_usage(
-                request.user,
-                UNCENSORED_MODEL if mode == "uncensored" else REGULAR_MODEL,
-                in_tok,
-                out_tok,
-            )
+            reply, in_tok, out_tok, model = result
+            _record_usage(request.user, model, in_tok, out_tok, mode=mode)
 
             # LLM succeeded — persist both messages atomically.
-            with transaction.atomic():
-                if trim_from_id:
-                    Message.objects.filter(
-                        session_id=session_id,
-                        id__gte=trim_from_id,
-                    ).delete()
-                user_msg_obj = Message.objects.create(
-                    role="user",
-                    content=user_message,
-                    session_id=session_id,
-                    mode=mode,
-                    agent_data=version_data,
-                )
-                Message.objects.create(
-                    role="assistant",
-                    content=reply,
-                    session_id=session_id,
-                    mode=mode,
-                )
+            user_msg_obj = _save_chat_turn(turn, reply)
 
-            return Response({
+            return _with_retry_count(Response({
                 "reply": reply,
                 "msg_id": user_msg_obj.id,
                 "session_id": session_id,
                 "title": session.title or _NEW_CHAT_TITLE,
-            })
+            }), retry_count)
 
         except Exception:
             logger.exception("ChatView unexpected error")
@@ -1096,15 +1492,177 @@ class ChatView(APIView):
             )
 
 
+class _EventStreamRenderer(BaseRenderer):
+    """
+    Lets DRF content negotiation accept `Accept: text/event-stream`.
+    Only pre-stream error Responses go through this renderer — they are
+    emitted as a single SSE `error` frame so the client's event parser
+    handles them the same way as a mid-stream failure.
+    """
+    media_type = "text/event-stream"
+    format = "sse"
+    charset = "utf-8"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+        return _sse_frame("error", data).encode("utf-8")
+
+
+class ChatStreamView(APIView):
+    """
+    POST /api/chat/stream/
+    Same contract as /api/chat/ but the reply is relayed as Server-Sent Events
+    while the provider generates it.
+    Body: { message, session_id?, mode?, trim_from_id?, version_data? }
+    Events:
+      meta  → { session_id, title }            (sent immediately)
+      delta → { text }                         (one per provider token chunk)
+      done  → { msg_id, session_id, title }    (after the turn is persisted)
+      error → { error }                        (provider failure mid-stream)
+
+    The user/assistant Message pair is written once the stream ends. If the
+    client disconnects early, whatever text was generated so far is saved so
+    the history matches what the user saw.
+    """
+    authentication_classes = [CsrfExemptSessionAuthentication]
+    permission_classes = [IsAuthenticated]
+    throttle_classes = [_LLMChatThrottle]
+    renderer_classes = [JSONRenderer, _EventStreamRenderer]
+
+    def post(self, request):
+        try:
+            turn, error = _prepare_chat_turn(request)
+            if error:
+                return error
+
+            # Opening the stream is where rate limits and upstream errors
+            # surface, so it goes through the same retry policy as ChatView.
+            opened, retry_count = _with_retries(
+                lambda: _open_chat_stream(turn["mode"], turn["messages"]),
+                max_attempts=2,
+                base_delay=2,
+                provider=_CHAT_CHAINS[turn["mode"]][0][0],
+            )
+            if isinstance(opened, Response):
+                if opened.status_code == 429:
+                    opened.data["session_id"] = turn["session_id"]
+                    opened.data["title"] = turn["session"].title or _NEW_CHAT_TITLE
+                return _with_retry_count(opened, retry_count)
+
+            stream, model = opened
+            response = StreamingHttpResponse(
+                self._events(request.user, turn, stream, model),
+                content_type="text/event-stream",
+            )
+            response["Cache-Control"] = "no-cache"
+            response["X-Accel-Buffering"] = "no"  # stop nginx/Render proxies buffering frames
+            return _with_retry_count(response, retry_count)
+
+        except Exception:
+            logger.exception("ChatStreamView unexpected error")
+            return Response(
+                {"error": _SERVER_ERROR},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+
+    @staticmethod
+    def _events(user, turn, stream, model):
+        session_id = turn["session_id"]
+        title = turn["session"].title or _NEW_CHAT_TITLE
+        parts = []
+        in_tok = out_tok = None
+        completed = False
+
+        try:
+            yield _sse_frame("meta", {"session_id": session_id, "title": title})
+            for kind, payload in _iter_chat_stream(stream):
+                if kind == "delta":
+                    parts.append(payload)
+                    yield _sse_frame("delta", {"text": payload})
+                else:
+                    in_tok, out_tok = payload
+            completed = True
+        except GeneratorExit:
+            # Client went away — stop pulling tokens we would only pay for.
+            _close_quietly(stream)
+            raise
+        except Exception:
+            logger.exception("ChatStreamView provider stream failed")
+            yield _sse_frame("error", {"error": _SERVER_ERROR})
+        finally:
+            reply = "".join(parts).strip()
+            user_msg_obj = None
+            if reply:
+                # No usage frame arrives on an aborted stream — fall back to
+                # the context builder's token estimate so the call is still accounted.
+                if in_tok is None:
+                    in_tok = sum(message_tokens(model, m) for m in turn["messages"])
+                if out_tok is None:
+                    out_tok = estimate_tokens(model, reply)
+                _record_usage(user, model, in_tok, out_tok, mode=turn["mode"])
+                try:
+                    user_msg_obj = _save_chat_turn(turn, reply)
+                except Exception:
+                    logger.exception("ChatStreamView failed to persist streamed turn")
+
+        if completed:
+            yield _sse_frame("done", {
+                "msg_id": user_msg_obj.id if user_msg_obj else None,
+                "session_id": session_id,
+                "title": title,
+            })
+
+
+def _encode_history_cursor(message) -> str:
+    raw = f"{message.timestamp.isoformat()}|{message.id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def _decode_history_cursor(cursor: str):
+    """(timestamp, id) from an opaque cursor, or None if it is malformed."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        ts, msg_id = raw.rsplit("|", 1)
+        return tz.datetime.fromisoformat(ts), int(msg_id)
+    except (ValueError, UnicodeDecodeError):
+        return None
+
+
+def _history_item(m) -> dict:
+    return {
+        "msg_id": m.id,
+        "role": m.role,
+        "content": m.content,
+        "attachments": m.attachments or [],
+        "mode": m.mode,
+        "agents": m.agent_data if m.role == "assistant" else None,
+        "version_data": m.agent_data if m.role == "user" else None,
+    }
+
+
 class ChatHistoryView(APIView):
     """
-    GET /api/history/?session_id=...&mode=...&page=...
-    Returns paginated message history for a session owned by the logged-in user.
-    Returns: { history, page, page_size, total, has_next }
+    GET /api/history/?session_id=...&mode=...
+
+    Cursor pagination (cost is independent of how deep the page is):
+      &direction=older[&cursor=...]  — page ending just before `cursor`
+                                       (no cursor: the newest page, i.e. "load older"
+                                       from the bottom of a chat)
+      &direction=newer[&cursor=...]  — page starting just after `cursor`
+                                       (no cursor: the oldest page)
+      Returns: { history, page_size, has_more, older_cursor, newer_cursor }
+      `history` is always oldest-first; `has_more` refers to the requested
+      direction. Add &include_total=1 to also get the exact `total`.
+
+    Legacy page numbers (&page=N) are still served:
+      Returns: { history, page, page_size, total, has_next }
     """
     authentication_classes = [CsrfExemptSessionAuthentication]
     permission_classes = [IsAuthenticated]
 
+    PAGE_SIZE = 50
+
     def get(self, request):
         session_id = request.query_params.get("session_id")
         mode = request.query_params.get("mode", "regular")
@@ -1127,40 +1685,66 @@ class ChatHistoryView(APIView):
                 status=status.HTTP_404_NOT_FOUND
             )
 
-        PAGE_SIZE = 50
+        # Served by the (session, mode, timestamp, id) index
+        qs = Message.objects.filter(session_id=session_id, mode=mode)
+
+        if "cursor" in request.query_params or "direction" in request.query_params:
+            return self._cursor_page(request, qs)
+        return self._numbered_page(request, qs)
+
+    def _cursor_page(self, request, qs):
+        direction = request.query_params.get("direction", "newer")
+        if direction not in ("older", "newer"):
+            return Response({"error": "direction must be 'older' or 'newer'"}, status=status.HTTP_400_BAD_REQUEST)
+
+        cursor = request.query_params.get("cursor")
+        page_qs = qs
+        if cursor:
+            position = _decode_history_cursor(cursor)
+            if position is None:
+                return Response({"error": "Invalid cursor"}, status=status.HTTP_400_BAD_REQUEST)
+            ts, msg_id = position
+            if direction == "older":
+                page_qs = qs.filter(Q(timestamp__lt=ts) | Q(timestamp=ts, id__lt=msg_id))
+            else:
+                page_qs = qs.filter(Q(timestamp__gt=ts) | Q(timestamp=ts, id__gt=msg_id))
+
+        ordering = ("-timestamp", "-id") if direction == "older" else ("timestamp", "id")
+        # One extra row tells us whether another page exists — no COUNT needed
+        rows = list(page_qs.order_by(*ordering)[:self.PAGE_SIZE + 1])
+        has_more = len(rows) > self.PAGE_SIZE
+        rows = rows[:self.PAGE_SIZE]
+        if direction == "older":
+            rows.reverse()
+
+        payload = {
+            "history": [_history_item(m) for m in rows],
+            "page_size": self.PAGE_SIZE,
+            "has_more": has_more,
+            "older_cursor": _encode_history_cursor(rows[0]) if rows else None,
+            "newer_cursor": _encode_history_cursor(rows[-1]) if rows else None,
+        }
+        if request.query_params.get("include_total") in ("1", "true"):
+            payload["total"] = qs.count()
+        return Response(payload)
+
+    def _numbered_page(self, request, qs):
         try:
             page = max(1, int(request.query_params.get("page", 1)))
         except (ValueError, TypeError):
             page = 1
 
-        qs = Message.objects.filter(
-            session_id=session_id,
-            mode=mode,
-        ).order_by("timestamp")
-
+        qs = qs.order_by("timestamp", "id")
         total = qs.count()
-        offset = (page - 1) * PAGE_SIZE
-        messages = qs[offset: offset + PAGE_SIZE]
-
-        history = [
-            {
-                "msg_id": m.id,
-                "role": m.role,
-                "content": m.content,
-                "attachments": m.attachments or [],
-                "mode": m.mode,
-                "agents": m.agent_data if m.role == "assistant" else None,
-                "version_data": m.agent_data if m.role == "user" else None,
-            }
-            for m in messages
-        ]
+        offset = (page - 1) * self.PAGE_SIZE
+        messages = qs[offset: offset + self.PAGE_SIZE]
 
         return Response({
-            "history": history,
+            "history": [_history_item(m) for m in messages],
             "page": page,
-            "page_size": PAGE_SIZE,
+            "page_size": self.PAGE_SIZE,
             "total": total,
-            "has_next": offset + PAGE_SIZE < total,
+            "has_next": offset + self.PAGE_SIZE < total,
         })
 
 
@@ -1183,29 +1767,20 @@ def list_sessions(request):
     qs = ChatSession.objects.filter(user=request.user)
     if mode:
         qs = qs.filter(mode=mode)
-
-    # Get the timestamp of the last message for each of this user's sessions only,
-    # rather than querying all messages across all users globally.
-    session_ids = qs.values_list("session_id", flat=True)
-    last_map = (
-        Message.objects
-        .filter(session_id__in=session_ids)
-        .values("session_id")
-        .annotate(last_time=Max("timestamp"))
-    )
-    last_lookup = {row["session_id"]: row["last_time"] for row in last_map}
+    # last_message_at is maintained on write (see chat/models.py), so this is
+    # one indexed scan already in sidebar order.
+    qs = qs.order_by("-last_message_at").only("session_id", "title", "mode", "last_message_at", "created_at")
 
     data = [
         {
             "session_id": s.session_id,
             "title": s.title or _NEW_CHAT_TITLE,
             "mode": s.mode,
-            "last_time": last_lookup.get(s.session_id, s.created_at),
+            "last_time": s.last_message_at,
             "created_at": s.created_at,
         }
         for s in qs
     ]
-    data.sort(key=lambda d: d["last_time"] or d["created_at"], reverse=True)
     return Response(data)
 
 
@@ -1251,9 +1826,10 @@ class OcrUploadView(APIView):
     """
     POST /api/ocr/
     Upload an image, PDF, or text file. Gemini extracts the raw text and
-    stores it as a system message in an OCR session for later Q&A.
+    stores it as a system message in an OCR session for later Q&A. A session
+    can hold several documents; questions search all of them.
     Form data: { file, session_id? }
-    Returns: { text, session_id }
+    Returns: { text, session_id, document_id }
     """
     authentication_classes = [CsrfExemptSessionAuthentication]
     permission_classes = [IsAuthenticated]
@@ -1299,40 +1875,39 @@ class OcrUploadView(APIView):
             else:
                 session_id = _ensure_session(None, "ocr", user=request.user)
 
-            # Write the uploaded file to a temp path for Gemini to read.
-            # TemporaryUploadedFile already has a path on disk; anything
-            # else (InMemoryUploadedFile) needs to be written out first.
-            if isinstance(fileobj, TemporaryUploadedFile):
-                temp_path = fileobj.temporary_file_path()
-                owned_temp = False  # Django manages this file's lifecycle
-            else:
-                with tempfile.NamedTemporaryFile(delete=False) as tmp:
-                    for chunk in fileobj.chunks():
-                        tmp.write(chunk)
-                    temp_path = tmp.name
-                owned_temp = True  # we created it, we must clean it up
-
             mime = fileobj.content_type or None
 
-            try:
-                extracted_text, in_tok, out_tok = _gemini_extract_text_from_file(temp_path, mime_type=mime)
-            finally:
-                # Always clean up our temp file, even if Gemini raises an exception
-                if owned_temp and os.path.exists(temp_path):
-                    os.unlink(temp_path)
-
-            _record_usage(request.user, GEMINI_FILE_MODEL, in_tok, out_tok)
+            # Identical bytes were extracted before — reuse the text (chat/blobs.py)
+            sha = blobs.digest(fileobj.chunks())
+            blob = blobs.get(sha)
+            if blob and blob.extracted_text and blob.extraction_model == GEMINI_FILE_MODEL:
+                extracted_text = blob.extracted_text
+                _record_usage(request.user, GEMINI_FILE_MODEL, blob.extraction_input_tokens,
+                              blob.extraction_output_tokens, cached=True, mode="ocr")
+            else:
+                extracted_text, in_tok, out_tok = self._extract(fileobj, mime)
+                _record_usage(request.user, GEMINI_FILE_MODEL, in_tok, out_tok, mode="ocr")
+                blobs.record(
+                    sha, fileobj.size,
+                    extracted_text=extracted_text,
+                    extraction_model=GEMINI_FILE_MODEL,
+                    extraction_input_tokens=in_tok,
+                    extraction_output_tokens=out_tok,
+                )
 
             # Save the extracted text as a system message for later Q&A queries
-            Message.objects.create(
+            # and index its chunks so questions only send the relevant ones.
+            document = Message.objects.create(
                 role="system",
                 content=extracted_text,
                 session_id=session_id,
                 mode="ocr",
+                attachments=[{"name": fileobj.name, "content_type": mime}],
             )
+            retrieval.index_document(document)
 
             return Response(
-                {"text": extracted_text, "session_id": session_id},
+                {"text": extracted_text, "session_id": session_id, "document_id": document.id},
                 status=status.HTTP_200_OK
             )
 
@@ -1343,14 +1918,41 @@ class OcrUploadView(APIView):
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
 
+    @staticmethod
+    def _extract(fileobj, mime):
+        """Run Gemini text extraction on an uploaded file. Returns (text, input_tokens, output_tokens)."""
+        # TemporaryUploadedFile already has a path on disk, and a small
+        # InMemoryUploadedFile can be streamed from memory as-is — neither is
+        # copied. Only an in-memory upload whose type can't be told (an IO
+        # upload needs an explicit mime type) is written out first.
+        if isinstance(fileobj, TemporaryUploadedFile):
+            return _gemini_extract_text_from_file(fileobj.temporary_file_path(), mime_type=mime)
+        mime = mime or mimetypes.guess_type(fileobj.name)[0]
+        if mime:
+            fileobj.seek(0)
+            return _gemini_extract_text_from_file(fileobj.file, mime_type=mime)
+
+        with tempfile.NamedTemporaryFile(delete=False) as tmp:
+            for chunk in fileobj.chunks():
+                tmp.write(chunk)
+            temp_path = tmp.name
+        try:
+            return _gemini_extract_text_from_file(temp_path)
+        finally:
+            # Always clean up our temp file, even if Gemini raises an exception
+            if os.path.exists(temp_path):
+                os.unlink(temp_path)
+
 
 class OcrQaView(APIView):
     """
     POST /api/ocr-qa/
-    Ask a question about the document previously uploaded in an OCR session.
+    Ask a question about the documents previously uploaded in an OCR session.
+    The most relevant chunks across all of them are retrieved and cited.
     If no document has been uploaded, Gemini answers from general knowledge.
     Body: { question, session_id? }
-    Returns: { answer, session_id, source: "document" | "general" }
+    Returns: { answer, session_id, source: "document" | "general",
+               citations: [{ ref, document_id, document, pages }] }
     """
     authentication_classes = [CsrfExemptSessionAuthentication]
     permission_classes = [IsAuthenticated]
@@ -1364,119 +1966,171 @@ class OcrQaView(APIView):
         if ban:
             return ban
         try:
-            question = (request.data.get("question") or "").strip()
-            incoming_session_id = request.data.get("session_id")
+            qa, error = _prepare_ocr_question(request)
+            if error:
+                return error
 
-            if not question:
-                return Response(
-                    {"error": "question is required"},
-                    status=status.HTTP_400_BAD_REQUEST
-                )
+            cache_key = _ocr_cache_key(qa)
+            hit = llm_cache.lookup(cache_key) if cache_key else None
+            if hit:
+                return Response(_save_ocr_answer(request.user, qa, hit, cached=True), status=status.HTTP_200_OK)
 
-            if len(question) > _MAX_MESSAGE_CHARS:
-                return Response(
-                    {"error": f"Question too long. Maximum {_MAX_MESSAGE_CHARS} characters allowed."},
-                    status=status.HTTP_400_BAD_REQUEST,
-                )
+            model = genai.GenerativeModel(GEMINI_TEXT_MODEL)
+            result = _gemini_result(model.generate_content(qa["prompt"]))
+            if cache_key:
+                llm_cache.store(cache_key, result)
+            return Response(_save_ocr_answer(request.user, qa, result), status=status.HTTP_200_OK)
 
-            if not GOOGLE_API_KEY:
-                return Response(
-                    {"error": "GOOGLE_API_KEY not configured"},
-                    status=status.HTTP_500_INTERNAL_SERVER_ERROR
-                )
+        except Exception:
+            logger.exception("OcrQaView unexpected error")
+            return Response(
+                {"error": _SERVER_ERROR},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
 
-            # Validate existing session or create a new OCR session
-            if incoming_session_id:
-                session = ChatSession.objects.filter(
-                    session_id=incoming_session_id,
-                    user=request.user,
-                    mode="ocr"
-                ).first()
 
-                if not session:
-                    return Response(
-                        {"error": _SESSION_NOT_FOUND},
-                        status=status.HTTP_404_NOT_FOUND
-                    )
+def _prepare_ocr_question(request):
+    """
+    Validate an OCR Q&A request, resolve its session and build the Gemini prompt.
+    Returns (qa, None) or (None, Response).
 
-                session_id = session.session_id
-            else:
-                session_id = _ensure_session(None, "ocr", user=request.user)
+    qa keys: question, session_id, prompt, source, citations
+    """
+    question = (request.data.get("question") or "").strip()
+    incoming_session_id = request.data.get("session_id")
 
-            # Fetch the most recently uploaded document text for this session
-            ocr_msg = (
-                Message.objects.filter(
-                    session_id=session_id,
-                    mode="ocr",
-                    role="system",
-                )
-                .order_by("-timestamp")
-                .first()
-            )
+    if not question:
+        return None, Response(
+            {"error": "question is required"},
+            status=status.HTTP_400_BAD_REQUEST
+        )
 
-            model = genai.GenerativeModel(GEMINI_TEXT_MODEL)
+    if len(question) > _MAX_MESSAGE_CHARS:
+        return None, Response(
+            {"error": f"Question too long. Maximum {_MAX_MESSAGE_CHARS} characters allowed."},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
 
-            if ocr_msg:
-                # Ground the answer strictly in the uploaded document
-                prompt = (
-                    "You are given the raw text extracted from a document.\n"
-                    "Answer the user's question using ONLY this text. "
-                    "If the answer is not in the text, say 'Not found in the document.'\n\n"
-                    f"--- DOCUMENT TEXT START ---\n{ocr_msg.content}\n"
-                    f"--- DOCUMENT TEXT END ---\n\n"
-                    f"User question: {question}\n"
-                )
-                source = "document"
-            else:
-                # No document uploaded yet — fall back to general knowledge
-                prompt = (
-                    "Answer the user's question helpfully and concisely.\n\n"
-                    f"User question: {question}\n"
-                )
-                source = "general"
-
-            resp = model.generate_content(prompt)
-            answer = (resp.text or "").strip()
-            _um = getattr(resp, 'usage_metadata', None)
-            if _um:
-                _record_usage(
-                    request.user, GEMINI_TEXT_MODEL,
-                    getattr(_um, 'prompt_token_count', 0) or 0,
-                    getattr(_um, 'candidates_token_count', 0) or 0,
-                )
+    if not GOOGLE_API_KEY:
+        return None, Response(
+            {"error": "GOOGLE_API_KEY not configured"},
+            status=status.HTTP_500_INTERNAL_SERVER_ERROR
+        )
 
-            # Save the Q&A pair to session history
-            Message.objects.create(
-                role="user",
-                content=question,
-                session_id=session_id,
-                mode="ocr",
-            )
-            Message.objects.create(
-                role="assistant",
-                content=answer,
-                session_id=session_id,
-                mode="ocr",
-            )
-            _update_title_if_empty(session_id, question)
+    # Validate existing session or create a new OCR session
+    if incoming_session_id:
+        session = ChatSession.objects.filter(
+            session_id=incoming_session_id,
+            user=request.user,
+            mode="ocr"
+        ).first()
 
-            session_obj = ChatSession.objects.filter(session_id=session_id, user=request.user).first()
-            return Response(
-                {
-                    "answer": answer,
-                    "session_id": session_id,
-                    "source": source,
-                    "title": (session_obj.title if session_obj else None) or _NEW_CHAT_TITLE,
-                },
-                status=status.HTTP_200_OK
+        if not session:
+            return None, Response(
+                {"error": _SESSION_NOT_FOUND},
+                status=status.HTTP_404_NOT_FOUND
             )
 
-        except Exception:
-            logger.exception("OcrQaView unexpected error")
-            return Response(
-                {"error": _SERVER_ERROR},
-                status=status.HTTP_500_INTERNAL_SERVER_ERROR
-            )
+        session_id = session.session_id
+    else:
+        session_id = _ensure_session(None, "ocr", user=request.user)
+
+    # Every document uploaded to this session is searched; only the chunks
+    # most relevant to the question are sent (chat/retrieval.py).
+    corpus = retrieval.session_corpus(session_id)
+    citations = []
+
+    if corpus:
+        documents = {doc.id: (doc, index) for doc, index in corpus}
+        names = {doc.id: _document_name(doc, n) for n, (doc, _) in enumerate(corpus, 1)}
+        hits = retrieval.search_corpus({doc.id: index for doc, index in corpus}, question)
+        passages = []
+        for ref, (doc_id, chunk) in enumerate(hits, 1):
+            doc, index = documents[doc_id]
+            pages = retrieval.chunk_pages(index, chunk)
+            citations.append({"ref": ref, "document_id": doc_id, "document": names[doc_id], "pages": pages})
+            source_label = names[doc_id] + (f", {_page_label(pages)}" if pages else "")
+            passages.append(f"[{ref}] ({source_label})\n{retrieval.excerpt(doc.content, index, chunk)}")
+        document_text = "\n\n".join(passages)
+        # Ground the answer strictly in the uploaded documents
+        prompt = (
+            "You are given numbered excerpts of the raw text extracted from the user's "
+            "documents, selected as the parts most relevant to the question.\n"
+            "Answer the user's question using ONLY this text, and cite the excerpts "
+            "you used by their number, e.g. [2]. "
+            "If the answer is not in the text, say 'Not found in the document.'\n\n"
+            f"--- DOCUMENT TEXT START ---\n{document_text}\n"
+            f"--- DOCUMENT TEXT END ---\n\n"
+            f"User question: {question}\n"
+        )
+        source = "document"
+    else:
+        # No document uploaded yet — fall back to general knowledge
+        prompt = (
+            "Answer the user's question helpfully and concisely.\n\n"
+            f"User question: {question}\n"
+        )
+        source = "general"
+
+    return {
+        "question": question,
+        "session_id": session_id,
+        "prompt": prompt,
+        "source": source,
+        "citations": citations,
+    }, None
+
+
+def _document_name(document, position: int) -> str:
+    """Uploaded file name of an OCR document Message, or its position in the session."""
+    for attachment in document.attachments or []:
+        if attachment.get("name"):
+            return attachment["name"]
+    return f"Document {position}"
+
+
+def _page_label(pages: list[int]) -> str:
+    return f"page {pages[0]}" if len(pages) == 1 else f"pages {pages[0]}-{pages[-1]}"
+
+
+def _ocr_cache_key(qa: dict):
+    """llm_cache key for an OCR question (the prompt embeds the retrieved excerpts), or None."""
+    if not llm_cache.is_enabled("ocr"):
+        return None
+    return llm_cache.make_key(GEMINI_TEXT_MODEL, "", qa["prompt"])
+
+
+def _save_ocr_answer(user, qa: dict, result: tuple, cached: bool = False) -> dict:
+    """Record usage, persist the Q&A pair and return the OcrQaView payload.
+    result is (answer, input_tokens, output_tokens)."""
+    session_id = qa["session_id"]
+    answer, in_tok, out_tok = result
+    if in_tok or out_tok:
+        _record_usage(user, GEMINI_TEXT_MODEL, in_tok, out_tok, cached=cached, mode="ocr")
+
+    # Save the Q&A pair to session history
+    Message.objects.create(
+        role="user",
+        content=qa["question"],
+        session_id=session_id,
+        mode="ocr",
+    )
+    Message.objects.create(
+        role="assistant",
+        content=answer,
+        session_id=session_id,
+        mode="ocr",
+    )
+    _update_title_if_empty(session_id, qa["question"])
+
+    session_obj = ChatSession.objects.filter(session_id=session_id, user=user).first()
+    return {
+        "answer": answer,
+        "session_id": session_id,
+        "source": qa["source"],
+        "citations": qa["citations"],
+        "title": (session_obj.title if session_obj else None) or _NEW_CHAT_TITLE,
+    }
 
 
 def _resolve_ocr_session(incoming_session_id, mode, user):
@@ -1496,44 +2150,149 @@ def _resolve_ocr_session(incoming_session_id, mode, user):
     return _ensure_session(None, mode, user=user)
 
 
-def _upload_single_image(image_file):
+_MAX_IMAGE_BYTES = 100 * 1024 * 1024  # 100 MB
+_SNIFF_BYTES = 64 * 1024                       # magic bytes + dimensions (JPEG SOF is usually well inside)
+_CLOUDINARY_CHUNK_BYTES = 20 * 1024 * 1024     # larger files go through upload_large in chunks this size
+
+# Shared by every image request in the process: each image needs up to two
+# uploads (Cloudinary + Gemini), so the default serves two 4-image requests at once.
+_upload_pool = concurrent.futures.ThreadPoolExecutor(
+    max_workers=int(os.getenv("IMAGE_UPLOAD_WORKERS", 16)), thread_name_prefix="image-upload",
+)
+
+
+def _validate_image(image_file) -> dict:
     """
-    Validate, estimate tokens, upload to Cloudinary, and register with Gemini.
-    Returns (attachment_dict, gemini_file_handle).
+    Check one uploaded image before anything is sent anywhere, without
+    loading it into memory: magic bytes and dimensions come from the first
+    _SNIFF_BYTES, the content hash from a chunked read.
+    Returns {file, source, mime, sha, blob, estimated_tokens}. `source` is
+    what both uploaders read from — the path of Django's temporary file for
+    uploads above FILE_UPLOAD_MAX_MEMORY_SIZE, otherwise the (small)
+    in-memory bytes.
     Raises ValueError with a user-facing message if the file is invalid or too large.
     """
-    _MAX_IMAGE_BYTES = 100 * 1024 * 1024  # 100 MB
     if image_file.size > _MAX_IMAGE_BYTES:
         raise ValueError(f"'{image_file.name}' exceeds the 100 MB size limit.")
 
-    data = image_file.read()
-    if not _is_valid_image(data):
+    image_file.seek(0)
+    header = image_file.read(_SNIFF_BYTES)
+    if not _is_valid_image(header):
         raise ValueError(
             f"'{image_file.name}' is not a valid image file (JPEG, PNG, or WebP required)."
         )
 
-    dims = _read_image_dimensions(data)
-    est_tokens = _gemini_image_tokens(*dims) if dims else _GEMINI_TOKENS_PER_TILE
-
-    upload_result = cloudinary.uploader.upload(data, folder="uploads", resource_type="image")
-    attachment = {
-        "url": upload_result["secure_url"],
-        "name": image_file.name,
-        "mime": image_file.content_type or "application/octet-stream",
-        "estimated_tokens": est_tokens,
+    # JPEGs whose SOF marker sits behind more than _SNIFF_BYTES of metadata
+    # fall back to the one-tile estimate, as for any unreadable header.
+    dims = _read_image_dimensions(header)
+    sha = blobs.digest(image_file.chunks())
+    if isinstance(image_file, TemporaryUploadedFile):
+        source = image_file.temporary_file_path()
+    else:
+        image_file.seek(0)
+        source = image_file.read()
+    return {
+        "file": image_file,
+        "source": source,
+        "mime": _image_mime(header),
+        "sha": sha,
+        "blob": blobs.get(sha),
+        "estimated_tokens": _gemini_image_tokens(*dims) if dims else _GEMINI_TOKENS_PER_TILE,
     }
 
-    ext = os.path.splitext(image_file.name)[1] or ".png"
-    with tempfile.NamedTemporaryFile(delete=False, suffix=ext) as tmp:
-        tmp.write(data)
-        tmp_path = tmp.name
-    try:
-        gemini_handle = genai.upload_file(tmp_path)
-    finally:
-        if os.path.exists(tmp_path):
-            os.unlink(tmp_path)
 
-    return attachment, gemini_handle
+def _image_mime(header: bytes) -> str:
+    """MIME type from the magic bytes already checked by _is_valid_image."""
+    if header[:3] == b'\xff\xd8\xff':
+        return "image/jpeg"
+    if header[:8] == b'\x89PNG\r\n\x1a\n':
+        return "image/png"
+    return "image/webp"
+
+
+def _upload_to_cloudinary(source, size: int) -> dict:
+    if isinstance(source, str) and size > _CLOUDINARY_CHUNK_BYTES:
+        # Sent from the temp file in chunks rather than read whole
+        return cloudinary.uploader.upload_large(
+            source, folder="uploads", resource_type="image", chunk_size=_CLOUDINARY_CHUNK_BYTES,
+        )
+    return cloudinary.uploader.upload(source, folder="uploads", resource_type="image")
+
+
+def _upload_to_gemini(source, mime: str):
+    # A path is streamed by the resumable upload; small in-memory bytes are
+    # wrapped (not copied) in a BytesIO.
+    return genai.upload_file(source if isinstance(source, str) else io.BytesIO(source), mime_type=mime)
+
+
+def _discard_uploads(futures: dict) -> None:
+    """Delete whatever a failed _upload_images call did manage to upload."""
+    for future, (kind, _) in futures.items():
+        if not future.done() or future.cancelled() or future.exception() is not None:
+            continue
+        try:
+            if kind == "cloudinary":
+                cloudinary.uploader.destroy(future.result()["public_id"], resource_type="image")
+            else:
+                genai.delete_file(future.result().name)
+        except Exception:
+            logger.warning("Could not clean up %s upload after a failed image request", kind, exc_info=True)
+
+
+def _upload_images(image_files) -> tuple:
+    """
+    Validate every image, then upload them to Cloudinary and Gemini — all
+    images and both destinations concurrently on _upload_pool, so the
+    request takes about as long as its slowest single upload.
+    Returns ([attachment_dict], [gemini_file_handle]) in input order.
+
+    Bytes seen before reuse the stored Cloudinary URL and, while it is still
+    valid, the Gemini file (chat/blobs.py). Nothing is uploaded if any image
+    is invalid (ValueError); if an upload fails, the ones that succeeded are
+    deleted again and the error is re-raised.
+    """
+    images = [_validate_image(f) for f in image_files]
+
+    futures = {}
+    for i, image in enumerate(images):
+        blob = image["blob"]
+        if not (blob and blob.cloudinary_url):
+            futures[_upload_pool.submit(_upload_to_cloudinary, image["source"], image["file"].size)] = ("cloudinary", i)
+        if blobs.gemini_part(blob) is None:
+            futures[_upload_pool.submit(_upload_to_gemini, image["source"], image["mime"])] = ("gemini", i)
+
+    done, _ = concurrent.futures.wait(futures, return_when=concurrent.futures.FIRST_EXCEPTION)
+    failed = next((f for f in done if f.exception() is not None), None)
+    if failed is not None:
+        for future in futures:
+            future.cancel()
+        concurrent.futures.wait(futures)
+        _discard_uploads(futures)
+        raise failed.exception()
+
+    uploaded = {futures[future]: future.result() for future in futures}
+    attachments, handles = [], []
+    for i, image in enumerate(images):
+        blob, learned = image["blob"], {}
+        if ("cloudinary", i) in uploaded:
+            url = learned["cloudinary_url"] = uploaded[("cloudinary", i)]["secure_url"]
+        else:
+            url = blob.cloudinary_url
+        if ("gemini", i) in uploaded:
+            handle = uploaded[("gemini", i)]
+            learned.update(blobs.gemini_fields(handle))
+        else:
+            handle = blobs.gemini_part(blob)
+        if learned:
+            blobs.record(image["sha"], image["file"].size, **learned)
+        attachments.append({
+            "url": url,
+            "name": image["file"].name,
+            "mime": image["file"].content_type or "application/octet-stream",
+            "estimated_tokens": image["estimated_tokens"],
+        })
+        handles.append(handle)
+    return attachments, handles
 
 
 class GeminiWithImagesView(APIView):
@@ -1565,60 +2324,82 @@ class GeminiWithImagesView(APIView):
             )
 
     def _handle(self, request):
-        message = (request.data.get("message") or "").strip() or "Analyze these images"
-        mode = request.data.get("mode", "ocr")
-        if mode not in _VALID_MODES:
-            return Response(
-                {"error": f"Invalid mode. Must be one of: {', '.join(_VALID_MODES)}"},
-                status=status.HTTP_400_BAD_REQUEST,
-            )
+        turn, error = _prepare_image_turn(request)
+        if error:
+            return error
 
-        session_id = _resolve_ocr_session(request.data.get("session_id"), mode, request.user)
-        if isinstance(session_id, Response):
-            return session_id
+        try:
+            saved_attachments, uploads_for_gemini = _upload_images(turn["images"])
+        except ValueError as exc:
+            return Response({"error": str(exc)}, status=status.HTTP_400_BAD_REQUEST)
 
-        images = request.FILES.getlist("images")[:4]
-        if not images:
-            return Response({"error": "No images provided"}, status=status.HTTP_400_BAD_REQUEST)
+        gemini_model = genai.GenerativeModel(GEMINI_FILE_MODEL)
+        response = gemini_model.generate_content([turn["message"], *uploads_for_gemini])
+        return Response(_save_image_turn(request.user, turn, saved_attachments, response))
 
-        saved_attachments = []
-        uploads_for_gemini = []
-        for image_file in images:
-            try:
-                attachment, gemini_handle = _upload_single_image(image_file)
-            except ValueError as exc:
-                return Response({"error": str(exc)}, status=status.HTTP_400_BAD_REQUEST)
-            saved_attachments.append(attachment)
-            uploads_for_gemini.append(gemini_handle)
 
-        gemini_model = genai.GenerativeModel(GEMINI_FILE_MODEL)
-        response = gemini_model.generate_content([message, *uploads_for_gemini])
-        answer_text = (getattr(response, "text", "") or "").strip()
-        _um = getattr(response, 'usage_metadata', None)
-        if _um:
-            _record_usage(
-                request.user, GEMINI_FILE_MODEL,
-                getattr(_um, 'prompt_token_count', 0) or 0,
-                getattr(_um, 'candidates_token_count', 0) or 0,
-            )
+def _prepare_image_turn(request):
+    """
+    Validate a GeminiWithImagesView request and resolve its session.
+    Returns (turn, None) or (None, Response).
 
-        Message.objects.create(
-            role="user", content=message,
-            session_id=session_id, mode=mode, attachments=saved_attachments,
+    turn keys: message, mode, session_id, images
+    """
+    message = (request.data.get("message") or "").strip() or "Analyze these images"
+    mode = request.data.get("mode", "ocr")
+    if mode not in _VALID_MODES:
+        return None, Response(
+            {"error": f"Invalid mode. Must be one of: {', '.join(_VALID_MODES)}"},
+            status=status.HTTP_400_BAD_REQUEST,
         )
-        Message.objects.create(
-            role="assistant", content=answer_text,
-            session_id=session_id, mode=mode, attachments=[],
+
+    session_id = _resolve_ocr_session(request.data.get("session_id"), mode, request.user)
+    if isinstance(session_id, Response):
+        return None, session_id
+
+    images = request.FILES.getlist("images")[:4]
+    if not images:
+        return None, Response({"error": "No images provided"}, status=status.HTTP_400_BAD_REQUEST)
+
+    return {
+        "message": message,
+        "mode": mode,
+        "session_id": session_id,
+        "images": images,
+    }, None
+
+
+def _save_image_turn(user, turn: dict, saved_attachments: list, response) -> dict:
+    """Record usage, persist the image turn and return the view payload."""
+    session_id = turn["session_id"]
+    message = turn["message"]
+    answer_text = (getattr(response, "text", "") or "").strip()
+    _um = getattr(response, 'usage_metadata', None)
+    if _um:
+        _record_usage(
+            user, GEMINI_FILE_MODEL,
+            getattr(_um, 'prompt_token_count', 0) or 0,
+            getattr(_um, 'candidates_token_count', 0) or 0,
+            mode=turn["mode"],
         )
-        _update_title_if_empty(session_id, message)
 
-        session_obj = ChatSession.objects.filter(session_id=session_id, user=request.user).first()
-        return Response({
-            "response": answer_text,
-            "session_id": session_id,
-            "title": (session_obj.title if session_obj else None) or _NEW_CHAT_TITLE,
-            "attachments": saved_attachments,
-        })
+    Message.objects.create(
+        role="user", content=message,
+        session_id=session_id, mode=turn["mode"], attachments=saved_attachments,
+    )
+    Message.objects.create(
+        role="assistant", content=answer_text,
+        session_id=session_id, mode=turn["mode"], attachments=[],
+    )
+    _update_title_if_empty(session_id, message)
+
+    session_obj = ChatSession.objects.filter(session_id=session_id, user=user).first()
+    return {
+        "response": answer_text,
+        "session_id": session_id,
+        "title": (session_obj.title if session_obj else None) or _NEW_CHAT_TITLE,
+        "attachments": saved_attachments,
+    }
 
 
 _CODE_SIGNALS = frozenset([
@@ -1679,11 +2460,78 @@ def _is_debuggable_input(message: str) -> bool:
     return any(sig in lower for sig in _CODE_SIGNALS)
 
 
-def _run_agents_parallel(tier: str, message: str) -> tuple:
-    """Run 3 specialist agents concurrently.
-    Returns (text_results, usage_data):
-      text_results: {agent_name: text_str}
-      usage_data:   {agent_name: (model_name, input_tokens, output_tokens)}
+def _agent_model_map(tier: str) -> dict:
+    """Model billed for each specialist agent in the given tier."""
+    if tier == "premium":
+        return {
+            "logic_analyst":         GEMINI_DEBUG_MODEL,
+            "syntax_inspector":      DEBUG_SYNTAX_MODEL,
+            "perf_security_auditor": DEBUG_PERF_MODEL,
+        }
+    return {
+        "logic_analyst":         REGULAR_MODEL,
+        "syntax_inspector":      REGULAR_MODEL,
+        "perf_security_auditor": GEMINI_FREE_MODEL,
+    }
+
+
+def _normalize_agent_result(raw, model: str) -> tuple:
+    """
+    Coerce an agent's return value into (text, input_tokens, output_tokens, model).
+    `model` is the agent's configured model, used unless the agent reports
+    the one that actually served it (failover).
+    """
+    if isinstance(raw, tuple) and len(raw) == 4:
+        return raw
+    if isinstance(raw, tuple) and len(raw) == 3:
+        return (*raw, model)
+    if isinstance(raw, str):
+        return raw, 0, 0, model
+    return str(raw), 0, 0, model
+
+
+_AGENT_PROMPTS = {
+    "logic_analyst":         _LOGIC_ANALYST_PROMPT,
+    "syntax_inspector":      _SYNTAX_INSPECTOR_PROMPT,
+    "perf_security_auditor": _PERF_SECURITY_PROMPT,
+}
+
+
+def _agent_cache_keys(tier: str, message: str) -> dict:
+    """{agent_name: llm_cache key} — empty when multi-debug caching is off."""
+    if not llm_cache.is_enabled("multi_debugger"):
+        return {}
+    return {
+        name: llm_cache.make_key(model, _AGENT_PROMPTS[name], message)
+        for name, model in _agent_model_map(tier).items()
+    }
+
+
+def _agent_cache_hits(model_map: dict, cache_keys: dict) -> tuple:
+    """(results, usage) for the agents already answered in the cache."""
+    results, usage = {}, {}
+    for name, key in cache_keys.items():
+        hit = llm_cache.lookup(key)
+        if hit:
+            text, in_tok, out_tok = hit
+            results[name] = text
+            usage[name] = (model_map[name], in_tok, out_tok, True)
+    return results, usage
+
+
+_AGENT_TIMEOUT = 120  # seconds, all three specialists together
+
+
+def _iter_agent_results(tier: str, message: str):
+    """
+    Run the 3 specialist agents concurrently and yield
+    (agent_name, text, (model_name, input_tokens, output_tokens, cached))
+    as each one finishes — cache hits first, then in completion order.
+    Agents whose exact input was analysed recently are answered from
+    chat/llm_cache.py and never submitted; the rest run on the shared
+    chat/agent_pool.py executor, which raises agent_pool.Saturated when
+    their providers are full. Agents still running after _AGENT_TIMEOUT are
+    reported as timed out and left to finish in the background.
     """
     if tier == "premium":
         jobs = {
@@ -1691,62 +2539,79 @@ def _run_agents_parallel(tier: str, message: str) -> tuple:
             "syntax_inspector":      (_agent_syntax_inspector,        message, DEBUG_SYNTAX_MODEL),
             "perf_security_auditor": (_agent_perf_security,           message),
         }
-        model_map = {
-            "logic_analyst":         GEMINI_DEBUG_MODEL,
-            "syntax_inspector":      DEBUG_SYNTAX_MODEL,
-            "perf_security_auditor": DEBUG_PERF_MODEL,
-        }
     else:
         jobs = {
             "logic_analyst":         (_agent_mistral_logic_analyst,    message),
             "syntax_inspector":      (_agent_mistral_syntax_inspector,  message),
             "perf_security_auditor": (_agent_gemini_perf_security,      message),
         }
-        model_map = {
-            "logic_analyst":         REGULAR_MODEL,
-            "syntax_inspector":      REGULAR_MODEL,
-            "perf_security_auditor": GEMINI_FREE_MODEL,
-        }
+    model_map = _agent_model_map(tier)
+    cache_keys = _agent_cache_keys(tier, message)
+    results, usage = _agent_cache_hits(model_map, cache_keys)
+    for name, text in results.items():
+        yield name, text, usage[name]
+    jobs = {name: job for name, job in jobs.items() if name not in results}
+    if not jobs:
+        return
+
+    futures = agent_pool.submit_all({
+        name: (_agent_chain(tier, name)[0][0], fn, args) for name, (fn, *args) in jobs.items()
+    })
+    try:
+        pending = set(futures.values())
+        try:
+            for future in concurrent.futures.as_completed(futures, timeout=_AGENT_TIMEOUT):
+                name = futures[future]
+                pending.discard(name)
+                try:
+                    text, in_tok, out_tok, model = _normalize_agent_result(future.result(), model_map[name])
+                except Exception as exc:
+                    yield name, f"[{name.replace('_', ' ').title()} failed: {str(exc)[:200]}]", (model_map[name], 0, 0, False)
+                    continue
+                if name in cache_keys:
+                    llm_cache.store(cache_keys[name], (text, in_tok, out_tok))
+                yield name, text, (model, in_tok, out_tok, False)
+        except concurrent.futures.TimeoutError:
+            for name in jobs:
+                if name in pending:
+                    yield name, f"[{name.replace('_', ' ').title()} timed out after {_AGENT_TIMEOUT} s]", (model_map[name], 0, 0, False)
+    finally:
+        # Jobs still queued for a provider slot are dropped; running ones
+        # finish in the pool without holding the request.
+        for future in futures:
+            future.cancel()
 
-    results = {}
-    usage = {}
-    with concurrent.futures.ThreadPoolExecutor(max_workers=3) as executor:
-        futures = {name: executor.submit(fn, *args) for name, (fn, *args) in jobs.items()}
-        for name, future in futures.items():
-            try:
-                raw = future.result(timeout=120)
-                if isinstance(raw, tuple) and len(raw) == 3:
-                    text, in_tok, out_tok = raw
-                elif isinstance(raw, str):
-                    text, in_tok, out_tok = raw, 0, 0
-                else:
-                    text, in_tok, out_tok = str(raw), 0, 0
-                results[name] = text
-                usage[name] = (model_map[name], in_tok, out_tok)
-            except concurrent.futures.TimeoutError:
-                results[name] = f"[{name.replace('_', ' ').title()} timed out after 120 s]"
-                usage[name] = (model_map[name], 0, 0)
-            except Exception as exc:
-                results[name] = f"[{name.replace('_', ' ').title()} failed: {str(exc)[:200]}]"
-                usage[name] = (model_map[name], 0, 0)
-    return results, usage
+
+def _run_agents_parallel(tier: str, message: str) -> tuple:
+    """Run 3 specialist agents concurrently (see _iter_agent_results).
+    Returns (text_results, usage_data):
+      text_results: {agent_name: text_str}
+      usage_data:   {agent_name: (model_name, input_tokens, output_tokens, cached)}
+    """
+    results, usage = {}, {}
+    for name, text, agent_usage in _iter_agent_results(tier, message):
+        results[name] = text
+        usage[name] = agent_usage
+    return {name: results[name] for name in _AGENT_PROMPTS}, usage
 
 
 _NO_CODE_TOKEN = "[NO_CODE_PROVIDED]"
 
 
-def _synthesize(tier: str, message: str, agent_results: dict) -> tuple:
+def _prepare_synthesis(agent_results: dict) -> tuple:
     """
-    Run Agent 4 (Synthesizer).
-    Returns (synthesis_text, input_tokens, output_tokens).
+    Clean agent outputs before Agent 4 (Synthesizer) runs.
+    Returns (final, early_result):
+      final:        {agent_name: text} ready to feed the synthesizer
+      early_result: (text, 0, 0) when the LLM call must be skipped, else None
 
-    Before calling the LLM this function:
+    This function:
     1. Strips the Gemini-fallback marker (_GEMINI_FALLBACK_MARKER).
     2. Strips the [NO_CODE_PROVIDED] token from agent values.
     3. Replaces agent error strings (starting with '[') with a clear note
        so the synthesizer is never fed raw error brackets.
     4. Counts how many agents produced meaningful output — if fewer than 2
-       did, skip the LLM call entirely and return a clear explanation.
+       did, the LLM call is skipped and a clear explanation is returned.
     """
     AGENT_KEYS = ("logic_analyst", "syntax_inspector", "perf_security_auditor")
 
@@ -1778,7 +2643,7 @@ def _synthesize(tier: str, message: str, agent_results: dict) -> tuple:
     # --- Step 4: guard — need at least 2 agents to synthesize ----------------
     succeeded = 3 - len(failed)
     if succeeded == 0:
-        return (
+        return final, (
             "**No code or bug description was detected.**\n\n"
             "Please paste the code you want debugged, or describe the bug in detail — "
             "including what it does, what it should do, and any error messages you see.",
@@ -1790,27 +2655,122 @@ def _synthesize(tier: str, message: str, agent_results: dict) -> tuple:
             (v for v in final.values() if not v.startswith("[")),
             "No meaningful analysis available.",
         )
-        return (
+        return final, (
             f"**Partial analysis only — {failed_str} did not respond.**\n\n"
             "Only one specialist completed the analysis. The result below may be incomplete:\n\n"
             + only_result,
             0, 0,
         )
+    return final, None
+
+
+def _synthesis_cache_key(tier: str, message: str, final: dict):
+    """llm_cache key for a synthesizer call, or None when caching is off."""
+    if not llm_cache.is_enabled("multi_debugger"):
+        return None
+    return llm_cache.make_key(
+        _synth_model_for(tier),
+        _SYNTHESIZER_PROMPT,
+        _synthesis_input(message, final["logic_analyst"], final["syntax_inspector"], final["perf_security_auditor"]),
+    )
+
+
+def _synth_model_for(tier: str) -> str:
+    return DEBUG_SYNTH_MODEL if tier == "premium" else REGULAR_MODEL
+
+
+def _synthesize(tier: str, message: str, agent_results: dict) -> tuple:
+    """
+    Run Agent 4 (Synthesizer).
+    Returns (synthesis_text, input_tokens, output_tokens, cached, model).
+    See _prepare_synthesis for how agent outputs are cleaned first.
+    """
+    final, early = _prepare_synthesis(agent_results)
+    if early:
+        return (*early, False, _synth_model_for(tier))
+
+    cache_key = _synthesis_cache_key(tier, message, final)
+    hit = llm_cache.lookup(cache_key) if cache_key else None
+    if hit:
+        return (*hit, True, _synth_model_for(tier))
 
     if tier == "premium":
-        return _agent_synthesizer(
+        result = _agent_synthesizer(
             message,
             final["logic_analyst"],
             final["syntax_inspector"],
             final["perf_security_auditor"],
             model=DEBUG_SYNTH_MODEL,
         )
-    return _agent_mistral_synthesizer(
-        message,
-        final["logic_analyst"],
-        final["syntax_inspector"],
-        final["perf_security_auditor"],
+    else:
+        result = _agent_mistral_synthesizer(
+            message,
+            final["logic_analyst"],
+            final["syntax_inspector"],
+            final["perf_security_auditor"],
+        )
+    text, in_tok, out_tok, model = result
+    if cache_key:
+        llm_cache.store(cache_key, (text, in_tok, out_tok))
+    return text, in_tok, out_tok, False, model
+
+
+def _iter_synthesis(tier: str, message: str, agent_results: dict):
+    """
+    Streaming counterpart of _synthesize: yields ("delta", text) items while
+    Agent 4 generates, then one ("synthesis", (text, input_tokens,
+    output_tokens, cached, model)). Early exits and cache hits arrive as a
+    single delta. If the synthesizer fails before its first token the raw
+    agent diagnoses are sent instead, as in the blocking path; a failure
+    mid-stream is raised to the caller.
+    """
+    final, early = _prepare_synthesis(agent_results)
+    if early:
+        yield "delta", early[0]
+        yield "synthesis", (*early, False, _synth_model_for(tier))
+        return
+
+    cache_key = _synthesis_cache_key(tier, message, final)
+    hit = llm_cache.lookup(cache_key) if cache_key else None
+    if hit:
+        yield "delta", hit[0]
+        yield "synthesis", (*hit, True, _synth_model_for(tier))
+        return
+
+    logic, syntax, perf = final["logic_analyst"], final["syntax_inspector"], final["perf_security_auditor"]
+    messages = [
+        {"role": "system", "content": _SYNTHESIZER_PROMPT},
+        {"role": "user",   "content": _synthesis_input(message, logic, syntax, perf)},
+    ]
+    chain = _agent_chain(tier, "synthesizer")
+    try:
+        stream, _, model = failover.run(
+            chain, lambda provider, m: _open_provider_stream(provider, m, messages, 4096),
+        )
+    except Exception as e:
+        logger.exception("Multi-debug Agent 4 (Synthesizer) stream failed")
+        text = _synthesis_fallback(f"[Synthesizer error: {str(e)[:300]}]", logic, syntax, perf)
+        yield "delta", text
+        yield "synthesis", (text, 0, 0, False, chain[0][1])
+        return
+
+    parts, usage = [], None
+    try:
+        for kind, payload in _iter_chat_stream(stream):
+            if kind == "delta":
+                parts.append(payload)
+                yield "delta", payload
+            else:
+                usage = payload
+    finally:
+        _close_quietly(stream)
+    text = "".join(parts).strip()
+    in_tok, out_tok = usage or (
+        sum(message_tokens(model, m) for m in messages), estimate_tokens(model, text),
     )
+    if cache_key and text:
+        llm_cache.store(cache_key, (text, in_tok, out_tok))
+    yield "synthesis", (text, in_tok, out_tok, False, model)
 
 
 class MultiDebugView(APIView):
@@ -1831,118 +2791,288 @@ class MultiDebugView(APIView):
 
     def post(self, request):
         try:
-            user_message = (request.data.get("message") or "").strip()
-            incoming_session_id = request.data.get("session_id")
-            tier = (request.data.get("tier") or "free").strip()
-            if tier not in ("free", "premium"):
-                tier = "free"
+            return _coalesced(request, "multi-debug", lambda: self._run(request))
+        except Exception:
+            logger.exception("MultiDebugView unexpected error")
+            return Response({"error": _SERVER_ERROR}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
-            ev = _check_email_verified(request.user)
-            if ev:
-                return ev
+    def _run(self, request):
+        busy = _check_agent_capacity(_debug_tier(request))
+        if busy:
+            return busy
+        turn, error = _prepare_debug_turn(request)
+        if error:
+            return error
 
-            ban = _check_feature_ban(request.user, "multi_debugger", tier)
-            if ban:
-                return ban
+        try:
+            agent_results, agent_usage = _run_agents_parallel(turn["tier"], turn["user_message"])
+        except agent_pool.Saturated as e:   # filled up since the check above
+            return _agents_saturated(e)
+        synth = _synthesize(turn["tier"], turn["user_message"], agent_results)
+        return Response(_finish_debug_turn(request.user, turn, agent_results, agent_usage, synth))
 
-            # Server-side enforcement — premium tier requires a paid account
-            if tier == "premium":
-                try:
-                    profile = request.user.profile
-                    is_premium = profile.is_premium
-                except Exception:
-                    # Profile missing (user created before Profile model existed) or DB error.
-                    # Create the profile on the fly so the user is not permanently locked out.
-                    try:
-                        from accounts.models import Profile as _Profile
-                        profile, _ = _Profile.objects.get_or_create(user=request.user)
-                        is_premium = profile.is_premium
-                    except Exception as exc:
-                        logger.error("MultiDebugView: failed to resolve profile for user=%s: %s", request.user.id, exc)
-                        return Response(
-                            {"error": "Could not verify your subscription status. Please try again."},
-                            status=status.HTTP_403_FORBIDDEN,
-                        )
-                if not is_premium:
-                    return Response(
-                        {"error": "Premium tier requires an active subscription. Please upgrade your plan."},
-                        status=status.HTTP_403_FORBIDDEN,
-                    )
 
-            if not user_message:
-                return Response({"error": "Message is required"}, status=status.HTTP_400_BAD_REQUEST)
-            if len(user_message) > _MAX_MESSAGE_CHARS:
-                return Response(
-                    {"error": f"Message too long. Maximum {_MAX_MESSAGE_CHARS} characters allowed."},
-                    status=status.HTTP_400_BAD_REQUEST,
-                )
-            if not _is_debuggable_input(user_message):
-                return Response(
-                    {"error": (
-                        "Multi-Debugger needs actual code or a bug description to analyze. "
-                        "Please paste your code or describe the bug in detail "
-                        "(e.g., what it does, what it should do, any error messages)."
-                    )},
-                    status=status.HTTP_400_BAD_REQUEST,
-                )
+class MultiDebugStreamView(APIView):
+    """
+    POST /api/multi-debug/stream/
+    Same contract as /api/multi-debug/ but relayed as Server-Sent Events, so
+    each specialist's analysis is shown as soon as it is ready instead of
+    after the slowest agent plus the synthesis.
+    Body:    { message, session_id?, tier?, trim_from_id?, version_data? }
+    Events:
+      meta  → { session_id, title, tier, msg_id }             (sent immediately)
+      agent → { name, text }                                  (one per specialist, in completion order)
+      delta → { text }                                        (synthesizer tokens)
+      done  → { agents, tier, msg_id, session_id, title }     (after the turn is persisted)
+      error → { error }                                       (failure mid-stream)
+
+    Identical concurrent requests are not coalesced here (a stream cannot be
+    replayed). If the client disconnects, usage of the agents that finished
+    is still recorded; a partial synthesis is saved as in ChatStreamView.
+    """
+    authentication_classes = [CsrfExemptSessionAuthentication]
+    permission_classes = [IsAuthenticated]
+    throttle_classes = [_LLMDebugThrottle]
+    renderer_classes = [JSONRenderer, _EventStreamRenderer]
 
-            # Resolve or create a multi_debugger session (mode-scoped)
-            # If the incoming session_id belongs to a different mode (e.g. user
-            # switched from regular chat without navigating away), silently create
-            # a fresh multi_debugger session instead of rejecting with 404.
-            if incoming_session_id:
-                session = ChatSession.objects.filter(
-                    session_id=incoming_session_id,
-                    user=request.user,
-                    mode="multi_debugger",
-                ).first()
-                if not session:
-                    session_id = _ensure_session(None, "multi_debugger", user=request.user)
-                    session = ChatSession.objects.get(session_id=session_id)
-            else:
-                session_id = _ensure_session(None, "multi_debugger", user=request.user)
-                session = ChatSession.objects.get(session_id=session_id)
+    def post(self, request):
+        try:
+            busy = _check_agent_capacity(_debug_tier(request))
+            if busy:
+                return busy
+            turn, error = _prepare_debug_turn(request)
+            if error:
+                return error
+            response = StreamingHttpResponse(self._events(request.user, turn), content_type="text/event-stream")
+            response["Cache-Control"] = "no-cache"
+            response["X-Accel-Buffering"] = "no"
+            return response
+        except Exception:
+            logger.exception("MultiDebugStreamView unexpected error")
+            return Response({"error": _SERVER_ERROR}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
-            session_id = session.session_id
-            raw_trim = request.data.get("trim_from_id")
-            try:
-                trim_from_id = int(raw_trim) if raw_trim is not None else None
-                if trim_from_id is not None and trim_from_id <= 0:
-                    trim_from_id = None
-            except (TypeError, ValueError):
-                trim_from_id = None
-
-            version_data = request.data.get("version_data") or None
-            with transaction.atomic():
-                if trim_from_id:
-                    Message.objects.filter(session_id=session_id, id__gte=trim_from_id).delete()
-                user_msg_obj = Message.objects.create(role="user", content=user_message, session_id=session_id, mode="multi_debugger", agent_data=version_data)
-            _update_title_if_empty(session_id, user_message)
-            session.refresh_from_db(fields=["title"])
-
-            agent_results, agent_usage = _run_agents_parallel(tier, user_message)
-            synthesis, synth_in_tok, synth_out_tok = _synthesize(tier, user_message, agent_results)
-
-            # Record real token usage from API responses
-            for _, (_model, _in, _out) in agent_usage.items():
-                _record_usage(request.user, _model, _in, _out)
-            _synth_model = DEBUG_SYNTH_MODEL if tier == "premium" else REGULAR_MODEL
-            _record_usage(request.user, _synth_model, synth_in_tok, synth_out_tok)
-
-            Message.objects.create(role="assistant", content=synthesis, session_id=session_id, mode="multi_debugger", agent_data={**agent_results, "_tier": tier})
-
-            return Response({
-                "reply":      synthesis,
-                "agents":     agent_results,
+    @staticmethod
+    def _events(user, turn):
+        tier = turn["tier"]
+        message = turn["user_message"]
+        agent_results, agent_usage = {}, {}
+        parts = []
+        synth = payload = synthesis = None
+        completed = False
+        agents = _iter_agent_results(tier, message)
+
+        try:
+            yield _sse_frame("meta", {
+                "session_id": turn["session_id"],
+                "title":      turn["session"].title or _NEW_CHAT_TITLE,
                 "tier":       tier,
-                "msg_id":     user_msg_obj.id,
-                "session_id": session_id,
-                "title":      session.title or _NEW_CHAT_TITLE,
+                "msg_id":     turn["user_msg_obj"].id,
             })
-
+            for name, text, usage in agents:
+                agent_results[name] = text
+                agent_usage[name] = usage
+                yield _sse_frame("agent", {"name": name, "text": text})
+
+            agent_results = {name: agent_results[name] for name in _AGENT_PROMPTS}
+            synthesis = _iter_synthesis(tier, message, agent_results)
+            for kind, value in synthesis:
+                if kind == "delta":
+                    parts.append(value)
+                    yield _sse_frame("delta", {"text": value})
+                else:
+                    synth = value
+            completed = True
+        except agent_pool.Saturated as e:
+            yield _sse_frame("error", _agents_saturated(e).data)
         except Exception:
-            logger.exception("MultiDebugView unexpected error")
-            return Response({"error": _SERVER_ERROR}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+            logger.exception("MultiDebugStreamView stream failed")
+            yield _sse_frame("error", {"error": _SERVER_ERROR})
+        finally:
+            # Closing the inner generators drops the synthesizer's upstream
+            # stream and stops waiting on agents nobody will see.
+            agents.close()
+            if synthesis is not None:
+                synthesis.close()
+            if synth is None and parts:
+                # Interrupted synthesis — no usage frame, so estimate it.
+                model = _synth_model_for(tier)
+                text = "".join(parts).strip()
+                prompt = _SYNTHESIZER_PROMPT + _synthesis_input(message, *agent_results.values())
+                synth = (text, estimate_tokens(model, prompt), estimate_tokens(model, text), False, model)
+            try:
+                if synth is not None:
+                    payload = _finish_debug_turn(user, turn, agent_results, agent_usage, synth)
+                else:
+                    _record_agent_usage(user, agent_usage)
+            except Exception:
+                logger.exception("MultiDebugStreamView failed to persist the turn")
+
+        if completed and payload is not None:
+            payload.pop("reply")
+            yield _sse_frame("done", payload)
+
+
+def _debug_tier(request) -> str:
+    tier = (request.data.get("tier") or "free").strip()
+    return tier if tier in ("free", "premium") else "free"
+
+
+def _agents_saturated(e: agent_pool.Saturated) -> Response:
+    """503 when the shared agent pool has no room for another multi-debug request."""
+    retry_after = max(1, math.ceil(e.retry_after))
+    response = Response(
+        {
+            "error": f"The Multi-Debugger is busy right now. Please try again in {retry_after} seconds.",
+            "retry_after": retry_after,
+        },
+        status=status.HTTP_503_SERVICE_UNAVAILABLE,
+    )
+    response["Retry-After"] = str(retry_after)
+    return response
+
+
+def _check_agent_capacity(tier: str):
+    """
+    Returns a 503 Response if the agent pool would refuse this tier's
+    specialists, otherwise None. Checked before the turn is persisted.
+    """
+    try:
+        agent_pool.check(_agent_chain(tier, name)[0][0] for name in _AGENT_PROMPTS)
+    except agent_pool.Saturated as e:
+        return _agents_saturated(e)
+    return None
+
+
+def _prepare_debug_turn(request):
+    """
+    Validate a multi-debug request, enforce tier access, resolve the session
+    and persist the user message (agents run after this point).
+    Returns (turn, None) or (None, Response).
+
+    turn keys: tier, user_message, session, session_id, user_msg_obj
+    """
+    user_message = (request.data.get("message") or "").strip()
+    incoming_session_id = request.data.get("session_id")
+    tier = _debug_tier(request)
+
+    ev = _check_email_verified(request.user)
+    if ev:
+        return None, ev
+
+    ban = _check_feature_ban(request.user, "multi_debugger", tier)
+    if ban:
+        return None, ban
+
+    # Server-side enforcement — premium tier requires a paid account
+    if tier == "premium":
+        flags = get_profile_flags(request.user)
+        if flags is not None:
+            is_premium = flags["is_premium"]
+        else:
+            # Profile missing (user created before Profile model existed).
+            # Create the profile on the fly so the user is not permanently locked out.
+            try:
+                profile, _ = UserProfile.objects.get_or_create(user=request.user)
+                is_premium = profile.is_premium
+            except Exception as exc:
+                logger.error("MultiDebugView: failed to resolve profile for user=%s: %s", request.user.id, exc)
+                return None, Response(
+                    {"error": "Could not verify your subscription status. Please try again."},
+                    status=status.HTTP_403_FORBIDDEN,
+                )
+        if not is_premium:
+            return None, Response(
+                {"error": "Premium tier requires an active subscription. Please upgrade your plan."},
+                status=status.HTTP_403_FORBIDDEN,
+            )
+
+    if not user_message:
+        return None, Response({"error": "Message is required"}, status=status.HTTP_400_BAD_REQUEST)
+    if len(user_message) > _MAX_MESSAGE_CHARS:
+        return None, Response(
+            {"error": f"Message too long. Maximum {_MAX_MESSAGE_CHARS} characters allowed."},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+    if not _is_debuggable_input(user_message):
+        return None, Response(
+            {"error": (
+                "Multi-Debugger needs actual code or a bug description to analyze. "
+                "Please paste your code or describe the bug in detail "
+                "(e.g., what it does, what it should do, any error messages)."
+            )},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+
+    # Resolve or create a multi_debugger session (mode-scoped)
+    # If the incoming session_id belongs to a different mode (e.g. user
+    # switched from regular chat without navigating away), silently create
+    # a fresh multi_debugger session instead of rejecting with 404.
+    if incoming_session_id:
+        session = ChatSession.objects.filter(
+            session_id=incoming_session_id,
+            user=request.user,
+            mode="multi_debugger",
+        ).first()
+        if not session:
+            session_id = _ensure_session(None, "multi_debugger", user=request.user)
+            session = ChatSession.objects.get(session_id=session_id)
+    else:
+        session_id = _ensure_session(None, "multi_debugger", user=request.user)
+        session = ChatSession.objects.get(session_id=session_id)
+
+    session_id = session.session_id
+    raw_trim = request.data.get("trim_from_id")
+    try:
+        trim_from_id = int(raw_trim) if raw_trim is not None else None
+        if trim_from_id is not None and trim_from_id <= 0:
+            trim_from_id = None
+    except (TypeError, ValueError):
+        trim_from_id = None
+
+    version_data = request.data.get("version_data") or None
+    with transaction.atomic():
+        if trim_from_id:
+            Message.objects.filter(session_id=session_id, id__gte=trim_from_id).delete()
+            refresh_session_stats([session_id])
+        user_msg_obj = Message.objects.create(role="user", content=user_message, session_id=session_id, mode="multi_debugger", agent_data=version_data)
+    _update_title_if_empty(session_id, user_message)
+    session.refresh_from_db(fields=["title"])
+
+    return {
+        "tier": tier,
+        "user_message": user_message,
+        "session": session,
+        "session_id": session_id,
+        "user_msg_obj": user_msg_obj,
+    }, None
+
+
+def _record_agent_usage(user, agent_usage: dict) -> None:
+    # Record real token usage from API responses (cache hits flagged separately)
+    for _, (_model, _in, _out, _cached) in agent_usage.items():
+        _record_usage(user, _model, _in, _out, cached=_cached, mode="multi_debugger")
+
+
+def _finish_debug_turn(user, turn: dict, agent_results: dict, agent_usage: dict, synth: tuple) -> dict:
+    """Record usage for all four agents, persist the synthesis and return the payload."""
+    tier = turn["tier"]
+    session_id = turn["session_id"]
+    synthesis, synth_in_tok, synth_out_tok, synth_cached, synth_model = synth
+
+    _record_agent_usage(user, agent_usage)
+    _record_usage(user, synth_model, synth_in_tok, synth_out_tok,
+                  cached=synth_cached, mode="multi_debugger")
+
+    Message.objects.create(role="assistant", content=synthesis, session_id=session_id, mode="multi_debugger", agent_data={**agent_results, "_tier": tier})
+
+    return {
+        "reply":      synthesis,
+        "agents":     agent_results,
+        "tier":       tier,
+        "msg_id":     turn["user_msg_obj"].id,
+        "session_id": session_id,
+        "title":      turn["session"].title or _NEW_CHAT_TITLE,
+    }
 
 
 @api_view(["PUT"])
@@ -1974,54 +3104,91 @@ def rename_session(request, session_id):
 @permission_classes([IsAuthenticated])
 def usage_stats(request):
     """
-    GET /api/usage/
-    Returns per-model token usage and estimated cost for the logged-in user.
-    Costs are estimates based on public provider pricing.
+    GET /api/usage/?from=YYYY-MM-DD&to=YYYY-MM-DD
+    Returns per-model and per-mode token usage and estimated cost for the
+    logged-in user, optionally limited to a date range (inclusive, server
+    time zone). Costs are estimates based on public provider pricing.
+    Responses served from the LLM cache are excluded from the totals and
+    reported under "cache".
+
+    Reads the DailyUsage rollups, so the cost is bounded by the number of
+    (day, model, mode) buckets in range — not by how many calls were made.
     """
-    from .models import ModelUsage
+    from .models import DailyUsage, ModelUsage, lock_users
+    from django.contrib.auth import get_user_model
     from django.db.models import Sum
-    from django.db.models.functions import Coalesce
-    from django.db.models import Value
 
     if request.method == "DELETE":
-        ModelUsage.objects.filter(user=request.user).delete()
+        # Rows still queued in the usage sink would otherwise reappear on its next flush
+        usage_sink.discard(request.user.pk)
+        with transaction.atomic():
+            lock_users(get_user_model(), [request.user.pk])
+            ModelUsage.objects.filter(user=request.user).delete()
+            DailyUsage.objects.filter(user=request.user).delete()
         return Response({"detail": "Usage statistics reset."}, status=status.HTTP_200_OK)
 
+    date_range = {}
+    for param, lookup in (("from", "day__gte"), ("to", "day__lte")):
+        raw = request.query_params.get(param)
+        if not raw:
+            continue
+        try:
+            date_range[lookup] = tz.datetime.strptime(raw, "%Y-%m-%d").date()
+        except ValueError:
+            return Response({"error": f"'{param}' must be a date (YYYY-MM-DD)"}, status=status.HTTP_400_BAD_REQUEST)
+
     rows = (
-        ModelUsage.objects
-        .filter(user=request.user)
-        .values('model_name')
-        .annotate(
-            total_input=Coalesce(Sum('input_tokens'), Value(0)),
-            total_output=Coalesce(Sum('output_tokens'), Value(0)),
-        )
-        .order_by('-total_input')
+        DailyUsage.objects
+        .filter(user=request.user, **date_range)
+        .values('model_name', 'mode', 'cached')
+        .annotate(total_input=Sum('input_tokens'), total_output=Sum('output_tokens'), calls=Sum('calls'))
     )
 
-    by_model = []
+    models_seen = {}
+    modes_seen = {}
     grand_cost = 0.0
     grand_tokens = 0
+    cache_stats = {'hits': 0, 'tokens_saved': 0, 'cost_saved_usd': 0.0}
 
     for row in rows:
-        model = row['model_name']
         inp = row['total_input']
         out = row['total_output']
-        pricing = _get_model_pricing(model)
+        pricing = _get_model_pricing(row['model_name'])
         cost = (inp * pricing['input'] + out * pricing['output']) / 1_000_000
+        if row['cached']:
+            cache_stats['hits'] += row['calls']
+            cache_stats['tokens_saved'] += inp + out
+            cache_stats['cost_saved_usd'] += cost
+            continue
         grand_cost += cost
         grand_tokens += inp + out
-        by_model.append({
-            'model': model,
-            'input_tokens': inp,
-            'output_tokens': out,
-            'total_tokens': inp + out,
-            'estimated_cost_usd': round(cost, 6),
-        })
-
+        for bucket in (
+            models_seen.setdefault(row['model_name'], {'model': row['model_name']}),
+            modes_seen.setdefault(row['mode'] or 'unknown', {'mode': row['mode'] or 'unknown'}),
+        ):
+            bucket['calls'] = bucket.get('calls', 0) + row['calls']
+            bucket['input_tokens'] = bucket.get('input_tokens', 0) + inp
+            bucket['output_tokens'] = bucket.get('output_tokens', 0) + out
+            bucket['total_tokens'] = bucket.get('total_tokens', 0) + inp + out
+            bucket['estimated_cost_usd'] = bucket.get('estimated_cost_usd', 0.0) + cost
+
+    def _finish(buckets):
+        ordered = sorted(buckets.values(), key=lambda b: b['input_tokens'], reverse=True)
+        for b in ordered:
+            b['estimated_cost_usd'] = round(b['estimated_cost_usd'], 6)
+        return ordered
+
+    cache_stats['cost_saved_usd'] = round(cache_stats['cost_saved_usd'], 6)
     return Response({
-        'by_model': by_model,
+        'by_model': _finish(models_seen),
+        'by_mode': _finish(modes_seen),
         'total_tokens': grand_tokens,
         'total_cost_usd': round(grand_cost, 6),
+        'cache': cache_stats,
+        'range': {
+            'from': request.query_params.get('from') or None,
+            'to': request.query_params.get('to') or None,
+        },
     })
 
 
@@ -2031,9 +3198,30 @@ def usage_stats(request):
 def model_info(request):
     """
     GET /api/models/
-    Returns the active model identifiers so the frontend can display them.
+    Returns the active model identifiers so the frontend can display them,
+    plus this worker's provider circuit-breaker states (chat/failover.py).
     """
     return Response({
         "mistral": REGULAR_MODEL,
         "gemini": GEMINI_FILE_MODEL,
+        "provider_health": failover.health(),
+    })
+
+
+@api_view(["GET"])
+@authentication_classes([CsrfExemptSessionAuthentication])
+@permission_classes([IsAdminUser])
+def llm_metrics(request):
+    """
+    GET /api/metrics/ (staff only)
+    This worker's LLM latency percentiles, hedging counters, provider
+    circuit-breaker states, retry budgets and multi-debug agent queues.
+    Values are per process.
+    """
+    return Response({
+        "metrics": metrics.snapshot(),
+        "hedging": hedging.stats(),
+        "providers": failover.health(),
+        "retries": retries.stats(),
+        "agents": agent_pool.stats(),
     })